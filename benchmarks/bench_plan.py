@@ -0,0 +1,59 @@
+"""Micro-benchmark for DashboardPlan compile and snapshot build cost.
+
+Run from the repository root:
+
+    python benchmarks/bench_plan.py
+
+The integration modules are loaded through benchmarks/fakes.py, so Home Assistant
+does not need to be installed. See bench_push.py for the end-to-end suite.
+"""
+import timeit
+
+from fakes import FakeState, FakeStates, load_integration_module
+
+
+def make_dashboard(entity_count, group_size=10):
+    states = FakeStates()
+    entity_ids = []
+    for i in range(entity_count):
+        entity_id = f"sensor.bench_{i}"
+        states[entity_id] = FakeState(entity_id, f"{i * 0.37:.2f}", {
+            "friendly_name": f"Bench sensor {i}",
+            "device_class": "temperature",
+            "unit_of_measurement": "°C",
+            "state_class": "measurement",
+            "icon": "mdi:thermometer",
+        })
+        entity_ids.append(entity_id)
+    groups = [
+        {"groupName": f"Group {start // group_size + 1}", "entities": [{"entity_id": e} for e in entity_ids[start:start + group_size]]}
+        for start in range(0, entity_count, group_size)
+    ]
+    config = {
+        "webhook_url": "http://localhost/webhook",
+        "groups": groups,
+        # Pills repeat group entities, as real dashboards often do
+        "pills": [{"entity_id": e} for e in entity_ids[:5]],
+        "visualizations": [],
+    }
+    return config, states
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<10} {seconds * 1e6:10.1f} µs")
+
+
+def main():
+    plan_module = load_integration_module("plan")
+    for entity_count in (10, 100, 1000):
+        config, states = make_dashboard(entity_count)
+        plan = plan_module.DashboardPlan(config)
+        number = max(10, 10000 // entity_count)
+        print(f"{entity_count} entities ({len(plan.entity_ids)} unique)")
+        bench("compile", lambda: plan_module.DashboardPlan(config), number)
+        bench("build", lambda: plan.build(states), number)
+
+
+if __name__ == "__main__":
+    main()
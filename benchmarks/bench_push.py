@@ -0,0 +1,290 @@
+"""End-to-end benchmark suite: snapshot builds, allocations, payload size and pushes.
+
+Run from the repository root:
+
+    python benchmarks/bench_push.py                          # print the results
+    python benchmarks/bench_push.py --json baseline.json     # also save them
+    python benchmarks/bench_push.py --compare baseline.json  # exit 1 on regressions
+
+Snapshots are built from a synthetic 10k entity state machine (fakes.py) the way the
+coordinator builds them, and pushed with WebhookDelivery to a local aiohttp stand-in for
+the TRMNL webhook. Timings are medians of several repeats with the garbage collector
+off. Payload sizes are exact, so any growth is reported when comparing.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from zoneinfo import ZoneInfo
+
+from fakes import (
+    FakeHass,
+    churn,
+    load_integration_module,
+    make_dashboard_config,
+    make_forecast,
+    make_states,
+)
+
+REPEAT = 7
+MIN_SAMPLE_SECONDS = 0.05  # Calls per repeat are raised until a repeat takes this long
+CHURN = 0.01  # Share of dashboard entities changed between pushes
+UTC = ZoneInfo("UTC")
+
+# How each metric is compared to a baseline: "lower" and "higher" are better within the
+# tolerance, "exact" metrics are deterministic and any increase is a regression
+LOWER, HIGHER, EXACT = "lower", "higher", "exact"
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}  # name -> (value, unit, kind)
+
+    def add(self, name, value, unit, kind):
+        self.metrics[name] = (value, unit, kind)
+        if unit == "s":
+            shown = f"{value * 1e3:12.3f} ms"
+        elif unit == "B":
+            shown = f"{value:12,d} B"
+        else:
+            shown = f"{value:12.1f} {unit}"
+        print(f"  {name:<40} {shown}")
+
+    def to_json(self):
+        return {name: {"value": value, "unit": unit, "kind": kind} for name, (value, unit, kind) in self.metrics.items()}
+
+
+def measure(func, before=None, repeat=REPEAT):
+    # Median seconds per call. `before` runs ahead of every call, outside the timing.
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            func()
+            elapsed += time.perf_counter() - started
+        return elapsed / number
+
+    number = max(1, int(MIN_SAMPLE_SECONDS / max(run(1), 1e-9)))
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = [run(number) for _ in range(repeat)]
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return statistics.median(samples)
+
+
+def allocations(func):
+    # Peak and retained traced memory of one call, and the number of blocks it leaves behind
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    base = tracemalloc.get_traced_memory()[0]
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del result
+    return peak - base, current - base, blocks
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[max(0, -(-len(ordered) * percent // 100) - 1)]
+
+
+def bench_build(modules, results, states, size):
+    plan_module, payload_module, webhook_module, icons_module = modules
+    icon_store = icons_module.IconStore(icons_module.load_icon_store())
+    forecasts = {"weather.home": make_forecast()}
+    config = make_dashboard_config(states, size)
+    plan = plan_module.DashboardPlan(config)
+    display_plan = plan_module.DashboardPlan({**config, "precompute_display": True})
+    rng = random.Random(size)
+    prefix = f"{size}."
+    print(f"Dashboard of {size} entities ({len(plan.entity_ids)} unique) from {len(states)} states")
+
+    results.add(prefix + "compile", measure(lambda: plan_module.DashboardPlan(config)), "s", LOWER)
+    results.add(prefix + "build.cold", measure(lambda: plan.build(states, forecasts, None, icon_store)), "s", LOWER)
+    record_cache = plan_module.RecordCache(UTC)
+    plan.build(states, forecasts, record_cache, icon_store)
+    results.add(prefix + "build.warm", measure(lambda: plan.build(states, forecasts, record_cache, icon_store)), "s", LOWER)
+    dashboard_ids = plan.tracked_entities
+    results.add(prefix + "build.churn", measure(
+        lambda: plan.build(states, forecasts, record_cache, icon_store),
+        before=lambda: churn(states, dashboard_ids, CHURN, rng),
+    ), "s", LOWER)
+    # The coordinator's path: a materialized snapshot reading only the entities marked dirty
+    snapshot = plan_module.MaterializedSnapshot(plan, record_cache)
+    snapshot.build(states, forecasts, icon_store)
+
+    def churn_dirty():
+        for entity_id in churn(states, dashboard_ids, CHURN, rng):
+            snapshot.mark_dirty(entity_id)
+
+    results.add(prefix + "build.incremental", measure(
+        lambda: snapshot.build(states, forecasts, icon_store), before=churn_dirty,
+    ), "s", LOWER)
+    # With change thresholds every state change goes through the change filter first
+    filtered = plan_module.MaterializedSnapshot(
+        plan_module.DashboardPlan({**config, "change_thresholds": "sensor.* | 1%"}), record_cache,
+    )
+    filtered.build(states, forecasts, icon_store)
+    changed = []
+    results.add(prefix + "mark_dirty.filtered", measure(
+        lambda: [filtered.mark_dirty(entity_id, states[entity_id]) for entity_id in changed],
+        before=lambda: changed.__setitem__(slice(None), churn(states, dashboard_ids, CHURN, rng)),
+    ), "s", LOWER)
+
+    data = plan.build(states, forecasts, record_cache, icon_store)
+    results.add(prefix + "fingerprint", measure(lambda: webhook_module.payload_fingerprint(data)), "s", LOWER)
+    results.add(prefix + "fingerprint.fragments", measure(lambda: webhook_module.payload_fingerprint(data, record_cache)), "s", LOWER)
+    for payload_format in ("standard", "compact"):
+        results.add(prefix + f"encode.{payload_format}", measure(lambda: payload_module.encode_payload(data, payload_format)), "s", LOWER)
+    # Standard encoding reusing the records' cached fragments, as deliveries do
+    results.add(prefix + "encode.fragments", measure(lambda: payload_module.encode_payload(data, "standard", record_cache)), "s", LOWER)
+
+    peak, retained, blocks = allocations(lambda: plan.build(states, forecasts, None, icon_store))
+    results.add(prefix + "alloc.cold.peak", peak, "B", LOWER)
+    results.add(prefix + "alloc.cold.blocks", blocks, "blocks", LOWER)
+    peak, retained, blocks = allocations(lambda: plan.build(states, forecasts, record_cache, icon_store))
+    results.add(prefix + "alloc.warm.peak", peak, "B", LOWER)
+    results.add(prefix + "alloc.warm.blocks", blocks, "blocks", LOWER)
+
+    # Sizes come from fresh states, so they do not depend on the churn above
+    fresh = make_states(len(states))
+    for label, variant in (("raw", plan), ("display", display_plan)):
+        snapshot = variant.build(fresh, forecasts, None, icon_store)
+        for payload_format in ("standard", "compact"):
+            size_bytes = len(payload_module.encode_payload(snapshot, payload_format))
+            results.add(prefix + f"bytes.{label}.{payload_format}", size_bytes, "B", EXACT)
+
+
+async def bench_push(modules, results, states, size, pushes, latency, payload_format):
+    from aiohttp import ClientSession, web
+    from aiohttp.test_utils import TestServer
+
+    plan_module, payload_module, webhook_module, icons_module = modules
+    forecast_module = load_integration_module("forecast")
+    received = asyncio.Event()
+    received_bytes = []
+
+    async def webhook(request):
+        received_bytes.append(len(await request.read()))
+        if latency:
+            await asyncio.sleep(latency)
+        received.set()
+        return web.json_response({"message": "ok"})
+
+    app = web.Application()
+    app.router.add_post("/webhook", webhook)
+    hass = FakeHass(states)
+    plan = plan_module.DashboardPlan(make_dashboard_config(states, size, payload_format=payload_format))
+    rng = random.Random(size)
+    prefix = f"push.{size}."
+    print(f"Pushes of a {size} entity dashboard ({payload_format}, stub latency {latency * 1e3:.0f} ms)")
+
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url("/webhook"))
+        forecast_cache = forecast_module.ForecastCache(hass)
+        record_cache = plan_module.RecordCache(UTC)
+        snapshot = plan_module.MaterializedSnapshot(plan, record_cache)
+        data = await plan.async_build(hass, forecast_cache, record_cache, snapshot=snapshot)
+
+        # Raw request round trips of one payload
+        round_trips = []
+        for _ in range(pushes):
+            started = time.perf_counter()
+            await webhook_module.send_to_trmnl_webhook(session, data, url, 0, payload_format=payload_format)
+            round_trips.append(time.perf_counter() - started)
+        results.add(prefix + "request.p50", percentile(round_trips, 50), "s", LOWER)
+        results.add(prefix + "request.p95", percentile(round_trips, 95), "s", LOWER)
+
+        # State change -> snapshot -> delivery -> received by the stub, as the coordinator does it
+        delivery = webhook_module.WebhookDelivery(hass, session, url, max_payload_bytes=0)
+        delivery.payload_format = payload_format
+        delivery.fragments = record_cache
+        end_to_end = []
+        started_all = time.perf_counter()
+        for _ in range(pushes):
+            for entity_id in churn(states, plan.tracked_entities, CHURN, rng):
+                snapshot.mark_dirty(entity_id)
+            received.clear()
+            started = time.perf_counter()
+            webhook_data = await plan.async_build(hass, forecast_cache, record_cache, snapshot=snapshot)
+            if not delivery.async_submit(webhook_data):
+                continue
+            await received.wait()
+            end_to_end.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - started_all
+        delivery.async_shutdown()
+
+    results.add(prefix + "end_to_end.p50", percentile(end_to_end, 50), "s", LOWER)
+    results.add(prefix + "end_to_end.p95", percentile(end_to_end, 95), "s", LOWER)
+    results.add(prefix + "throughput", len(end_to_end) / elapsed, "push/s", HIGHER)
+    results.add(prefix + "bytes", received_bytes[-1], "B", EXACT)
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as file:
+        baseline = json.load(file)["metrics"]
+    regressions = []
+    for name, (value, unit, kind) in results.metrics.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["value"]
+        if kind == EXACT:
+            worse = value > before
+        elif kind == HIGHER:
+            worse = value < before * (1 - tolerance)
+        else:
+            worse = value > before * (1 + tolerance)
+        if worse:
+            change = (value - before) / before * 100 if before else float("inf")
+            regressions.append(f"  {name:<40} {before:>14.6g} -> {value:<14.6g} {unit} ({change:+.1f}%)")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {baseline_path} (tolerance {tolerance:.0%}):")
+        print("\n".join(regressions))
+    else:
+        print(f"\nNo regressions against {baseline_path} (tolerance {tolerance:.0%})")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--states", type=int, default=10000, help="entities in the synthetic state machine")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="dashboard sizes to build")
+    parser.add_argument("--push-size", type=int, default=100, help="dashboard size for the push benchmark")
+    parser.add_argument("--pushes", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub webhook latency in milliseconds")
+    parser.add_argument("--format", default="standard", choices=("standard", "compact"))
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with results saved by --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed timing regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    modules = tuple(load_integration_module(name) for name in ("plan", "payload", "webhook", "icons"))
+    results = Results()
+    for size in args.sizes:
+        bench_build(modules, results, make_states(args.states), min(size, args.states))
+    asyncio.run(bench_push(modules, results, make_states(args.states), args.push_size, args.pushes, args.latency / 1000, args.format))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"args": vars(args), "python": sys.version, "metrics": results.to_json()}, file, indent=2)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Synthetic Home Assistant stand-ins shared by the benchmarks and the tests.
+
+The integration modules are loaded straight from custom_components without importing
+the package __init__, so Home Assistant does not need to be installed. States are
+generated from a fixed seed and a fixed clock, so every run builds byte-identical
+payloads and timing differences come from the code alone.
+"""
+import asyncio
+import importlib
+import random
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "custom_components" / "trmnl_dashboard"
+EPOCH = datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def load_integration_module(name):
+    if "trmnl_dashboard" not in sys.modules:
+        package = types.ModuleType("trmnl_dashboard")
+        package.__path__ = [str(PACKAGE_DIR)]
+        package.DOMAIN = "trmnl_dashboard"
+        sys.modules["trmnl_dashboard"] = package
+    return importlib.import_module(f"trmnl_dashboard.{name}")
+
+
+class FakeState:
+    __slots__ = ("entity_id", "state", "attributes", "last_changed", "last_updated")
+
+    def __init__(self, entity_id, state, attributes, changed=None):
+        changed = changed or EPOCH
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes
+        self.last_changed = changed
+        self.last_updated = changed
+
+
+class FakeStates(dict):
+    # hass.states only needs .get for snapshot builds
+    pass
+
+
+# Share of each domain in the synthetic state machine, roughly that of a large install
+DOMAIN_MIX = (
+    ("sensor", 0.55),
+    ("binary_sensor", 0.15),
+    ("light", 0.08),
+    ("switch", 0.07),
+    ("automation", 0.05),
+    ("cover", 0.03),
+    ("climate", 0.03),
+    ("media_player", 0.02),
+    ("person", 0.02),
+)
+
+SENSOR_KINDS = (
+    ("temperature", "°C", "mdi:thermometer"),
+    ("humidity", "%", None),
+    ("power", "W", None),
+    ("energy", "kWh", None),
+    ("battery", "%", None),
+    ("illuminance", "lx", None),
+    ("voltage", "V", "mdi:sine-wave"),
+    (None, None, "mdi:rocket-launch"),  # Custom icon, sent in the payload icon table
+)
+
+
+def _attributes(domain, number, rng):
+    name = f"{domain.replace('_', ' ').title()} {number}"
+    if domain == "sensor":
+        device_class, unit, icon = rng.choice(SENSOR_KINDS)
+        attributes = {"friendly_name": name, "state_class": "measurement"}
+        if device_class:
+            attributes["device_class"] = device_class
+        if unit:
+            attributes["unit_of_measurement"] = unit
+        if icon:
+            attributes["icon"] = icon
+        if rng.random() < 0.2:
+            attributes["attribution"] = "Data provided by a cloud service with a long attribution text"
+        return attributes
+    if domain == "binary_sensor":
+        return {"friendly_name": name, "device_class": rng.choice(("door", "window", "motion", "smoke", "connectivity"))}
+    if domain == "light":
+        return {
+            "friendly_name": name,
+            "supported_color_modes": ["color_temp", "hs", "xy"],
+            "color_mode": "hs",
+            "brightness": rng.randrange(256),
+            "hs_color": [rng.uniform(0, 360), rng.uniform(0, 100)],
+            "rgb_color": [rng.randrange(256) for _ in range(3)],
+            "xy_color": [rng.random(), rng.random()],
+            "min_color_temp_kelvin": 2000,
+            "max_color_temp_kelvin": 6500,
+            "effect_list": [f"Effect {i}" for i in range(20)],
+            "supported_features": 44,
+        }
+    if domain == "switch":
+        return {"friendly_name": name, "icon": "mdi:power-socket-eu"}
+    if domain == "automation":
+        return {
+            "friendly_name": name,
+            "id": f"{number:016x}",
+            "last_triggered": (EPOCH - timedelta(minutes=number)).isoformat(),
+            "mode": "single",
+            "current": 0,
+        }
+    if domain == "cover":
+        return {"friendly_name": name, "device_class": "shutter", "current_position": rng.randrange(101), "supported_features": 15}
+    if domain == "climate":
+        return {
+            "friendly_name": name,
+            "hvac_modes": ["off", "heat", "cool", "heat_cool", "auto", "dry", "fan_only"],
+            "min_temp": 7,
+            "max_temp": 35,
+            "target_temp_step": 0.5,
+            "current_temperature": round(rng.uniform(15, 25), 1),
+            "temperature": 21,
+            "hvac_action": "heating",
+            "preset_modes": ["none", "eco", "away", "boost", "comfort", "home", "sleep"],
+            "fan_modes": ["auto", "low", "medium", "high"],
+            "supported_features": 401,
+        }
+    if domain == "media_player":
+        return {
+            "friendly_name": name,
+            "source_list": [f"Source {i}" for i in range(30)],
+            "media_title": "A reasonably long track title (Remastered 2011)",
+            "volume_level": rng.random(),
+            "entity_picture": f"/api/media_player_proxy/media_player.{domain}_{number}?token={'a' * 64}",
+            "supported_features": 152461,
+        }
+    return {
+        "friendly_name": name,
+        "source": f"device_tracker.phone_{number}",
+        "user_id": f"{number:032x}",
+        "device_trackers": [f"device_tracker.phone_{number}"],
+        "latitude": 52.2297,
+        "longitude": 21.0122,
+        "gps_accuracy": 12,
+    }
+
+
+def _state(domain, rng):
+    if domain == "sensor":
+        return f"{rng.uniform(0, 1000):.2f}"
+    if domain in ("binary_sensor", "light", "switch", "automation"):
+        return rng.choice(("on", "off"))
+    if domain == "cover":
+        return rng.choice(("open", "closed"))
+    if domain == "climate":
+        return "heat"
+    if domain == "media_player":
+        return "playing"
+    return rng.choice(("home", "not_home"))
+
+
+def make_states(count, seed=0):
+    # A state machine of `count` entities with realistic attribute sizes, plus weather.home
+    rng = random.Random(seed)
+    states = FakeStates()
+    weights = [share for _, share in DOMAIN_MIX]
+    domains = [domain for domain, _ in DOMAIN_MIX]
+    for number in range(count):
+        domain = rng.choices(domains, weights)[0]
+        entity_id = f"{domain}.bench_{number}"
+        states[entity_id] = FakeState(entity_id, _state(domain, rng), _attributes(domain, number, rng))
+    states["weather.home"] = FakeState("weather.home", "partlycloudy", {
+        "friendly_name": "Home",
+        "temperature": 12.3,
+        "temperature_unit": "°C",
+        "humidity": 71,
+        "pressure": 1013.2,
+        "pressure_unit": "hPa",
+        "wind_speed": 11.2,
+        "wind_speed_unit": "km/h",
+        "wind_bearing": 220,
+        "visibility_unit": "km",
+        "precipitation_unit": "mm",
+        "attribution": "Weather forecast from met.no, delivered by the Norwegian Meteorological Institute.",
+        "supported_features": 3,
+    })
+    return states
+
+
+def make_forecast(days=7):
+    return [
+        {
+            "datetime": (EPOCH + timedelta(days=day)).isoformat(),
+            "condition": ("sunny", "rainy", "cloudy", "partlycloudy")[day % 4],
+            "temperature": 14 + day,
+            "templow": 4 + day / 2,
+            "precipitation": day * 0.4,
+            "wind_bearing": 200,
+            "wind_speed": 12.5,
+            "humidity": 70,
+        }
+        for day in range(days)
+    ]
+
+
+def make_dashboard_config(states, entity_count, group_size=10, pill_count=5, seed=0, **options):
+    # Groups of `entity_count` entities picked from the state machine, pills repeating some
+    # of them (as real dashboards often do) and the weather card
+    rng = random.Random(seed)
+    entity_ids = rng.sample(sorted(entity_id for entity_id in states if entity_id != "weather.home"), entity_count)
+    groups = [
+        {"groupName": f"Group {start // group_size + 1}", "entities": [{"entity_id": e} for e in entity_ids[start:start + group_size]]}
+        for start in range(0, entity_count, group_size)
+    ]
+    config = {
+        "webhook_url": "http://localhost/webhook",
+        "groups": groups,
+        "pills": [{"entity_id": e} for e in entity_ids[:pill_count]],
+        "visualizations": [{"entity_id": "weather.home"}],
+    }
+    config.update(options)
+    return config
+
+
+def churn(states, entity_ids, fraction, rng, now=None):
+    # Replace the State objects of a fraction of entity_ids, as a state change does, and
+    # return the changed entity IDs
+    changed = rng.sample(entity_ids, max(1, int(len(entity_ids) * fraction)))
+    for entity_id in changed:
+        old = states[entity_id]
+        if entity_id.startswith("sensor."):
+            state = f"{rng.uniform(0, 1000):.2f}"
+        else:
+            state = "unavailable" if old.state != "unavailable" else "on"
+        states[entity_id] = FakeState(entity_id, state, old.attributes, now or EPOCH)
+    return changed
+
+
+class FakeServices:
+    def __init__(self, forecast, delay=0.0):
+        self.forecast = forecast
+        self.delay = delay
+        self.calls = 0
+
+    async def async_call(self, domain, service, data, blocking=False, return_response=False):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return {entity_id: {"forecast": self.forecast} for entity_id in data["entity_id"]}
+
+
+class FakeHass:
+    # Just enough of HomeAssistant for DashboardPlan.async_build and WebhookDelivery
+    def __init__(self, states, forecast=None, forecast_delay=0.0):
+        self.states = states
+        self.data = {}
+        self.services = FakeServices(forecast if forecast is not None else make_forecast(), forecast_delay)
+        self.config = types.SimpleNamespace(time_zone="UTC")
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    def async_add_executor_job(self, target, *args):
+        return self.loop.run_in_executor(None, target, *args)
+
+    def async_create_background_task(self, target, name, eager_start=False):
+        return self.loop.create_task(target, name=name)
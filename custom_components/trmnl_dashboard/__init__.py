@@ -1,240 +1,88 @@
 import logging
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+import time
+
+from homeassistant.config_entries import ConfigEntryState
 
 DOMAIN = "trmnl_dashboard"
+PLATFORMS = ["sensor"]
 _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass, entry):
     # Register static path for frontend JS
     # Static www directory registration removed
+    started = time.perf_counter()
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN]["entry"] = entry
-
-    # Always use merged config: options override data
-    def get_merged_config():
-        merged = dict(entry.data)
-        if hasattr(entry, "options") and entry.options:
-            merged.update(entry.options)
-        return merged
 
-    # Interval update setup
-    from datetime import timedelta
-    from homeassistant.helpers.event import async_track_time_interval
-    from .webhook import send_to_trmnl_webhook
-
-    session = async_get_clientsession(hass)
-    merged_config = get_merged_config()
-    interval_seconds = merged_config.get("interval", 60)  # Default 60s
+    from .coordinator import TrmnlDashboardCoordinator
 
+    # Each entry gets its own coordinator so several TRMNL devices can be configured
+    coordinator = TrmnlDashboardCoordinator(hass, entry)
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    if coordinator.plan.byos_enabled:
+        from .byos import async_register_views
+        async_register_views(hass)
+    # Options are applied to the running coordinator instead of reloading the entry
+    entry.async_on_unload(entry.add_update_listener(async_update_entry))
+    # Telemetry sensors subscribe before the initial push so they see it
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     try:
-        async def periodic_update(now):
-            config = get_merged_config()
-            webhook_url = config.get("webhook_url")  # Always fetch latest
-            # Build dynamic data from entity states
-            groups = config.get("groups", [])
-            pills = config.get("pills", [])
-            visualizations = config.get("visualizations", [])
-            updated_groups = []
-            for group in groups:
-                updated_entities = []
-                for entity in group.get("entities", []):
-                    entity_id = entity.get("entity_id")
-                    state_obj = hass.states.get(entity_id)
-                    if state_obj:
-                        updated_entity = {
-                            "entity_id": entity_id,
-                            "state": state_obj.state,
-                            "attributes": dict(state_obj.attributes),
-                            "last_changed": str(state_obj.last_changed),
-                            "last_updated": str(state_obj.last_updated),
-                        }
-                        updated_entities.append(updated_entity)
-                    else:
-                        updated_entities.append(entity)  # fallback to config
-                updated_group = dict(group)
-                updated_group["entities"] = updated_entities
-                updated_groups.append(updated_group)
-            updated_pills = []
-            for pill in pills:
-                entity_id = pill.get("entity_id")
-                state_obj = hass.states.get(entity_id)
-                if state_obj:
-                    updated_pill = {
-                        "entity_id": entity_id,
-                        "state": state_obj.state,
-                        "attributes": dict(state_obj.attributes),
-                        "last_changed": str(state_obj.last_changed),
-                        "last_updated": str(state_obj.last_updated),
-                    }
-                    updated_pills.append(updated_pill)
-                else:
-                    updated_pills.append(pill)
-            updated_visualizations = []
-            for viz in visualizations:
-                entity_id = viz.get("entity_id")
-                state_obj = hass.states.get(entity_id)
-                if state_obj:
-                    updated_viz = {
-                        "entity_id": entity_id,
-                        "state": state_obj.state,
-                        "attributes": dict(state_obj.attributes),
-                        "last_changed": str(state_obj.last_changed),
-                        "last_updated": str(state_obj.last_updated),
-                    }
-                    # Fetch forecast for weather entities
-                    if entity_id.startswith("weather."):
-                        try:
-                            forecast_response = await hass.services.async_call(
-                                "weather",
-                                "get_forecasts",
-                                {"entity_id": entity_id, "type": "daily"},
-                                blocking=True,
-                                return_response=True
-                            )
-                            if forecast_response and entity_id in forecast_response:
-                                updated_viz["forecast"] = forecast_response[entity_id].get("forecast", [])
-                        except Exception as forecast_err:
-                            # Some weather entities may not support get_forecasts service
-                            _LOGGER.debug(f"Could not fetch forecast for {entity_id}: {forecast_err}")
-                    updated_visualizations.append(updated_viz)
-                else:
-                    updated_visualizations.append(viz)
-            webhook_data = {
-                "groups": updated_groups,
-                "pills": updated_pills,
-                "visualizations": updated_visualizations,
-                "configuration": {
-                    "layout": config.get("layout", "groups"),
-                    "pill_position": config.get("pill_position", "top"),
-                    "show_title_bar": config.get("show_title_bar", "true"),
-                    "show_entity_title": config.get("show_entity_title", "true"),
-                    "show_entity_icon": config.get("show_entity_icon", "true"),
-                    "scale": config.get("scale", "normal")
-                }
-            }
-            if webhook_url:
-                try:
-                    await send_to_trmnl_webhook(session, webhook_data, webhook_url)
-                except Exception as e:
-                    _LOGGER.error(f"TRMNL Dashboard periodic update failed: {e}")
-
-        remove_listener = async_track_time_interval(
-            hass,
-            periodic_update,
-            timedelta(seconds=interval_seconds)
-        )
-        hass.data[DOMAIN]["remove_listener"] = remove_listener
-
-        # Initial update
-        webhook_url = merged_config.get("webhook_url")  # Always fetch latest
-        if webhook_url:
-            # Build dynamic data from entity states (same as periodic_update)
-            groups = merged_config.get("groups", [])
-            pills = merged_config.get("pills", [])
-            visualizations = merged_config.get("visualizations", [])
-            updated_groups = []
-            for group in groups:
-                updated_entities = []
-                for entity in group.get("entities", []):
-                    entity_id = entity.get("entity_id")
-                    state_obj = hass.states.get(entity_id)
-                    if state_obj:
-                        updated_entity = {
-                            "entity_id": entity_id,
-                            "state": state_obj.state,
-                            "attributes": dict(state_obj.attributes),
-                            "last_changed": str(state_obj.last_changed),
-                            "last_updated": str(state_obj.last_updated),
-                        }
-                        updated_entities.append(updated_entity)
-                    else:
-                        updated_entities.append(entity)  # fallback to config
-                updated_group = dict(group)
-                updated_group["entities"] = updated_entities
-                updated_groups.append(updated_group)
-            updated_pills = []
-            for pill in pills:
-                entity_id = pill.get("entity_id")
-                state_obj = hass.states.get(entity_id)
-                if state_obj:
-                    updated_pill = {
-                        "entity_id": entity_id,
-                        "state": state_obj.state,
-                        "attributes": dict(state_obj.attributes),
-                        "last_changed": str(state_obj.last_changed),
-                        "last_updated": str(state_obj.last_updated),
-                    }
-                    updated_pills.append(updated_pill)
-                else:
-                    updated_pills.append(pill)
-            updated_visualizations = []
-            for viz in visualizations:
-                entity_id = viz.get("entity_id")
-                state_obj = hass.states.get(entity_id)
-                if state_obj:
-                    updated_viz = {
-                        "entity_id": entity_id,
-                        "state": state_obj.state,
-                        "attributes": dict(state_obj.attributes),
-                        "last_changed": str(state_obj.last_changed),
-                        "last_updated": str(state_obj.last_updated),
-                    }
-                    # Fetch forecast for weather entities
-                    if entity_id.startswith("weather."):
-                        try:
-                            forecast_response = await hass.services.async_call(
-                                "weather",
-                                "get_forecasts",
-                                {"entity_id": entity_id, "type": "daily"},
-                                blocking=True,
-                                return_response=True
-                            )
-                            if forecast_response and entity_id in forecast_response:
-                                updated_viz["forecast"] = forecast_response[entity_id].get("forecast", [])
-                        except Exception as forecast_err:
-                            # Some weather entities may not support get_forecasts service
-                            _LOGGER.debug(f"Could not fetch forecast for {entity_id}: {forecast_err}")
-                    updated_visualizations.append(updated_viz)
-                else:
-                    updated_visualizations.append(viz)
-            webhook_data = {
-                "groups": updated_groups,
-                "pills": updated_pills,
-                "visualizations": updated_visualizations,
-                "configuration": {
-                    "layout": merged_config.get("layout", "groups"),
-                    "pill_position": merged_config.get("pill_position", "top"),
-                    "show_title_bar": merged_config.get("show_title_bar", "true"),
-                    "show_entity_title": merged_config.get("show_entity_title", "true"),
-                    "show_entity_icon": merged_config.get("show_entity_icon", "true"),
-                    "scale": merged_config.get("scale", "normal")
-                }
-            }
-            try:
-                await send_to_trmnl_webhook(session, webhook_data, webhook_url)
-            except Exception as e:
-                _LOGGER.error(f"TRMNL Dashboard initial update failed: {e}")
-
+        coordinator.async_start()
     except Exception as setup_ex:
         _LOGGER.error(f"TRMNL Dashboard: Error in async_setup_entry: {setup_ex}")
 
-    async def _reload_service(call):
-        await async_reload_entry(hass, entry)
+    # Sidebar panel previewing the dashboards locally
+    from .panel_custom import async_register_panel
+    await async_register_panel(hass)
 
-    hass.services.async_register(DOMAIN, "reload", _reload_service)
+    if not hass.services.has_service(DOMAIN, "reload"):
+        async def _reload_service(call):
+            # A full reload of every loaded entry; disabled and failed entries are left to
+            # the config entry state machine
+            for config_entry in hass.config_entries.async_entries(DOMAIN):
+                if config_entry.state is ConfigEntryState.LOADED:
+                    await hass.config_entries.async_reload(config_entry.entry_id)
+
+        hass.services.async_register(DOMAIN, "reload", _reload_service)
+    # Setup only arms timers, so it stays out of the way of Home Assistant's startup; the
+    # time is listed under the integration startup times and as a diagnostic sensor
+    coordinator.timings["setup"] = time.perf_counter() - started
+    _LOGGER.debug(f"TRMNL Dashboard: entry set up in {coordinator.timings['setup'] * 1000:.1f} ms, first push deferred")
     return True
 
 async def async_unload_entry(hass, entry):
-    # Remove stored entry and unregister service
-    hass.data[DOMAIN].pop("entry", None)
-    # Remove interval listener if exists
-    remove_listener = hass.data[DOMAIN].pop("remove_listener", None)
-    if remove_listener:
-        remove_listener()
-    hass.services.async_remove(DOMAIN, "reload")
-    return True
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    # Stop timers, listeners and pending deliveries of this entry
+    coordinator = hass.data[DOMAIN].pop(entry.entry_id, None)
+    if coordinator:
+        coordinator.async_stop()
+    # Unregister the service with the last entry
+    remaining = [
+        config_entry for config_entry in hass.config_entries.async_entries(DOMAIN)
+        if config_entry.entry_id != entry.entry_id and config_entry.entry_id in hass.data[DOMAIN]
+    ]
+    if not remaining:
+        hass.services.async_remove(DOMAIN, "reload")
+        if hass.services.has_service(DOMAIN, "pair_device"):
+            hass.services.async_remove(DOMAIN, "pair_device")
+        from .panel_custom import async_remove_panel
+        async_remove_panel(hass)
+        from .entity_index import async_remove_entity_index
+        async_remove_entity_index(hass)
+    return unload_ok
 
-async def async_reload_entry(hass, entry):
-    # Unload and re-setup entry for live config reload
-    await async_unload_entry(hass, entry)
-    await async_setup_entry(hass, entry)
+async def async_update_entry(hass, entry):
+    # Update listener: entry.options (or data) changed. The running coordinator recompiles
+    # its config in place and keeps its timers, caches and push budget.
+    coordinator = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if coordinator is None:
+        return
+    coordinator.async_reconfigure()
+    if coordinator.plan.byos_enabled:
+        from .byos import async_register_views
+        async_register_views(hass)
+    # Webhook sensors are created per target, so the sensor platform is set up again when
+    # webhooks were added or removed
+    from .sensor import target_urls
+    if target_urls(coordinator.plan) != coordinator.sensor_targets:
+        await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+        await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
@@ -0,0 +1,103 @@
+import heapq
+import math
+from collections import Counter
+from datetime import datetime, timezone
+
+from .icons import record_icon
+
+# Group modes: "entities" sends every member; the others send what an 800x480 panel can
+# show of a large group. "count" counts members in an active state ("3 of 42 on"),
+# "stats" sends the min/mean/max of numeric members and "recent" the members that
+# changed last. Aggregates are rebuilt by MaterializedSnapshot only for groups with a
+# changed member. Rendered by HomeAssistantRenderer.summaryEntities in full.liquid.
+GROUP_MODES = ("entities", "count", "stats", "recent")
+DEFAULT_TOP_N = 5
+
+ACTIVE_STATES = ("on", "open", "opening", "closing", "unlocked", "home", "playing")
+UNAVAILABLE_STATES = ("unavailable", "unknown")
+OLDEST = datetime.min.replace(tzinfo=timezone.utc)
+
+def aggregate_group(group, mode, records, top_n=DEFAULT_TOP_N):
+    if mode == "recent":
+        return {**group, "entities": recent_records(records, top_n)}
+    summary = count_summary(records) if mode == "count" else stats_summary(records)
+    return {**group, "entities": [], "summary": summary}
+
+def recent_records(records, top_n):
+    # Most recently changed first; members without a state (config fallbacks) go last
+    return heapq.nlargest(top_n, records, key=lambda record: record.get("last_changed") or OLDEST)
+
+def _name(record):
+    if "display" in record:
+        return record["display"].get("n")
+    return (record.get("attributes") or {}).get("friendly_name") or record.get("entity_id")
+
+def _unit(record):
+    if "display" in record:
+        return record["display"].get("u") or None
+    return (record.get("attributes") or {}).get("unit_of_measurement")
+
+def _common_icon(records):
+    icons = Counter(record_icon(record) for record in records)
+    return icons.most_common(1)[0][0] if icons else record_icon({})
+
+def count_summary(records):
+    states = Counter(record.get("state") for record in records)
+    active = {state: states[state] for state in ACTIVE_STATES if states[state]}
+    summary = {
+        "mode": "count",
+        "active": sum(active.values()),
+        "total": len(records),
+        "unavailable": sum(states[state] for state in UNAVAILABLE_STATES) + states[None],
+        # Named after the most common active state: "on", "open", "home"...
+        "state": max(active, key=active.get) if active else "on",
+    }
+    active_records = [record for record in records if record.get("state") in ACTIVE_STATES]
+    summary["icon"] = _common_icon(active_records or records)
+    return summary
+
+def stats_summary(records):
+    values = []
+    for record in records:
+        try:
+            value = float(record.get("state"))
+        except (TypeError, ValueError):
+            continue
+        # "nan" and "inf" parse as floats but would poison min/mean/max of the whole group
+        if math.isfinite(value):
+            values.append((value, record))
+    summary = {"mode": "stats", "count": len(values), "total": len(records)}
+    if values:
+        low = min(values, key=lambda item: item[0])
+        high = max(values, key=lambda item: item[0])
+        units = Counter(_unit(record) for _, record in values)
+        summary.update({
+            "min": low[0],
+            "min_name": _name(low[1]),
+            "mean": round(sum(value for value, _ in values) / len(values), 2),
+            "max": high[0],
+            "max_name": _name(high[1]),
+            "unit": units.most_common(1)[0][0],
+        })
+    summary["icon"] = _common_icon([record for _, record in values] or records)
+    return summary
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else f"{value:.1f}"
+
+def summary_entities(summary):
+    # Display records for the cards of an aggregate group; mirrors summaryEntities in
+    # full.liquid, so the local renderer draws the same cards
+    icon = summary.get("icon")
+    if summary.get("mode") == "count":
+        state = summary.get("state") or "on"
+        display = {"n": state.capitalize(), "v": str(summary.get("active", 0)), "u": f"/ {summary.get('total', 0)}", "i": icon, "c": "summary", "f": 1}
+        return [{"display": display}]
+    if "mean" not in summary:
+        return [{"display": {"n": "No values", "v": "N/A", "u": "", "i": icon, "c": "summary", "f": 0}}]
+    unit = summary.get("unit") or ""
+    return [
+        {"display": {"n": f"Min · {summary.get('min_name')}", "t": "Min", "v": _number(summary["min"]), "u": unit, "i": icon, "c": "summary", "f": 1}},
+        {"display": {"n": "Average", "v": _number(summary["mean"]), "u": unit, "i": icon, "c": "summary", "f": 1}},
+        {"display": {"n": f"Max · {summary.get('max_name')}", "t": "Max", "v": _number(summary["max"]), "u": unit, "i": icon, "c": "summary", "f": 1}},
+    ]
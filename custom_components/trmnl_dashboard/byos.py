@@ -0,0 +1,218 @@
+import asyncio
+import hmac
+import logging
+import time
+
+from aiohttp import web
+from homeassistant.components import persistent_notification
+from homeassistant.components.http import KEY_HASS, HomeAssistantView
+
+from . import DOMAIN
+from .render import render_frame
+from .webhook import payload_fingerprint
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bring-your-own-server mode: the device is pointed at Home Assistant instead of the TRMNL
+# cloud and polls the same display/setup API locally. Frames are rendered by render.py.
+FRAME_URL = "/api/trmnl_dashboard/frame/{entry_id}/{filename}"
+# The setup, display and log endpoints sit where the firmware expects them, unauthenticated
+# inside Home Assistant's /api namespace, and a MAC address is no secret. So setup only
+# hands out the access token while pairing is open: for PAIRING_WINDOW seconds after the
+# pair_device service is called, and for one device.
+PAIRING_WINDOW = 300
+
+class FrameStore:
+    # Last frame rendered for one entry, named after the fingerprint of the snapshot it
+    # shows. Devices polling an unchanged snapshot get the cached frame and the same
+    # filename, which tells the firmware to keep the image it already has.
+
+    def __init__(self):
+        self.fingerprint = None
+        self.filename = None
+        self.body = None
+        self.content_type = None
+        self.renders = 0
+        self._lock = asyncio.Lock()
+
+    async def async_get(self, hass, webhook_data, bit_depth=1, time_zone=None):
+        fingerprint = payload_fingerprint({"frame": webhook_data, "bit_depth": bit_depth})
+        async with self._lock:
+            if fingerprint != self.fingerprint:
+                # Rendering is CPU bound, keep it off the event loop
+                body, content_type, extension = await hass.async_add_executor_job(
+                    render_frame, webhook_data, bit_depth, time_zone
+                )
+                self.fingerprint = fingerprint
+                self.filename = f"{fingerprint[:32]}.{extension}"
+                self.body = body
+                self.content_type = content_type
+                self.renders += 1
+        return self
+
+def _coordinators(hass):
+    domain_data = hass.data.get(DOMAIN, {})
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        coordinator = domain_data.get(entry.entry_id)
+        if coordinator is not None and coordinator.plan.byos_enabled:
+            yield coordinator
+
+def _find_by_token(hass, access_token):
+    if not access_token:
+        return None
+    for coordinator in _coordinators(hass):
+        if hmac.compare_digest(coordinator.plan.byos_access_token.encode(), access_token.encode()):
+            return coordinator
+    return None
+
+def normalize_mac(mac):
+    # "aa-bb-cc-dd-ee-ff" and "AA:BB:CC:DD:EE:FF" name the same device
+    return "".join(char for char in (mac or "").upper() if char.isalnum())
+
+def _find_by_device(hass, device_id):
+    # Setup hands out the access token, so it only answers a device whose MAC address is
+    # configured on an entry; entries without one are never provisioned over the network
+    device_id = normalize_mac(device_id)
+    if not device_id:
+        return None
+    for coordinator in _coordinators(hass):
+        expected = normalize_mac(coordinator.plan.byos_device_id)
+        if expected and hmac.compare_digest(expected.encode(), device_id.encode()):
+            return coordinator
+    return None
+
+def async_open_pairing(hass, entry_id):
+    hass.data.setdefault(DOMAIN, {}).setdefault("byos_pairing", {})[entry_id] = time.monotonic() + PAIRING_WINDOW
+    persistent_notification.async_dismiss(hass, _pairing_notification_id(entry_id))
+
+def _take_pairing(hass, entry_id):
+    # Closes the window of an entry, returning whether it was still open
+    deadline = hass.data.get(DOMAIN, {}).get("byos_pairing", {}).pop(entry_id, None)
+    return deadline is not None and time.monotonic() < deadline
+
+def _pairing_notification_id(entry_id):
+    return f"{DOMAIN}_pairing_{entry_id}"
+
+def _notify_pairing_request(hass, coordinator, device_id):
+    entry = coordinator.entry
+    persistent_notification.async_create(
+        hass,
+        f"A TRMNL device with MAC address {device_id} asked to pair with **{entry.title}**. If it is "
+        f"yours, call the `{DOMAIN}.pair_device` service within {PAIRING_WINDOW // 60} minutes and "
+        f"restart the device. Otherwise, someone on your network is asking for its access token.",
+        title="TRMNL Dashboard pairing request",
+        notification_id=_pairing_notification_id(entry.entry_id),
+    )
+
+def _frame_url(request, coordinator, frame):
+    path = FRAME_URL.format(entry_id=coordinator.entry.entry_id, filename=frame.filename)
+    return f"{request.url.origin()}{path}"
+
+class TrmnlSetupView(HomeAssistantView):
+    # First boot: hands the device the access token it sends with every display request
+    url = "/api/setup"
+    extra_urls = ["/api/setup/"]
+    name = "api:trmnl_dashboard:setup"
+    requires_auth = False
+
+    async def get(self, request):
+        hass = request.app[KEY_HASS]
+        device_id = request.headers.get("ID")
+        coordinator = _find_by_device(hass, device_id)
+        if coordinator is None:
+            _LOGGER.warning(
+                f"TRMNL Dashboard: setup request from unknown device {device_id}; set its MAC address "
+                f"as Local Device MAC Address to pair it"
+            )
+            return self.json({"status": 404, "message": "Device not registered"}, status_code=404)
+        if not _take_pairing(hass, coordinator.entry.entry_id):
+            _LOGGER.warning(
+                f"TRMNL Dashboard: setup request from {device_id} refused, pairing is not open; call "
+                f"{DOMAIN}.pair_device to allow it"
+            )
+            _notify_pairing_request(hass, coordinator, device_id)
+            return self.json({"status": 404, "message": "Pairing not open"}, status_code=404)
+        _LOGGER.info(f"TRMNL Dashboard: paired device {device_id} with {coordinator.entry.title}")
+        frame = await coordinator.async_render_frame()
+        return self.json({
+            "status": 200,
+            "api_key": coordinator.plan.byos_access_token,
+            "friendly_id": coordinator.entry.entry_id[:6].upper(),
+            "image_url": _frame_url(request, coordinator, frame),
+            "filename": frame.filename,
+            "message": "Welcome to TRMNL Dashboard",
+        })
+
+class TrmnlDisplayView(HomeAssistantView):
+    # Polled by the device on every wake up
+    url = "/api/display"
+    extra_urls = ["/api/display/"]
+    name = "api:trmnl_dashboard:display"
+    requires_auth = False
+
+    async def get(self, request):
+        hass = request.app[KEY_HASS]
+        coordinator = _find_by_token(hass, request.headers.get("Access-Token"))
+        if coordinator is None:
+            return self.json({"status": 500, "error": "Device not found"}, status_code=401)
+        plan = coordinator.plan
+        frame = await coordinator.async_render_frame()
+        return self.json({
+            "status": 0,
+            "image_url": _frame_url(request, coordinator, frame),
+            "filename": frame.filename,
+            "refresh_rate": plan.device_refresh or plan.interval,
+            "reset_firmware": False,
+            "update_firmware": False,
+            "firmware_url": None,
+            "special_function": "sleep",
+        })
+
+class TrmnlLogView(HomeAssistantView):
+    # Firmware error reports; accepted so the device does not retry them
+    url = "/api/log"
+    name = "api:trmnl_dashboard:log"
+    requires_auth = False
+
+    async def post(self, request):
+        hass = request.app[KEY_HASS]
+        if _find_by_token(hass, request.headers.get("Access-Token")) is None:
+            return web.Response(status=401)
+        _LOGGER.debug(f"TRMNL Dashboard: device log {await request.text()}")
+        return web.Response(status=204)
+
+class TrmnlFrameView(HomeAssistantView):
+    # Frame URLs carry the snapshot fingerprint, so only the current frame is served
+    url = FRAME_URL
+    name = "api:trmnl_dashboard:frame"
+    requires_auth = False
+
+    async def get(self, request, entry_id, filename):
+        hass = request.app[KEY_HASS]
+        coordinator = hass.data.get(DOMAIN, {}).get(entry_id)
+        frames = getattr(coordinator, "frames", None)
+        if frames is None or frames.filename != filename:
+            return web.Response(status=404)
+        return web.Response(
+            body=frames.body,
+            content_type=frames.content_type,
+            headers={"Cache-Control": "public, max-age=31536000, immutable"},
+        )
+
+def async_register_views(hass):
+    # Views cannot be removed again, so they are registered once and look entries up per request
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if not hass.services.has_service(DOMAIN, "pair_device"):
+        async def _pair_device_service(call):
+            # Opens pairing on the given entry, or on every entry with a local device
+            entry_id = call.data.get("entry_id")
+            for coordinator in _coordinators(hass):
+                if entry_id in (None, coordinator.entry.entry_id):
+                    async_open_pairing(hass, coordinator.entry.entry_id)
+
+        hass.services.async_register(DOMAIN, "pair_device", _pair_device_service)
+    if domain_data.get("byos_views"):
+        return
+    domain_data["byos_views"] = True
+    for view in (TrmnlSetupView(), TrmnlDisplayView(), TrmnlLogView(), TrmnlFrameView()):
+        hass.http.register_view(view)
@@ -1,520 +1,296 @@
+import gzip
 import voluptuous as vol
 import logging
 from homeassistant import config_entries
 from homeassistant.core import callback
 from . import DOMAIN
-from .webhook import send_to_trmnl_webhook
+from .forecast import DEFAULT_FORECAST_TTL, async_get_forecast_cache
+from .history import DEFAULT_HISTORY_HOURS
+from .aggregate import DEFAULT_TOP_N, GROUP_MODES
+from .entity_index import async_get_entity_index, parse_selectors
+from .payload import DEFAULT_MAX_PAYLOAD_BYTES, PAYLOAD_FORMATS, encode_payload, enforce_payload_budget
+from .plan import DashboardPlan, async_get_record_cache
+from .scheduler import DEFAULT_RATE_LIMIT, estimate_push_interval
+from .webhook import GZIP_LEVEL
 from homeassistant.helpers.selector import selector
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 _LOGGER = logging.getLogger(__name__)
 
-class TrmnlWebhookConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
-    async def async_step_user(self, user_input=None):
-        prev_data = {}
-        if hasattr(self, "config_entry") and self.config_entry:
-            prev_data = {**self.config_entry.data, **self.config_entry.options}
-
-        # Always build groups from user_input if present, else from prev_data
-        if user_input is not None:
-            # Determine current number of groups from user_input
-            i = 0
-            while f"group_{i}_name" in user_input or f"group_{i}_entities" in user_input:
-                i += 1
-            num_groups = i if i > 0 else 1
-            add_group = user_input.get("add_another_group", False)
-            # Build groups from user_input (just entity IDs)
-            new_groups = []
-            for idx in range(num_groups):
-                group_name = user_input.get(f"group_{idx}_name", f"Group {idx+1}")
-                group_entities = user_input.get(f"group_{idx}_entities", [])
-                group_dict = {
-                    "entities": [{"entity_id": ent} for ent in group_entities if ent]
-                }
-                if group_name:
-                    group_dict["groupName"] = group_name
-                new_groups.append(group_dict)
-            if add_group:
-                new_groups.append({"groupName": f"Group {len(new_groups)+1}", "entities": []})
-                num_groups = len(new_groups)
-                schema = self._get_dynamic_schema(prev_data, user_input, num_groups)
-                # Build description_placeholders for dynamic group labels
-                placeholders = {}
-                for i in range(num_groups):
-                    placeholders[f"group_{i}_name"] = {"number": str(i + 1)}
-                    placeholders[f"group_{i}_entities"] = {"number": str(i + 1)}
-                return self.async_show_form(
-                    step_id="user",
-                    data_schema=schema,
-                    description_placeholders=placeholders,
-                )
-            webhook_url = user_input.get("webhook_url") or prev_data.get("webhook_url", "")
-            pill_entities = user_input.get("pill_entities", [])
-            pills_obj = [{"entity_id": ent} for ent in pill_entities if ent]
-            visualization_entities = user_input.get("visualization_entities", [])
-            visualizations_obj = [{"entity_id": ent} for ent in visualization_entities if ent]
-            data = {
-                "webhook_url": webhook_url,
-                "groups": new_groups,
-                "pills": pills_obj,
-                "visualizations": visualizations_obj,
-                "layout": user_input.get("layout", "groups"),
-                "pill_position": user_input.get("pill_position", "top"),
-                "show_title_bar": "true" if user_input.get("show_title_bar", True) else "false",
-                "show_entity_title": "true" if user_input.get("show_entity_title", True) else "false",
-                "show_entity_icon": "true" if user_input.get("show_entity_icon", True) else "false",
-                "scale": user_input.get("scale", "normal")
-            }
-            # Send webhook on config creation
-            if data.get("webhook_url"):
-                hass = self.hass
-                session = async_get_clientsession(hass)
-                # Expand entities like in __init__.py
-                groups = data.get("groups", [])
-                pills = data.get("pills", [])
-                updated_groups = []
-                for group in groups:
-                    updated_entities = []
-                    for entity in group.get("entities", []):
-                        entity_id = entity.get("entity_id")
-                        state_obj = hass.states.get(entity_id)
-                        if state_obj:
-                            updated_entity = {
-                                "entity_id": entity_id,
-                                "state": state_obj.state,
-                                "attributes": dict(state_obj.attributes),
-                                "last_changed": str(state_obj.last_changed),
-                                "last_updated": str(state_obj.last_updated),
-                            }
-                            updated_entities.append(updated_entity)
-                        else:
-                            updated_entities.append(entity)
-                    updated_group = dict(group)
-                    updated_group["entities"] = updated_entities
-                    updated_groups.append(updated_group)
-                updated_pills = []
-                for pill in pills:
-                    entity_id = pill.get("entity_id")
-                    state_obj = hass.states.get(entity_id)
-                    if state_obj:
-                        updated_pill = {
-                            "entity_id": entity_id,
-                            "state": state_obj.state,
-                            "attributes": dict(state_obj.attributes),
-                            "last_changed": str(state_obj.last_changed),
-                            "last_updated": str(state_obj.last_updated),
-                        }
-                        updated_pills.append(updated_pill)
-                    else:
-                        updated_pills.append(pill)
-                visualization_entities = data.get("visualizations", [])
-                updated_visualizations = []
-                for viz in visualization_entities:
-                    entity_id = viz.get("entity_id")
-                    state_obj = hass.states.get(entity_id)
-                    if state_obj:
-                        updated_viz = {
-                            "entity_id": entity_id,
-                            "state": state_obj.state,
-                            "attributes": dict(state_obj.attributes),
-                            "last_changed": str(state_obj.last_changed),
-                            "last_updated": str(state_obj.last_updated),
-                        }
-                        # Fetch forecast for weather entities
-                        if entity_id.startswith("weather."):
-                            try:
-                                forecast_response = await hass.services.async_call(
-                                    "weather",
-                                    "get_forecasts",
-                                    {"entity_id": entity_id, "type": "daily"},
-                                    blocking=True,
-                                    return_response=True
-                                )
-                                if forecast_response and entity_id in forecast_response:
-                                    updated_viz["forecast"] = forecast_response[entity_id].get("forecast", [])
-                            except Exception as forecast_err:
-                                # Some weather entities may not support get_forecasts service
-                                _LOGGER.debug(f"Could not fetch forecast for {entity_id}: {forecast_err}")
-                        updated_visualizations.append(updated_viz)
-                    else:
-                        updated_visualizations.append(viz)
-                webhook_data = {
-                    "groups": updated_groups,
-                    "pills": updated_pills,
-                    "visualizations": updated_visualizations,
-                    "configuration": {
-                        "layout": data.get("layout", "groups"),
-                        "pill_position": data.get("pill_position", "top"),
-                        "show_title_bar": data.get("show_title_bar", "true"),
-                        "show_entity_title": data.get("show_entity_title", "true"),
-                        "show_entity_icon": data.get("show_entity_icon", "true"),
-                        "scale": data.get("scale", "normal")
-                    }
-                }
-                try:
-                    await send_to_trmnl_webhook(session, webhook_data, data["webhook_url"])
-                except Exception as e:
-                    import logging
-                    logging.getLogger(__name__).error(f"TRMNL Dashboard config_flow initial webhook failed: {e}")
-            return self.async_create_entry(title="TRMNL Dashboard", data=data)
-        else:
-            groups = prev_data.get("groups", [])
-            num_groups = len(groups) if groups else 1
-            schema = self._get_dynamic_schema(prev_data, user_input, num_groups)
-            
-            # Build description_placeholders for dynamic group labels
-            placeholders = {}
-            for i in range(num_groups):
-                placeholders[f"group_{i}_name"] = {"number": str(i + 1)}
-                placeholders[f"group_{i}_entities"] = {"number": str(i + 1)}
-            
-            return self.async_show_form(
-                step_id="user",
-                data_schema=schema,
-                description_placeholders=placeholders,
-            )
-
-    def _get_dynamic_schema(self, prev_data=None, user_input=None, num_groups=1):
-        prev_data = prev_data or {}
-        webhook_url_default = ""
-        if user_input and "webhook_url" in user_input:
-            webhook_url_default = user_input["webhook_url"]
-        else:
-            webhook_url_default = prev_data.get("webhook_url", "")
-        schema_dict = {
-            vol.Required("webhook_url", default=webhook_url_default): str,
+# Figures shown by the preview step, see async_preview
+PREVIEW_PLACEHOLDERS = (
+    "entities", "groups", "pages", "payload_bytes", "max_payload_bytes", "payload_format",
+    "compressed_bytes", "dropped", "push_interval", "pushes_per_hour",
+)
+
+async def async_preview(hass, data):
+    # Dry run of a config for the preview step: the snapshot is built and encoded as a push
+    # would be, and nothing is sent. Returns the description placeholders of the step.
+    plan = DashboardPlan(data, async_get_entity_index(hass))
+    webhook_data = await plan.async_build(hass, async_get_forecast_cache(hass), async_get_record_cache(hass))
+    # With page webhooks every page is checked; the largest one is reported
+    pages = [target.filter(webhook_data) for target in plan.shards.targets] if plan.shards else [webhook_data]
+    body = b""
+    dropped = 0
+    for page in pages:
+        page_body = encode_payload(page, plan.payload_format)
+        if plan.max_payload_bytes and len(page_body) > plan.max_payload_bytes:
+            _body, page_dropped = enforce_payload_budget(page, plan.max_payload_bytes, plan.payload_format)
+            dropped += page_dropped
+        if len(page_body) > len(body):
+            body = page_body
+    push_interval = estimate_push_interval(plan.update_mode, plan.interval, plan.debounce, plan.rate_limit, plan.device_refresh)
+    return {
+        "entities": str(len(plan.tracked_entities)),
+        "groups": str(len(plan.groups)),
+        "pages": str(len(pages)),
+        "payload_bytes": str(len(body)),
+        "max_payload_bytes": str(plan.max_payload_bytes),
+        "payload_format": plan.payload_format,
+        "compressed_bytes": str(len(gzip.compress(body, GZIP_LEVEL))) if plan.compress_payload else "-",
+        "dropped": str(dropped),
+        "push_interval": str(round(push_interval)),
+        "pushes_per_hour": f"{3600 / push_interval:.0f}" if push_interval else "-",
+    }
+
+async def async_show_preview(flow, data):
+    try:
+        placeholders = await async_preview(flow.hass, data)
+        errors = {}
+    except Exception as e:
+        _LOGGER.error(f"TRMNL Dashboard config_flow preview failed: {e}")
+        placeholders = {key: "?" for key in PREVIEW_PLACEHOLDERS}
+        errors = {"base": "preview_failed"}
+    return flow.async_show_form(
+        step_id="preview",
+        data_schema=vol.Schema({vol.Optional("edit", default=False): bool}),
+        description_placeholders=placeholders,
+        errors=errors,
+    )
+
+def _true_false(value):
+    # Layout flags are stored as the strings the template compares against
+    return "true" if value else "false"
+
+def _number(minimum, maximum, unit=None):
+    config = {"min": minimum, "max": maximum, "mode": "box"}
+    if unit:
+        config["unit_of_measurement"] = unit
+    return selector({"number": config})
+
+def _select(options, translation_key):
+    return selector({"select": {"options": list(options), "translation_key": translation_key}})
+
+MULTILINE = selector({"text": {"multiline": True}})
+
+# Fields of the dashboard form, key -> (default, field, conversion of the submitted value)
+DASHBOARD_OPTIONS = {
+    "layout": ("groups", _select(["groups", "list"], "layout"), str),
+    "pill_position": ("top", _select(["top", "bottom", "left", "right"], "pill_position"), str),
+    "show_title_bar": (True, bool, _true_false),
+    "show_entity_title": (True, bool, _true_false),
+    "show_entity_icon": (True, bool, _true_false),
+    "scale": ("normal", _select(["small", "normal", "big"], "scale"), str),
+    "update_mode": ("interval", _select(["interval", "state_change"], "update_mode"), str),
+    "interval": (60, _number(10, 86400, "s"), int),
+}
+
+# Transport and tuning options, on a step of their own so the dashboard form stays about
+# the dashboard
+ADVANCED_OPTIONS = {
+    # Webhooks of further pages of this dashboard, one URL per line
+    "page_webhooks": ("", MULTILINE, str),
+    # Extra TRMNL devices, one "<webhook url> | <group>, <group>" per line
+    "additional_targets": ("", MULTILINE, str),
+    "debounce": (5, _number(0, 600, "s"), int),
+    # Change detection: skip changes that do not show, or stay below a threshold
+    "visible_changes_only": (False, bool, bool),
+    "change_thresholds": ("", MULTILINE, str),
+    "max_payload_bytes": (DEFAULT_MAX_PAYLOAD_BYTES, _number(1024, 1048576, "B"), int),
+    "payload_format": ("standard", _select(PAYLOAD_FORMATS, "payload_format"), str),
+    "precompute_display": (False, bool, bool),
+    "compress_payload": (False, bool, bool),
+    "forecast_ttl": (DEFAULT_FORECAST_TTL, _number(60, 86400, "s"), int),
+    "history_hours": (DEFAULT_HISTORY_HOURS, _number(1, 720, "h"), int),
+    "rate_limit": (DEFAULT_RATE_LIMIT, _number(1, 3600), int),
+    "device_refresh": (0, _number(0, 86400, "s"), int),
+    # Local BYOS endpoint: devices pointed at Home Assistant get frames rendered here
+    "byos_access_token": ("", str, str.strip),
+    "byos_device_id": ("", str, str.strip),
+    "byos_bit_depth": ("1", _select(["1", "2"], "byos_bit_depth"), int),
+}
+
+def _form_default(default, value):
+    # Stored values shown in their form field's type: "true"/"false" flags as booleans,
+    # the bit depth as its select option
+    if isinstance(default, bool) and isinstance(value, str):
+        return value == "true"
+    if isinstance(default, str) and not isinstance(value, str):
+        return str(value)
+    return value
+
+def _option_fields(options, values):
+    return {
+        vol.Optional(key, default=_form_default(default, values.get(key, default))): field
+        for key, (default, field, _convert) in options.items()
+    }
+
+def _entity_ids(records):
+    return [record.get("entity_id") for record in records or []]
+
+def dashboard_schema(values, num_groups, removable):
+    # The dashboard form of both flows, filled in from a config (the entry, or the draft)
+    schema = {vol.Optional("webhook_url", default=values.get("webhook_url", "")): str}
+    schema.update(_option_fields(DASHBOARD_OPTIONS, values))
+    schema[vol.Optional("pill_entities", default=_entity_ids(values.get("pills")))] = selector({"entity": {"multiple": True}})
+    schema[vol.Optional("visualization_entities", default=_entity_ids(values.get("visualizations")))] = selector(
+        {"entity": {"multiple": True, "domain": ["weather", "sensor"]}}
+    )
+    groups = values.get("groups") or []
+    for i in range(num_groups):
+        group = groups[i] if i < len(groups) else {}
+        schema[vol.Optional(f"group_{i}_name", default=group.get("groupName", f"Group {i+1}"))] = str
+        schema[vol.Optional(f"group_{i}_entities", default=_entity_ids(group.get("entities")))] = selector({"entity": {"multiple": True}})
+        schema[vol.Optional(f"group_{i}_selectors", default="\n".join(group.get("selectors", [])))] = MULTILINE
+        schema[vol.Optional(f"group_{i}_mode", default=group.get("mode", "entities"))] = _select(GROUP_MODES, "group_mode")
+        schema[vol.Optional(f"group_{i}_top_n", default=group.get("top_n", DEFAULT_TOP_N))] = _number(1, 50)
+        if removable:
+            schema[vol.Optional(f"remove_group_{i}", default=False)] = bool
+    schema[vol.Optional("add_another_group", default=False)] = bool
+    schema[vol.Optional("advanced_options", default=False)] = bool
+    return vol.Schema(schema)
+
+def advanced_schema(values):
+    return vol.Schema(_option_fields(ADVANCED_OPTIONS, values))
+
+def group_placeholders(num_groups, removable):
+    # Placeholders of the dynamic group labels
+    fields = ("name", "entities", "selectors", "mode", "top_n")
+    placeholders = {}
+    for i in range(num_groups):
+        for field in fields:
+            placeholders[f"group_{i}_{field}"] = {"number": str(i + 1)}
+        if removable:
+            placeholders[f"remove_group_{i}"] = {"number": str(i + 1)}
+    return placeholders
+
+def _form_groups(user_input):
+    # Groups as submitted (just entity IDs), without the ones ticked for removal
+    num_groups = 0
+    while f"group_{num_groups}_name" in user_input or f"group_{num_groups}_entities" in user_input:
+        num_groups += 1
+    groups = []
+    for idx in range(num_groups):
+        if user_input.get(f"remove_group_{idx}"):
+            continue
+        group_dict = {
+            "entities": [{"entity_id": ent} for ent in user_input.get(f"group_{idx}_entities", []) if ent]
         }
-        
-        # TRMNL Configuration fields
-        layout_default = user_input.get("layout") if user_input else prev_data.get("layout", "groups")
-        schema_dict[vol.Optional("layout", default=layout_default)] = selector({"select": {"options": ["groups", "list"], "translation_key": "layout"}})
-        
-        pill_position_default = user_input.get("pill_position") if user_input else prev_data.get("pill_position", "top")
-        schema_dict[vol.Optional("pill_position", default=pill_position_default)] = selector({"select": {"options": ["top", "bottom", "left", "right"], "translation_key": "pill_position"}})
-        
-        show_title_bar_default = user_input.get("show_title_bar", prev_data.get("show_title_bar", True)) if user_input is not None else prev_data.get("show_title_bar", True)
-        if isinstance(show_title_bar_default, str):
-            show_title_bar_default = show_title_bar_default == "true"
-        schema_dict[vol.Optional("show_title_bar", default=show_title_bar_default)] = bool
-        
-        show_entity_title_default = user_input.get("show_entity_title", prev_data.get("show_entity_title", True)) if user_input is not None else prev_data.get("show_entity_title", True)
-        if isinstance(show_entity_title_default, str):
-            show_entity_title_default = show_entity_title_default == "true"
-        schema_dict[vol.Optional("show_entity_title", default=show_entity_title_default)] = bool
-        
-        show_entity_icon_default = user_input.get("show_entity_icon", prev_data.get("show_entity_icon", True)) if user_input is not None else prev_data.get("show_entity_icon", True)
-        if isinstance(show_entity_icon_default, str):
-            show_entity_icon_default = show_entity_icon_default == "true"
-        schema_dict[vol.Optional("show_entity_icon", default=show_entity_icon_default)] = bool
-        
-        scale_default = user_input.get("scale") if user_input else prev_data.get("scale", "normal")
-        schema_dict[vol.Optional("scale", default=scale_default)] = selector({"select": {"options": ["small", "normal", "big"], "translation_key": "scale"}})
-        pill_entities_default = []
-        if user_input:
-            pill_entities_default = user_input.get("pill_entities", [e.get("entity_id") for e in prev_data.get("pills", [])])
-        elif prev_data.get("pills"):
-            pill_entities_default = [e.get("entity_id") for e in prev_data["pills"]]
-        schema_dict[vol.Optional("pill_entities", default=pill_entities_default)] = selector({"entity": {"multiple": True}})
-        # Add Visualizations field
-        visualization_entities_default = []
-        if user_input:
-            visualization_entities_default = user_input.get("visualization_entities", [e.get("entity_id") for e in prev_data.get("visualizations", [])])
-        elif prev_data.get("visualizations"):
-            visualization_entities_default = [e.get("entity_id") for e in prev_data["visualizations"]]
-        schema_dict[vol.Optional("visualization_entities", default=visualization_entities_default)] = selector({"entity": {"multiple": True, "domain": "weather"}})
-
-        groups = prev_data.get("groups", [])
-        for i in range(num_groups):
-            group_name_default = None
-            group_entities_default = []
-            if user_input:
-                group_name_default = user_input.get(f"group_{i}_name", groups[i].get("groupName", f"Group {i+1}") if i < len(groups) else f"Group {i+1}")
-                group_entities_default = user_input.get(f"group_{i}_entities", [e.get("entity_id") for e in groups[i].get("entities", [])] if i < len(groups) else [])
-            elif i < len(groups):
-                group_name_default = groups[i].get("groupName", f"Group {i+1}")
-                group_entities_default = [e.get("entity_id") for e in groups[i].get("entities", [])]
-            else:
-                group_name_default = f"Group {i+1}"
-                group_entities_default = []
-            schema_dict[vol.Optional(f"group_{i}_name", default=group_name_default)] = str
-            schema_dict[vol.Optional(f"group_{i}_entities", default=group_entities_default)] = selector({"entity": {"multiple": True}})
-        schema_dict[vol.Optional("add_another_group", default=False)] = bool
-        return vol.Schema(schema_dict)
+        group_selectors = parse_selectors(user_input.get(f"group_{idx}_selectors", ""))
+        if group_selectors:
+            group_dict["selectors"] = group_selectors
+        group_mode = user_input.get(f"group_{idx}_mode", "entities")
+        if group_mode != "entities":
+            group_dict["mode"] = group_mode
+            group_dict["top_n"] = int(user_input.get(f"group_{idx}_top_n", DEFAULT_TOP_N))
+        group_name = user_input.get(f"group_{idx}_name", f"Group {idx+1}")
+        if group_name:
+            group_dict["groupName"] = group_name
+        groups.append(group_dict)
+    return groups
 
+def _submitted(options, user_input):
+    return {key: convert(user_input.get(key, default)) for key, (default, _field, convert) in options.items()}
+
+def dashboard_config(user_input, prev_data):
+    # Config of a submitted dashboard form. The advanced options keep their previous
+    # values, or their defaults, until the advanced step is shown.
+    data = {
+        "webhook_url": user_input.get("webhook_url", prev_data.get("webhook_url", "")),
+        "groups": _form_groups(user_input),
+        "pills": [{"entity_id": ent} for ent in user_input.get("pill_entities", []) if ent],
+        "visualizations": [{"entity_id": ent} for ent in user_input.get("visualization_entities", []) if ent],
+    }
+    data.update(_submitted(DASHBOARD_OPTIONS, user_input))
+    for key, (default, _field, convert) in ADVANCED_OPTIONS.items():
+        data[key] = prev_data[key] if key in prev_data else convert(default)
+    return data
+
+class DashboardFlowMixin:
+    # Steps shared by the config and options flows: the dashboard form (step FORM_STEP),
+    # the advanced options and the preview. The flows differ in where the previous config
+    # comes from (_previous_config), whether groups can be removed, and what saving does
+    # (_async_create).
+    FORM_STEP = "user"
+    REMOVABLE_GROUPS = False
+    _draft = None  # Config shown in the preview step, and refilled when going back
+
+    def _show_dashboard_form(self, values, num_groups):
+        return self.async_show_form(
+            step_id=self.FORM_STEP,
+            data_schema=dashboard_schema(values, num_groups, self.REMOVABLE_GROUPS),
+            description_placeholders=group_placeholders(num_groups, self.REMOVABLE_GROUPS),
+        )
+
+    async def _async_step_dashboard(self, user_input):
+        prev_data = self._draft if self._draft is not None else self._previous_config()
+        if user_input is None:
+            return self._show_dashboard_form(prev_data, len(prev_data.get("groups") or []) or 1)
+        data = dashboard_config(user_input, prev_data)
+        if user_input.get("add_another_group"):
+            return self._show_dashboard_form(data, len(data["groups"]) + 1)
+        self._draft = data
+        if user_input.get("advanced_options"):
+            return await self.async_step_advanced()
+        return await async_show_preview(self, data)
+
+    async def async_step_advanced(self, user_input=None):
+        if user_input is None:
+            return self.async_show_form(step_id="advanced", data_schema=advanced_schema(self._draft))
+        self._draft = {**self._draft, **_submitted(ADVANCED_OPTIONS, user_input)}
+        return await async_show_preview(self, self._draft)
+
+    async def async_step_preview(self, user_input=None):
+        if user_input is not None and user_input.get("edit"):
+            return await self._async_step_dashboard(None)
+        if user_input is None:
+            return await async_show_preview(self, self._draft)
+        return self._async_create(self._draft)
+
+class TrmnlWebhookConfigFlow(DashboardFlowMixin, config_entries.ConfigFlow, domain=DOMAIN):
+
+    async def async_step_user(self, user_input=None):
+        return await self._async_step_dashboard(user_input)
+
+    def _previous_config(self):
+        if getattr(self, "config_entry", None):
+            return {**self.config_entry.data, **self.config_entry.options}
+        return {}
+
+    def _async_create(self, data):
+        # The entry's coordinator sends the first push once it is set up
+        return self.async_create_entry(title="TRMNL Dashboard", data=data)
 
     @staticmethod
     @callback
     def async_get_options_flow(config_entry):
         return TrmnlWebhookOptionsFlowHandler(config_entry)
 
-class TrmnlWebhookOptionsFlowHandler(config_entries.OptionsFlow):
+class TrmnlWebhookOptionsFlowHandler(DashboardFlowMixin, config_entries.OptionsFlow):
+    FORM_STEP = "init"
+    REMOVABLE_GROUPS = True
+
     def __init__(self, config_entry):
         # Store entry_id for context lookup
         self.entry_id = config_entry.entry_id
 
     async def async_step_init(self, user_input=None):
+        return await self._async_step_dashboard(user_input)
+
+    def _previous_config(self):
         entry = self.hass.config_entries.async_get_entry(self.entry_id)
-        prev_data = {**entry.data, **entry.options} if entry else {}
-        hass = self.hass
-
-        # Always build groups from user_input if present, else from prev_data
-        if user_input is not None:
-            if user_input is not None:
-                # Determine current number of groups from user_input
-                i = 0
-                while f"group_{i}_name" in user_input or f"group_{i}_entities" in user_input:
-                    i += 1
-                num_groups = i if i > 0 else 1
-                add_group = user_input.get("add_another_group", False)
-                # Handle group removal
-                removed_indices = []
-                for idx in range(num_groups):
-                    if user_input.get(f"remove_group_{idx}"):
-                        removed_indices.append(idx)
-                # Build groups from user_input (just entity IDs)
-                updated_groups = []
-                for idx in range(num_groups):
-                    if idx in removed_indices:
-                        continue
-                    group_name = user_input.get(f"group_{idx}_name", f"Group {idx+1}")
-                    group_entities = user_input.get(f"group_{idx}_entities", [])
-                    group_dict = {
-                        "entities": [{"entity_id": ent} for ent in group_entities if ent]
-                    }
-                    if group_name:
-                        group_dict["groupName"] = group_name
-                    updated_groups.append(group_dict)
-                if add_group:
-                    updated_groups.append({"groupName": f"Group {len(updated_groups)+1}", "entities": []})
-                    num_groups = len(updated_groups)
-                    schema = self._get_dynamic_options_schema(prev_data, user_input, num_groups)
-                    # Build description_placeholders for dynamic group labels
-                    placeholders = {}
-                    for i in range(num_groups):
-                        placeholders[f"group_{i}_name"] = {"number": str(i + 1)}
-                        placeholders[f"group_{i}_entities"] = {"number": str(i + 1)}
-                        placeholders[f"remove_group_{i}"] = {"number": str(i + 1)}
-                    return self.async_show_form(
-                        step_id="init",
-                        data_schema=schema,
-                        description_placeholders=placeholders
-                    )
-                webhook_url = user_input.get("webhook_url", prev_data.get("webhook_url", ""))
-                pills_entities = user_input.get("pill_entities", [])
-                pills_obj = [{"entity_id": ent} for ent in pills_entities if ent]
-                visualization_entities = user_input.get("visualization_entities", [])
-                visualizations_obj = [{"entity_id": ent} for ent in visualization_entities if ent]
-                data = {
-                    "webhook_url": webhook_url,
-                    "groups": updated_groups,
-                    "pills": pills_obj,
-                    "visualizations": visualizations_obj,
-                    "layout": user_input.get("layout", "groups"),
-                    "pill_position": user_input.get("pill_position", "top"),
-                    "show_title_bar": "true" if user_input.get("show_title_bar", True) else "false",
-                    "show_entity_title": "true" if user_input.get("show_entity_title", True) else "false",
-                    "show_entity_icon": "true" if user_input.get("show_entity_icon", True) else "false",
-                    "scale": user_input.get("scale", "normal")
-                }
-                # Send webhook on options update
-                if data.get("webhook_url"):
-                    session = async_get_clientsession(hass)
-                    # Expand entities like in __init__.py
-                    groups = data.get("groups", [])
-                    pills = data.get("pills", [])
-                    visualizations = data.get("visualizations", [])
-                    updated_groups = []
-                    for group in groups:
-                        updated_entities = []
-                        for entity in group.get("entities", []):
-                            entity_id = entity.get("entity_id")
-                            state_obj = hass.states.get(entity_id)
-                            if state_obj:
-                                updated_entity = {
-                                    "entity_id": entity_id,
-                                    "state": state_obj.state,
-                                    "attributes": dict(state_obj.attributes),
-                                    "last_changed": str(state_obj.last_changed),
-                                    "last_updated": str(state_obj.last_updated),
-                                }
-                                updated_entities.append(updated_entity)
-                            else:
-                                updated_entities.append(entity)
-                        updated_group = dict(group)
-                        updated_group["entities"] = updated_entities
-                        updated_groups.append(updated_group)
-                    updated_pills = []
-                    for pill in pills:
-                        entity_id = pill.get("entity_id")
-                        state_obj = hass.states.get(entity_id)
-                        if state_obj:
-                            updated_pill = {
-                                "entity_id": entity_id,
-                                "state": state_obj.state,
-                                "attributes": dict(state_obj.attributes),
-                                "last_changed": str(state_obj.last_changed),
-                                "last_updated": str(state_obj.last_updated),
-                            }
-                            updated_pills.append(updated_pill)
-                        else:
-                            updated_pills.append(pill)
-                    updated_visualizations = []
-                    for viz in visualizations:
-                        entity_id = viz.get("entity_id")
-                        state_obj = hass.states.get(entity_id)
-                        if state_obj:
-                            updated_viz = {
-                                "entity_id": entity_id,
-                                "state": state_obj.state,
-                                "attributes": dict(state_obj.attributes),
-                                "last_changed": str(state_obj.last_changed),
-                                "last_updated": str(state_obj.last_updated),
-                            }
-                            # Fetch forecast for weather entities
-                            if entity_id.startswith("weather."):
-                                try:
-                                    forecast_response = await hass.services.async_call(
-                                        "weather",
-                                        "get_forecasts",
-                                        {"entity_id": entity_id, "type": "daily"},
-                                        blocking=True,
-                                        return_response=True
-                                    )
-                                    if forecast_response and entity_id in forecast_response:
-                                        updated_viz["forecast"] = forecast_response[entity_id].get("forecast", [])
-                                except Exception as forecast_err:
-                                    # Some weather entities may not support get_forecasts service
-                                    _LOGGER.debug(f"Could not fetch forecast for {entity_id}: {forecast_err}")
-                            updated_visualizations.append(updated_viz)
-                        else:
-                            updated_visualizations.append(viz)
-                    webhook_data = {
-                        "groups": updated_groups,
-                        "pills": updated_pills,
-                        "visualizations": updated_visualizations,
-                        "configuration": {
-                            "layout": data.get("layout", "groups"),
-                            "pill_position": data.get("pill_position", "top"),
-                            "show_title_bar": data.get("show_title_bar", "true"),
-                            "show_entity_title": data.get("show_entity_title", "true"),
-                            "show_entity_icon": data.get("show_entity_icon", "true"),
-                            "scale": data.get("scale", "normal")
-                        }
-                    }
-                    try:
-                        await send_to_trmnl_webhook(session, webhook_data, data["webhook_url"])
-                    except Exception as e:
-                        import logging
-                        logging.getLogger(__name__).error(f"TRMNL Dashboard config_flow options webhook failed: {e}")
-                return self.async_create_entry(title="config_flow.options_title", data=data)
-            return self.async_create_entry(title="config_flow.options_title", data=data)
-        else:
-            groups = prev_data.get("groups", [])
-            num_groups = len(groups) if groups else 1
-            schema = self._get_dynamic_options_schema(prev_data, user_input, num_groups)
-            
-            # Build description_placeholders for dynamic group labels
-            placeholders = {}
-            for i in range(num_groups):
-                placeholders[f"group_{i}_name"] = {"number": str(i + 1)}
-                placeholders[f"group_{i}_entities"] = {"number": str(i + 1)}
-                placeholders[f"remove_group_{i}"] = {"number": str(i + 1)}
-            
-            return self.async_show_form(step_id="init", data_schema=schema, description_placeholders=placeholders)
-
-    def _get_dynamic_options_schema(self, prev_data=None, user_input=None, num_groups=1):
-        prev_data = prev_data or {}
-        schema_dict = {
-            vol.Required("webhook_url", default=prev_data.get("webhook_url", "")): str,
-        }
-        
-        # TRMNL Configuration fields
-        layout_default = user_input.get("layout") if user_input else prev_data.get("layout", "groups")
-        schema_dict[vol.Optional("layout", default=layout_default)] = selector({"select": {"options": ["groups", "list"], "translation_key": "layout"}})
-        
-        pill_position_default = user_input.get("pill_position") if user_input else prev_data.get("pill_position", "top")
-        schema_dict[vol.Optional("pill_position", default=pill_position_default)] = selector({"select": {"options": ["top", "bottom", "left", "right"], "translation_key": "pill_position"}})
-        
-        show_title_bar_default = user_input.get("show_title_bar", prev_data.get("show_title_bar", True)) if user_input is not None else prev_data.get("show_title_bar", True)
-        if isinstance(show_title_bar_default, str):
-            show_title_bar_default = show_title_bar_default == "true"
-        schema_dict[vol.Optional("show_title_bar", default=show_title_bar_default)] = bool
-        
-        show_entity_title_default = user_input.get("show_entity_title", prev_data.get("show_entity_title", True)) if user_input is not None else prev_data.get("show_entity_title", True)
-        if isinstance(show_entity_title_default, str):
-            show_entity_title_default = show_entity_title_default == "true"
-        schema_dict[vol.Optional("show_entity_title", default=show_entity_title_default)] = bool
-        
-        show_entity_icon_default = user_input.get("show_entity_icon", prev_data.get("show_entity_icon", True)) if user_input is not None else prev_data.get("show_entity_icon", True)
-        if isinstance(show_entity_icon_default, str):
-            show_entity_icon_default = show_entity_icon_default == "true"
-        schema_dict[vol.Optional("show_entity_icon", default=show_entity_icon_default)] = bool
-        
-        scale_default = user_input.get("scale") if user_input else prev_data.get("scale", "normal")
-        schema_dict[vol.Optional("scale", default=scale_default)] = selector({"select": {"options": ["small", "normal", "big"], "translation_key": "scale"}})
-        pill_entities_default = []
-        if user_input:
-            pill_entities_default = user_input.get("pill_entities", [e.get("entity_id") for e in prev_data.get("pills", [])])
-        elif prev_data.get("pills"):
-            pill_entities_default = [e.get("entity_id") for e in prev_data["pills"]]
-        schema_dict[vol.Optional("pill_entities", default=pill_entities_default)] = selector({"entity": {"multiple": True}})
-
-        # Add Visualizations field
-        visualization_entities_default = []
-        if user_input:
-            visualization_entities_default = user_input.get("visualization_entities", [e.get("entity_id") for e in prev_data.get("visualizations", [])])
-        elif prev_data.get("visualizations"):
-            visualization_entities_default = [e.get("entity_id") for e in prev_data["visualizations"]]
-        schema_dict[vol.Optional("visualization_entities", default=visualization_entities_default)] = selector({"entity": {"multiple": True, "domain": "weather"}})
-
-        groups = prev_data.get("groups", [])
-        for i in range(num_groups):
-            group_name_default = None
-            group_entities_default = []
-            if user_input:
-                group_name_default = user_input.get(f"group_{i}_name", groups[i].get("groupName", f"Group {i+1}") if i < len(groups) else f"Group {i+1}")
-                group_entities_default = user_input.get(f"group_{i}_entities", [e.get("entity_id") for e in groups[i].get("entities", [])] if i < len(groups) else [])
-            elif i < len(groups):
-                group_name_default = groups[i].get("groupName", f"Group {i+1}")
-                group_entities_default = [e.get("entity_id") for e in groups[i].get("entities", [])]
-            else:
-                group_name_default = f"Group {i+1}"
-                group_entities_default = []
-            schema_dict[vol.Optional(f"group_{i}_name", default=group_name_default)] = str
-            schema_dict[vol.Optional(f"group_{i}_entities", default=group_entities_default)] = selector({"entity": {"multiple": True}})
-            schema_dict[vol.Optional(f"remove_group_{i}", default=False)] = bool
-        schema_dict[vol.Optional("add_another_group", default=False)] = bool
-        return vol.Schema(schema_dict)
-
-    def _get_options_schema(self, prev_data=None, user_input=None, num_groups=1):
-        prev_data = prev_data or {}
-        schema_dict = {
-            vol.Required("webhook_url", default=prev_data.get("webhook_url", "")): str,
-        }
-        # Pills first
-        pill_entities_default = []
-        if user_input:
-            pill_entities_default = user_input.get("pill_entities", [e.get("entity_id") for e in prev_data.get("pills", [])])
-        elif prev_data.get("pills"):
-            pill_entities_default = [e.get("entity_id") for e in prev_data["pills"]]
-        schema_dict[vol.Optional("pill_entities", default=pill_entities_default)] = selector({"entity": {"multiple": True}})
-
-        # Then groups, each with a red checkbox for removal
-        groups = prev_data.get("groups", [])
-        for i in range(num_groups):
-            group_name_default = None
-            group_entities_default = []
-            if user_input:
-                group_name_default = user_input.get(f"group_{i}_name", groups[i].get("groupName", f"Group {i+1}") if i < len(groups) else f"Group {i+1}")
-                group_entities_default = user_input.get(f"group_{i}_entities", [e.get("entity_id") for e in groups[i].get("entities", [])] if i < len(groups) else [])
-            elif i < len(groups):
-                group_name_default = groups[i].get("groupName", f"Group {i+1}")
-                group_entities_default = [e.get("entity_id") for e in groups[i].get("entities", [])]
-            else:
-                group_name_default = f"Group {i+1}"
-                group_entities_default = []
-            schema_dict[vol.Optional(f"group_{i}_name", default=group_name_default)] = str
-            schema_dict[vol.Optional(f"group_{i}_entities", default=group_entities_default)] = selector({"entity": {"multiple": True}})
-            # Red checkbox for removal (UI color is handled by frontend, but label can indicate removal)
-            schema_dict[vol.Optional(f"remove_group_{i}", default=False)] = bool
-        return vol.Schema(schema_dict)
+        return {**entry.data, **entry.options} if entry else {}
+
+    def _async_create(self, data):
+        # The entry's update listener applies the options to the running coordinator, which
+        # pushes only if the dashboard changed
+        return self.async_create_entry(title="config_flow.options_title", data=data)
@@ -0,0 +1,313 @@
+import logging
+import time
+from datetime import timedelta
+
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_state_change_event,
+    async_track_time_interval,
+)
+from homeassistant.helpers.start import async_at_started
+
+from .entity_index import async_get_entity_index
+from .forecast import async_get_forecast_cache
+from .history import async_get_history_cache
+from .plan import DashboardPlan, MaterializedSnapshot, async_get_record_cache, merge_entry_config
+from .scheduler import PushScheduler, get_rate_bucket
+from .webhook import WebhookDelivery
+
+_LOGGER = logging.getLogger(__name__)
+
+# Max seconds the first push waits for Home Assistant to start or the entities to load
+STARTUP_PUSH_TIMEOUT = 120
+
+class TrmnlDashboardCoordinator:
+    # Runtime of one config entry: builds one snapshot per tick and fans it out to every
+    # webhook target of the entry. Entity records and forecasts are shared with the
+    # other entries through hass.data, and all deliveries share HA's aiohttp session.
+
+    def __init__(self, hass, entry):
+        self.hass = hass
+        self.entry = entry
+        self.session = async_get_clientsession(hass)
+        self.forecast_cache = async_get_forecast_cache(hass)
+        self.record_cache = async_get_record_cache(hass)
+        self.entity_index = async_get_entity_index(hass)
+        self.deliveries = {}  # webhook_url -> WebhookDelivery
+        self.sensor_targets = ()  # Webhook URLs the sensor platform has devices for
+        self.frames = None  # BYOS FrameStore, created on the first frame request
+        self.last_push = None
+        self.timings = {}  # Seconds spent on setup and on the last snapshot: "forecast", "history" and "build"
+        self._plan = None
+        self._plan_sources = None
+        self._snapshot = None  # MaterializedSnapshot of the current plan
+        self._cancel_tracking = None
+        self._cancel_heartbeat = None
+        self._heartbeat_interval = None
+        self._cancel_debounce = None
+        self._listeners = []
+        self._update_scheduled = False
+        self._startup_pending = False  # True until the first push has been started
+        self._awaiting_entities = set()  # Tracked entities without a usable state yet
+        self._cancel_startup = None  # Cancels the startup timeout
+        self._cancel_started = None  # Cancels the wait for Home Assistant to start
+
+    @property
+    def plan(self):
+        # Compile the config once and again only when the options flow replaces
+        # entry.data/entry.options, or when a registry change may alter what the group
+        # selectors match; every tick reuses the compiled plan
+        sources = self._plan_sources
+        generation = self.entity_index.generation
+        if (
+            sources is None
+            or sources[0] is not self.entry.data
+            or sources[1] is not self.entry.options
+            or (self._plan.uses_selectors and sources[2] != generation)
+        ):
+            self._plan_sources = (self.entry.data, self.entry.options, generation)
+            self._plan = DashboardPlan(merge_entry_config(self.entry), self.entity_index)
+        return self._plan
+
+    @property
+    def snapshot(self):
+        # Entities of the current plan are tracked while its snapshot lives, so every state
+        # change marks it dirty; a new plan starts from a cold snapshot
+        plan = self.plan
+        if self._snapshot is None or self._snapshot.plan is not plan:
+            self._snapshot = MaterializedSnapshot(plan, self.record_cache)
+            if self._cancel_tracking is not None:
+                self._cancel_tracking()
+                self._cancel_tracking = None
+            if plan.tracked_entities:
+                self._cancel_tracking = async_track_state_change_event(
+                    self.hass, plan.tracked_entities, self._state_changed
+                )
+        return self._snapshot
+
+    @callback
+    def async_start(self):
+        # Arms the timers and returns; nothing is built or sent during setup. The first
+        # push waits until Home Assistant has started or every tracked entity has a
+        # state, whichever comes first, and at most STARTUP_PUSH_TIMEOUT seconds, so a
+        # restart neither waits on TRMNL nor pushes a dashboard of unavailable entities.
+        plan = self.plan
+        # Forecasts survive reloads; only the TTL follows the entry config
+        self.forecast_cache.ttl = plan.forecast_ttl
+        self._arm_heartbeat(plan.interval)
+        # Subscribes to the tracked entities, so those loading from now on are seen
+        self.snapshot
+        self._startup_pending = True
+        self._awaiting_entities = {
+            entity_id for entity_id in plan.tracked_entities if not self._has_state(entity_id)
+        }
+        if not self._awaiting_entities:
+            self._async_initial_push()
+            return
+        self._cancel_startup = async_call_later(self.hass, STARTUP_PUSH_TIMEOUT, self._async_initial_push)
+        # Runs right away once Home Assistant is running, e.g. when the entry is reloaded
+        self._cancel_started = async_at_started(self.hass, self._async_started)
+
+    @callback
+    def async_reconfigure(self):
+        # Applies a changed entry config to the running coordinator. The plan and snapshot
+        # are recompiled, but caches, delivery queues, fingerprints and push budgets are
+        # kept, the heartbeat is only re-armed when the interval changed, and the push
+        # that follows is skipped like any other when the dashboard content is unchanged.
+        old_plan = self._plan
+        plan = self.plan
+        if plan is old_plan:
+            return
+        self.forecast_cache.ttl = plan.forecast_ttl
+        if plan.interval != self._heartbeat_interval:
+            self._arm_heartbeat(plan.interval)
+        # Resubscribes state tracking to the new plan's entities
+        self.snapshot
+        removed = set(old_plan.entity_ids if old_plan else ()) - set(plan.entity_ids)
+        if removed:
+            self._discard_unused(removed)
+        _LOGGER.debug(f"TRMNL Dashboard: applied new options ({len(plan.tracked_entities)} entities)")
+        if self._startup_pending:
+            # The deferred first push will show the new config
+            return
+        self.hass.async_create_background_task(self.async_push("options"), "trmnl_dashboard options push")
+
+    def _arm_heartbeat(self, interval):
+        if self._cancel_heartbeat is not None:
+            self._cancel_heartbeat()
+        self._heartbeat_interval = interval
+        self._cancel_heartbeat = async_track_time_interval(
+            self.hass,
+            self._async_heartbeat,
+            timedelta(seconds=interval)
+        )
+
+    def _discard_unused(self, entity_ids):
+        # Cached records, forecasts and history are shared by all entries; only entities no
+        # entry shows any more are dropped
+        from . import DOMAIN
+        for coordinator in self.hass.data.get(DOMAIN, {}).values():
+            if isinstance(coordinator, TrmnlDashboardCoordinator) and coordinator._plan is not None:
+                entity_ids = entity_ids.difference(coordinator._plan.entity_ids)
+        entity_ids.discard(None)
+        if entity_ids:
+            self.record_cache.discard(entity_ids)
+            self.forecast_cache.async_invalidate(entity_ids)
+            async_get_history_cache(self.hass).async_invalidate(entity_ids)
+
+    def _has_state(self, entity_id):
+        state_obj = self.hass.states.get(entity_id)
+        return state_obj is not None and state_obj.state not in (STATE_UNAVAILABLE, STATE_UNKNOWN)
+
+    @callback
+    def _async_started(self, _hass):
+        # The started listener removes itself once it fired
+        self._cancel_started = None
+        self._async_initial_push()
+
+    @callback
+    def _async_initial_push(self, *_args):
+        # Called by whichever startup condition is met first
+        if not self._startup_pending:
+            return
+        self._startup_pending = False
+        self._awaiting_entities.clear()
+        self._async_cancel_startup()
+        self.hass.async_create_background_task(self.async_push("initial"), "trmnl_dashboard initial push")
+
+    @callback
+    def _async_cancel_startup(self):
+        if self._cancel_startup is not None:
+            self._cancel_startup()
+            self._cancel_startup = None
+        if self._cancel_started is not None:
+            self._cancel_started()
+            self._cancel_started = None
+
+    @callback
+    def async_stop(self):
+        if self._cancel_heartbeat is not None:
+            self._cancel_heartbeat()
+            self._cancel_heartbeat = None
+        self._startup_pending = False
+        self._async_cancel_startup()
+        if self._cancel_tracking is not None:
+            self._cancel_tracking()
+            self._cancel_tracking = None
+        if self._cancel_debounce is not None:
+            self._cancel_debounce()
+            self._cancel_debounce = None
+        for delivery in self.deliveries.values():
+            delivery.async_shutdown()
+        self.deliveries.clear()
+
+    async def async_push(self, reason="periodic"):
+        plan = self.plan
+        self.last_push = time.monotonic()
+        if not plan.targets:
+            return
+        try:
+            webhook_data = await plan.async_build(self.hass, self.forecast_cache, self.record_cache, self.timings, self.snapshot)
+            self._async_schedule_update()
+            # Drop queues of targets removed by the options flow
+            for url in [url for url in self.deliveries if url not in plan.target_urls]:
+                self.deliveries.pop(url).async_shutdown()
+            # Deliveries run in their own tasks, so targets are sent concurrently
+            for target in plan.targets:
+                self._get_delivery(target.webhook_url).async_submit(target.filter(webhook_data))
+        except Exception as e:
+            _LOGGER.error(f"TRMNL Dashboard {reason} update failed: {e}")
+
+    async def async_render_frame(self):
+        # BYOS devices poll for the current state: the snapshot is rebuilt per request
+        # (cheap with the record cache) but only re-rendered when its fingerprint changes
+        plan = self.plan
+        webhook_data = await plan.async_build(self.hass, self.forecast_cache, self.record_cache, snapshot=self.snapshot)
+        if self.frames is None:
+            # Pillow and the renderer load with the first frame, not with the integration
+            from .byos import FrameStore
+            self.frames = FrameStore()
+        return await self.frames.async_get(self.hass, webhook_data, plan.byos_bit_depth, self.record_cache.time_zone)
+
+    def _get_delivery(self, webhook_url):
+        plan = self.plan
+        delivery = self.deliveries.get(webhook_url)
+        if delivery is None:
+            delivery = self.deliveries[webhook_url] = WebhookDelivery(self.hass, self.session, webhook_url)
+        delivery.max_payload_bytes = plan.max_payload_bytes
+        delivery.payload_format = plan.payload_format
+        delivery.fragments = self.record_cache
+        delivery.compress = plan.compress_payload
+        delivery.bucket = get_rate_bucket(self.hass, webhook_url, plan.rate_limit)
+        delivery.listener = self._async_schedule_update
+        return delivery
+
+    @callback
+    def async_add_listener(self, update_callback):
+        # Telemetry sensors subscribe here; returns the unsubscribe callback
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def _async_schedule_update(self):
+        # Counters change on the hot path, so sensors are refreshed at most once per
+        # event loop iteration no matter how many counters changed in it
+        if self._update_scheduled or not self._listeners:
+            return
+        self._update_scheduled = True
+        self.hass.loop.call_soon(self._async_update_listeners)
+
+    @callback
+    def _async_update_listeners(self):
+        self._update_scheduled = False
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    async def _async_heartbeat(self, now):
+        # Skip the heartbeat before the first push and when a change-driven push
+        # happened recently
+        plan = self.plan
+        if self._startup_pending:
+            return
+        if plan.push_on_change and self.last_push is not None and time.monotonic() - self.last_push < plan.interval:
+            return
+        await self.async_push()
+
+    @callback
+    def _state_changed(self, event):
+        entity_id = event.data["entity_id"]
+        significant = self._snapshot.mark_dirty(entity_id, event.data.get("new_state"))
+        if self._startup_pending:
+            if self._awaiting_entities and self._has_state(entity_id):
+                self._awaiting_entities.discard(entity_id)
+                if not self._awaiting_entities:
+                    self._async_initial_push()
+            return
+        if not significant:
+            # Below its change threshold or invisible once formatted: nothing to push
+            return
+        # In "state_change" mode pushes follow entity changes and the interval only acts
+        # as a max-staleness heartbeat. A burst of changes is coalesced into a single
+        # push: the first change arms the timer, later ones within the window ride along
+        # with it. The window grows to align with the device refresh and the push budget.
+        plan = self.plan
+        if not plan.push_on_change or self._cancel_debounce is not None:
+            return
+        # The target with the tightest budget sets the pace for the shared snapshot
+        delay = plan.debounce
+        for url in plan.target_urls:
+            scheduler = PushScheduler(get_rate_bucket(self.hass, url, plan.rate_limit), plan.debounce, plan.device_refresh)
+            delay = max(delay, scheduler.next_push_delay())
+        self._cancel_debounce = async_call_later(self.hass, delay, self._async_debounced_push)
+
+    async def _async_debounced_push(self, now):
+        self._cancel_debounce = None
+        await self.async_push("state change")
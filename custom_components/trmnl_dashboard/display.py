@@ -0,0 +1,169 @@
+import re
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+# Mirrors createIconMap in trmnl-plugin/src/full.liquid: device class first, then domain
+ICON_MAP = {
+    # Domain-based icons
+    "light": "mdi:lightbulb",
+    "switch": "mdi:toggle-switch",
+    "sensor": "mdi:chart-line",
+    "climate": "mdi:thermostat",
+    "cover": "mdi:window-shutter",
+    "fan": "mdi:fan",
+    "lock": "mdi:lock",
+    "media_player": "mdi:speaker",
+    "camera": "mdi:camera",
+    "alarm_control_panel": "mdi:security",
+    "automation": "mdi:cog",
+    "script": "mdi:script-text",
+    "scene": "mdi:palette",
+    "input_boolean": "mdi:checkbox-marked",
+    "input_number": "mdi:numeric",
+    "input_select": "mdi:format-list-bulleted",
+    "input_text": "mdi:form-textbox",
+    "timer": "mdi:timer",
+    "counter": "mdi:counter",
+    "person": "mdi:account",
+    "device_tracker": "mdi:map-marker",
+    "zone": "mdi:map",
+    "sun": "mdi:weather-sunny",
+    "weather": "mdi:weather-partly-cloudy",
+    "conversation": "mdi:message-text",
+    "notify": "mdi:bell",
+    "tts": "mdi:volume-high",
+    "group": "mdi:account-group",
+    "homeassistant": "mdi:home-assistant",
+
+    # Device class specific icons
+    "temperature": "mdi:thermometer",
+    "humidity": "mdi:water-percent",
+    "pressure": "mdi:gauge",
+    "battery": "mdi:battery",
+    "illuminance": "mdi:brightness-6",
+    "motion": "mdi:motion-sensor",
+    "door": "mdi:door",
+    "window": "mdi:window-closed",
+    "smoke": "mdi:smoke-detector",
+    "gas": "mdi:gas-cylinder",
+    "power": "mdi:flash",
+    "energy": "mdi:lightning-bolt",
+    "current": "mdi:current-ac",
+    "voltage": "mdi:sine-wave",
+    "frequency": "mdi:waveform",
+    "signal_strength": "mdi:signal",
+    "connectivity": "mdi:wifi",
+    "co2": "mdi:molecule-co2",
+    "pm25": "mdi:air-filter",
+
+    # Fallback icons
+    "default": "mdi:information",
+    "error": "mdi:alert-circle",
+    "unknown": "mdi:help-circle",
+}
+
+# Mirrors createWeatherIconMap in full.liquid: weather condition -> icon
+WEATHER_ICON_MAP = {
+    "clear-night": "mdi:weather-night",
+    "cloudy": "mdi:weather-cloudy",
+    "fog": "mdi:weather-fog",
+    "hail": "mdi:weather-hail",
+    "lightning": "mdi:weather-lightning",
+    "lightning-rainy": "mdi:weather-lightning-rainy",
+    "partlycloudy": "mdi:weather-partly-cloudy",
+    "pouring": "mdi:weather-pouring",
+    "rainy": "mdi:weather-rainy",
+    "snowy": "mdi:weather-snowy",
+    "snowy-rainy": "mdi:weather-snowy-rainy",
+    "sunny": "mdi:weather-sunny",
+    "windy": "mdi:weather-windy",
+    "windy-variant": "mdi:weather-windy-variant",
+    "exceptional": "mdi:alert",
+}
+DEFAULT_WEATHER_ICON = "mdi:weather-partly-cloudy"
+
+# Weather card detail rows (createWeatherVisualization): attribute -> icon
+WEATHER_DETAIL_ICONS = {
+    "humidity": "mdi:water-percent",
+    "pressure": "mdi:gauge",
+    "wind_speed": "mdi:weather-windy",
+    "cloud_coverage": "mdi:weather-cloudy",
+    "visibility": "mdi:eye",
+}
+
+# Strings JavaScript's isNaN/parseFloat treat as plain decimal numbers
+NUMERIC_RE = re.compile(r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$")
+
+def format_icon(icon):
+    # Same normalisation as formatIconForUrl in full.liquid
+    if not icon:
+        return "mdi:help-circle"
+    if ":" in icon:
+        return icon
+    if icon.startswith("mdi-"):
+        return icon.replace("mdi-", "mdi:", 1)
+    return f"mdi:{icon}"
+
+def entity_icon(domain, attributes):
+    if attributes.get("icon"):
+        return format_icon(attributes["icon"])
+    device_class = attributes.get("device_class")
+    if device_class and device_class in ICON_MAP:
+        return ICON_MAP[device_class]
+    return ICON_MAP.get(domain, ICON_MAP["default"])
+
+def format_number(value):
+    # numValue % 1 === 0 ? numValue.toString() : numValue.toFixed(1). toFixed rounds the
+    # exact binary value half away from zero (0.25 -> "0.3") where format() rounds half
+    # to even.
+    if value.is_integer():
+        return str(int(value))
+    return str(Decimal(value).quantize(Decimal("0.1"), ROUND_HALF_UP))
+
+def format_datetime(moment):
+    # Date.toLocaleString() in the render farm's en-US locale: "1/2/2026, 3:04:05 PM"
+    meridiem = "AM" if moment.hour < 12 else "PM"
+    return f"{moment.month}/{moment.day}/{moment.year}, {moment.hour % 12 or 12}:{moment:%M:%S} {meridiem}"
+
+def format_state(state, attributes, time_zone=None):
+    # Returns (value, unit, numeric) like formatEntityState in full.liquid
+    unit = attributes.get("unit_of_measurement") or ""
+    if state in ("on", "off"):
+        return state.upper(), "", False
+    if state and NUMERIC_RE.match(state):
+        return format_number(float(state)), unit, True
+    if state and "T" in state and ":" in state:
+        try:
+            moment = datetime.fromisoformat(state)
+        except ValueError:
+            pass
+        else:
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            # Formatted in Home Assistant's time zone rather than the render farm's
+            return format_datetime(moment.astimezone(time_zone or timezone.utc)), "", False
+    return state or "N/A", unit, False
+
+def display_fields(entity_id, state, attributes, time_zone=None):
+    # Display-ready fields read by full.liquid instead of raw attributes. Short keys:
+    # n name, t title (omitted when equal to the name), i icon, c icon CSS class,
+    # v formatted value, u unit (omitted when empty), f numeric flag (omitted when false)
+    domain = entity_id.split(".", 1)[0]
+    device_class = attributes.get("device_class") or ""
+    name = attributes.get("friendly_name") or entity_id
+    title = attributes.get("friendly_name")
+    if title is None:
+        title = device_class[:1].upper() + device_class[1:].replace("_", " ")
+    value, unit, numeric = format_state(state, attributes, time_zone)
+
+    fields = {"n": name}
+    if title != name:
+        fields["t"] = title
+    fields["i"] = entity_icon(domain, attributes)
+    fields["c"] = device_class or domain or "default"
+    fields["v"] = value
+    if unit:
+        fields["u"] = unit
+    if numeric:
+        fields["f"] = 1
+    return fields
@@ -0,0 +1,169 @@
+import fnmatch
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity_registry as er,
+    label_registry as lr,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Group selectors, one per line: "area: Kitchen", "label: energy", "domain: light" or an
+# entity ID pattern such as "sensor.*_temperature". Terms joined by commas on one line
+# must all match ("area: Kitchen, domain: light"); the lines of a group add up.
+SELECTOR_KINDS = ("area", "label", "domain")
+
+# Registry updates that can change what a selector matches: per registry, the fields
+# whose change counts for an "update" event (None: every update counts)
+REGISTRY_EVENTS = {
+    er.EVENT_ENTITY_REGISTRY_UPDATED: {
+        "area_id", "device_id", "disabled_by", "entity_category", "entity_id", "hidden_by", "labels",
+    },
+    dr.EVENT_DEVICE_REGISTRY_UPDATED: {"area_id", "labels"},
+    ar.EVENT_AREA_REGISTRY_UPDATED: None,
+    lr.EVENT_LABEL_REGISTRY_UPDATED: None,
+}
+# New devices have no entities yet and area reordering changes no name
+IGNORED_ACTIONS = {dr.EVENT_DEVICE_REGISTRY_UPDATED: "create", ar.EVENT_AREA_REGISTRY_UPDATED: "reorder"}
+
+def parse_selectors(text):
+    # Selector lines from the config flow text field, blank lines dropped
+    return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+class EntityIndex:
+    # Entity IDs by area, label and domain, built from the entity, device, area and label
+    # registries on first use and dropped when a change in them can alter a selector
+    # (see REGISTRY_EVENTS). Resolved selectors are cached with the index, so a dashboard
+    # recompiles only after such a change and a tick never scans the state machine.
+
+    def __init__(self, hass):
+        self.hass = hass
+        self.generation = 0  # Bumped on every invalidation
+        self._index = None
+        self._resolved = {}  # selector line -> sorted entity IDs
+        self._unsubscribe = []
+
+    @callback
+    def async_listen(self):
+        for event_type in REGISTRY_EVENTS:
+            self._unsubscribe.append(self.hass.bus.async_listen(event_type, self._async_registry_updated))
+
+    @callback
+    def async_stop(self):
+        while self._unsubscribe:
+            self._unsubscribe.pop()()
+
+    @callback
+    def _async_registry_updated(self, event):
+        action = event.data.get("action")
+        if action == IGNORED_ACTIONS.get(event.event_type):
+            return
+        fields = REGISTRY_EVENTS[event.event_type]
+        if action == "update" and fields is not None and fields.isdisjoint(event.data.get("changes") or ()):
+            # e.g. a firmware version or name change of a device
+            return
+        self.async_invalidate()
+
+    @callback
+    def async_invalidate(self, event=None):
+        self._index = None
+        self._resolved.clear()
+        self.generation += 1
+
+    def resolve(self, selectors):
+        # Entity IDs matched by any of the selector lines, each once, in line order
+        entity_ids = []
+        seen = set()
+        for line in selectors:
+            for entity_id in self._resolve_line(line):
+                if entity_id not in seen:
+                    seen.add(entity_id)
+                    entity_ids.append(entity_id)
+        return entity_ids
+
+    def _resolve_line(self, line):
+        resolved = self._resolved.get(line)
+        if resolved is None:
+            index = self._get_index()
+            matches = None
+            for term in line.split(","):
+                term_matches = self._match_term(index, term.strip())
+                matches = term_matches if matches is None else matches & term_matches
+            resolved = self._resolved[line] = sorted(matches or ())
+        return resolved
+
+    def _match_term(self, index, term):
+        kind, separator, value = term.partition(":")
+        kind = kind.strip().lower()
+        if separator and kind in SELECTOR_KINDS:
+            value = value.strip().lower()
+            return index[kind].get(index["names"][kind].get(value, value), set())
+        # Entity ID or pattern; listed entities need not be in the registry
+        if any(char in term for char in "*?["):
+            return set(fnmatch.filter(index["all"], term))
+        return {term} if term else set()
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    def _build_index(self):
+        hass = self.hass
+        entity_registry = er.async_get(hass)
+        device_registry = dr.async_get(hass)
+        by_area = {}
+        by_label = {}
+        by_domain = {}
+        selectable = []
+        for entry in entity_registry.entities.values():
+            # Like area targets in Home Assistant, selectors skip disabled, hidden and
+            # config/diagnostic entities
+            if entry.disabled_by or entry.hidden_by or entry.entity_category:
+                continue
+            device = device_registry.async_get(entry.device_id) if entry.device_id else None
+            area_id = entry.area_id or (device.area_id if device else None)
+            if area_id:
+                by_area.setdefault(area_id, set()).add(entry.entity_id)
+            for label_id in set(entry.labels) | (set(device.labels) if device else set()):
+                by_label.setdefault(label_id, set()).add(entry.entity_id)
+            selectable.append(entry.entity_id)
+        # Entities without a unique ID have no registry entry; domains and patterns see
+        # those present when the index was built
+        registered = entity_registry.entities
+        selectable.extend(
+            entity_id for entity_id in self.hass.states.async_entity_ids() if entity_id not in registered
+        )
+        for entity_id in selectable:
+            by_domain.setdefault(entity_id.split(".", 1)[0], set()).add(entity_id)
+        names = {
+            "area": {area.name.lower(): area.id for area in ar.async_get(hass).async_list_areas()},
+            "label": {label.name.lower(): label.label_id for label in lr.async_get(hass).async_list_labels()},
+            "domain": {},
+        }
+        _LOGGER.debug(f"TRMNL Dashboard: indexed {len(selectable)} entities for group selectors")
+        return {
+            "area": by_area,
+            "label": by_label,
+            "domain": by_domain,
+            "names": names,
+            "all": sorted(selectable),
+        }
+
+def async_get_entity_index(hass):
+    from . import DOMAIN
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if "entity_index" not in domain_data:
+        index = domain_data["entity_index"] = EntityIndex(hass)
+        index.async_listen()
+    return domain_data["entity_index"]
+
+def async_remove_entity_index(hass):
+    # With the last entry; config flows started later build a new index
+    from . import DOMAIN
+    index = hass.data.get(DOMAIN, {}).pop("entity_index", None)
+    if index is not None:
+        index.async_stop()
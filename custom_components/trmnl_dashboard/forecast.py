@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FORECAST_TTL = 900  # Forecasts change roughly hourly
+FORECAST_TIMEOUT = 10  # Max seconds a dashboard push waits for a forecast refresh
+FORECAST_RETRY_TTL = 60  # Seconds before a failed fetch is tried again
+
+class ForecastCache:
+    # Forecasts keyed by (entity_id, forecast_type). Expired entries are served stale
+    # while a single batched get_forecasts call refreshes them in the background;
+    # only entities never fetched before are awaited, and never longer than the timeout.
+
+    def __init__(self, hass, ttl=DEFAULT_FORECAST_TTL, timeout=FORECAST_TIMEOUT):
+        self.hass = hass
+        self.ttl = ttl
+        self.timeout = timeout
+        self._entries = {}  # (entity_id, forecast_type) -> (fetched_at, forecast, retry ttl or None)
+        self._pending = {}  # (entity_id, forecast_type) -> refresh task
+        # Invalidation generations: a refresh started before an entity was invalidated
+        # drops its result for that entity instead of putting it back
+        self._generation = 0
+        self._cleared_at = 0
+        self._invalidated_at = {}  # entity_id -> generation of its last invalidation
+
+    async def async_get(self, entity_ids, forecast_type="daily"):
+        now = time.monotonic()
+        missing = []
+        expired = []
+        for entity_id in entity_ids:
+            entry = self._entries.get((entity_id, forecast_type))
+            if entry is None:
+                missing.append(entity_id)
+            elif now - entry[0] >= (entry[2] or self.ttl):
+                expired.append(entity_id)
+
+        refresh = [
+            entity_id for entity_id in missing + expired
+            if (entity_id, forecast_type) not in self._pending
+        ]
+        if refresh:
+            task = self.hass.async_create_background_task(
+                self._async_refresh(refresh, forecast_type, self._generation),
+                "trmnl_dashboard forecast refresh",
+            )
+            for entity_id in refresh:
+                self._pending[(entity_id, forecast_type)] = task
+
+        # Stale entries are returned as-is; only first-time fetches are waited for
+        waiting = {self._pending[(entity_id, forecast_type)] for entity_id in missing if (entity_id, forecast_type) in self._pending}
+        if waiting:
+            _done, not_done = await asyncio.wait(waiting, timeout=self.timeout)
+            if not_done:
+                _LOGGER.debug(f"TRMNL Dashboard: forecast refresh still running after {self.timeout}s, pushing without it")
+
+        result = {}
+        for entity_id in entity_ids:
+            entry = self._entries.get((entity_id, forecast_type))
+            if entry is not None and entry[1]:
+                result[entity_id] = entry[1]
+        return result
+
+    def async_invalidate(self, entity_ids=None):
+        # Refreshes in flight for these entities are left to finish, but their results are
+        # dropped and the next get fetches again
+        self._generation += 1
+        if entity_ids is None:
+            self._entries.clear()
+            self._pending.clear()
+            self._invalidated_at.clear()
+            self._cleared_at = self._generation
+            return
+        entity_ids = set(entity_ids)
+        for entity_id in entity_ids:
+            self._invalidated_at[entity_id] = self._generation
+        for key in [key for key in self._entries if key[0] in entity_ids]:
+            del self._entries[key]
+        for key in [key for key in self._pending if key[0] in entity_ids]:
+            del self._pending[key]
+
+    def _invalidated_since(self, entity_id, generation):
+        return max(self._cleared_at, self._invalidated_at.get(entity_id, 0)) > generation
+
+    async def _async_refresh(self, entity_ids, forecast_type, generation):
+        task = asyncio.current_task()
+        try:
+            async with asyncio.timeout(self.timeout * 3):
+                forecasts = await self._async_fetch(entity_ids, forecast_type)
+        except Exception as err:
+            _LOGGER.debug(f"TRMNL Dashboard: forecast refresh for {entity_ids} failed: {err}")
+            forecasts = dict.fromkeys(entity_ids)
+        finally:
+            for entity_id in entity_ids:
+                # A refresh started after an invalidation may hold the key by now
+                if self._pending.get((entity_id, forecast_type)) is task:
+                    del self._pending[(entity_id, forecast_type)]
+        fetched_at = time.monotonic()
+        for entity_id, forecast in forecasts.items():
+            key = (entity_id, forecast_type)
+            if self._invalidated_since(entity_id, generation):
+                continue
+            if forecast is not None:
+                self._entries[key] = (fetched_at, forecast, None)
+                continue
+            # Failed: keep serving the previous forecast (none for an entity never fetched)
+            # and retry after FORECAST_RETRY_TTL rather than the full ttl, without making
+            # the pushes in between wait for the entity again
+            previous = self._entries.get(key)
+            self._entries[key] = (fetched_at, previous[1] if previous else [], FORECAST_RETRY_TTL)
+
+    async def _async_fetch(self, entity_ids, forecast_type):
+        # get_forecasts accepts several entity ids; fall back to per-entity calls when one
+        # entity in the batch does not support the requested type and fails the whole call.
+        # Entities whose call failed map to None.
+        try:
+            response = await self._async_call(entity_ids, forecast_type)
+            return {entity_id: response.get(entity_id, {}).get("forecast", []) for entity_id in entity_ids}
+        except Exception as batch_err:
+            if len(entity_ids) == 1:
+                # Some weather entities may not support get_forecasts service
+                _LOGGER.debug(f"Could not fetch forecast for {entity_ids[0]}: {batch_err}")
+                return {entity_ids[0]: None}
+        results = await asyncio.gather(
+            *(self._async_call([entity_id], forecast_type) for entity_id in entity_ids),
+            return_exceptions=True,
+        )
+        forecasts = {}
+        for entity_id, response in zip(entity_ids, results):
+            if isinstance(response, Exception):
+                _LOGGER.debug(f"Could not fetch forecast for {entity_id}: {response}")
+                forecasts[entity_id] = None
+            else:
+                forecasts[entity_id] = response.get(entity_id, {}).get("forecast", [])
+        return forecasts
+
+    async def _async_call(self, entity_ids, forecast_type):
+        response = await self.hass.services.async_call(
+            "weather",
+            "get_forecasts",
+            {"entity_id": entity_ids, "type": forecast_type},
+            blocking=True,
+            return_response=True
+        )
+        return response or {}
+
+def async_get_forecast_cache(hass):
+    # One cache per Home Assistant instance, shared by the entry and the config flows
+    from . import DOMAIN
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if "forecast_cache" not in domain_data:
+        domain_data["forecast_cache"] = ForecastCache(hass)
+    return domain_data["forecast_cache"]
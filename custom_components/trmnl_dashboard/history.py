@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_HOURS = 24
+HISTORY_TIMEOUT = 10  # Max seconds a dashboard push waits for a first statistics query
+# The recorder keeps 5 minute statistics for 10 days; longer windows use hourly ones
+SHORT_TERM_MAX_HOURS = 48
+
+# Sparkline viewBox in pixels, sized for a half-width card on the 800x480 panel. One
+# point every 6 pixels is as much as the e-ink panel resolves, and keeps a graph of any
+# window at about 60 points (a few hundred bytes).
+SPARKLINE_WIDTH = 360
+SPARKLINE_HEIGHT = 60
+SPARKLINE_POINTS = SPARKLINE_WIDTH // 6
+
+def statistics_period(hours):
+    # (recorder period, seconds between two statistics rows)
+    return ("5minute", 300) if hours <= SHORT_TERM_MAX_HOURS else ("hour", 3600)
+
+def lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets downsampling of (x, y) points sorted by x. Keeps the
+    # first and last point and, from each bucket in between, the point forming the
+    # largest triangle with the previous pick and the next bucket's average, so peaks
+    # and dips survive where plain averaging would flatten them.
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        average_start = int((bucket + 1) * every) + 1
+        average_end = min(int((bucket + 2) * every) + 1, count)
+        average = points[average_start:average_end]
+        average_x = sum(point[0] for point in average) / len(average)
+        average_y = sum(point[1] for point in average) / len(average)
+        previous_x, previous_y = points[previous]
+        largest = -1.0
+        picked = previous
+        for index in range(int(bucket * every) + 1, int((bucket + 1) * every) + 1):
+            x, y = points[index]
+            area = abs((previous_x - average_x) * (y - previous_y) - (previous_x - x) * (average_y - previous_y))
+            if area > largest:
+                largest = area
+                picked = index
+        sampled.append(points[picked])
+        previous = picked
+    sampled.append(points[-1])
+    return sampled
+
+def sparkline(points, start, end, hours):
+    # Payload form of a series: its range for the labels, and the downsampled points as
+    # integer pixel coordinates in a SPARKLINE_WIDTH x SPARKLINE_HEIGHT viewBox (y = 0
+    # at the maximum). Rendered by HomeAssistantRenderer.createSparklineVisualization.
+    if len(points) < 2:
+        return None
+    low = min(value for _, value in points)
+    high = max(value for _, value in points)
+    span = (end - start) or 1
+    value_range = high - low
+    scaled = []
+    for timestamp, value in lttb(points, SPARKLINE_POINTS):
+        x = round((timestamp - start) / span * (SPARKLINE_WIDTH - 1))
+        y = round((high - value) / value_range * (SPARKLINE_HEIGHT - 1)) if value_range else SPARKLINE_HEIGHT // 2
+        scaled.append([min(max(x, 0), SPARKLINE_WIDTH - 1), y])
+    return {
+        "hours": hours,
+        "min": round(low, 2),
+        "max": round(high, 2),
+        "w": SPARKLINE_WIDTH,
+        "h": SPARKLINE_HEIGHT,
+        "points": scaled,
+    }
+
+class HistorySeries:
+    __slots__ = ("points", "fetched_at", "queried_until", "sparkline")
+
+    def __init__(self):
+        self.points = []  # (start timestamp, value) of each statistics row in the window
+        self.fetched_at = None  # Monotonic time of the last query covering this series
+        self.queried_until = None  # Timestamp the last successful query ran up to
+        self.sparkline = None  # Cached payload form, rebuilt only when points are added
+
+    @property
+    def last_start(self):
+        return self.points[-1][0] if self.points else None
+
+    def query_start(self, window_start, period_seconds):
+        # Rows still missing: those after the last one held or, for a series without
+        # rows, any compiled since the last query
+        if self.points:
+            return max(self.last_start + 1, window_start)
+        if self.queried_until is not None:
+            return max(self.queried_until - period_seconds, window_start)
+        return window_start
+
+class HistoryCache:
+    # Recorder statistics of the sensors charted as sparklines, keyed by (entity_id,
+    # hours). The first query reads the whole window; later ones ask only for rows newer
+    # than the last one held, once a new statistics period has been compiled, and the
+    # window is trimmed in place. All series due in a push are read in one query on the
+    # recorder's executor. Like forecasts, stale series are served while a refresh runs
+    # in the background, and only series never fetched before are waited for.
+
+    def __init__(self, hass, timeout=HISTORY_TIMEOUT):
+        self.hass = hass
+        self.timeout = timeout
+        self._series = {}  # (entity_id, hours) -> HistorySeries
+        self._pending = {}  # (entity_id, hours) -> refresh task
+
+    async def async_get(self, entity_ids, hours=DEFAULT_HISTORY_HOURS):
+        if "recorder" not in self.hass.config.components:
+            return {}
+        _period, period_seconds = statistics_period(hours)
+        now = time.monotonic()
+        missing = []
+        refresh = []
+        for entity_id in entity_ids:
+            key = (entity_id, hours)
+            series = self._series.get(key)
+            if series is None:
+                missing.append(entity_id)
+            if key in self._pending:
+                continue
+            if series is None or series.fetched_at is None or now - series.fetched_at >= period_seconds:
+                refresh.append(entity_id)
+
+        if refresh:
+            task = self.hass.async_create_background_task(
+                self._async_refresh(refresh, hours),
+                "trmnl_dashboard history refresh",
+            )
+            for entity_id in refresh:
+                self._pending[(entity_id, hours)] = task
+
+        waiting = {self._pending[(entity_id, hours)] for entity_id in missing if (entity_id, hours) in self._pending}
+        if waiting:
+            _done, not_done = await asyncio.wait(waiting, timeout=self.timeout)
+            if not_done:
+                _LOGGER.debug(f"TRMNL Dashboard: statistics query still running after {self.timeout}s, pushing without it")
+
+        result = {}
+        for entity_id in entity_ids:
+            series = self._series.get((entity_id, hours))
+            if series is not None and series.sparkline is not None:
+                result[entity_id] = series.sparkline
+        return result
+
+    def async_invalidate(self, entity_ids=None):
+        if entity_ids is None:
+            self._series.clear()
+            return
+        entity_ids = set(entity_ids)
+        for key in [key for key in self._series if key[0] in entity_ids]:
+            del self._series[key]
+
+    async def _async_refresh(self, entity_ids, hours):
+        period, period_seconds = statistics_period(hours)
+        end = datetime.now(timezone.utc)
+        window_start = (end - timedelta(hours=hours)).timestamp()
+        series_by_id = {entity_id: self._series.setdefault((entity_id, hours), HistorySeries()) for entity_id in entity_ids}
+        # One query for the batch, from the oldest row any series still needs
+        since = min(series.query_start(window_start, period_seconds) for series in series_by_id.values())
+        queried_until = None
+        try:
+            async with asyncio.timeout(self.timeout * 3):
+                rows = await self._async_fetch(set(entity_ids), datetime.fromtimestamp(since, timezone.utc), period)
+            queried_until = end.timestamp()
+        except Exception as err:
+            # Keep serving the previous series; retry once the next period is compiled
+            _LOGGER.debug(f"TRMNL Dashboard: statistics query for {entity_ids} failed: {err}")
+            rows = {}
+        finally:
+            for entity_id in entity_ids:
+                self._pending.pop((entity_id, hours), None)
+        fetched_at = time.monotonic()
+        for entity_id, series in series_by_id.items():
+            last_start = series.last_start
+            added = [point for point in rows.get(entity_id, ()) if last_start is None or point[0] > last_start]
+            trimmed = 0
+            while trimmed < len(series.points) and series.points[trimmed][0] < window_start:
+                trimmed += 1
+            if added or trimmed:
+                del series.points[:trimmed]
+                series.points.extend(added)
+                series.sparkline = sparkline(series.points, window_start, end.timestamp(), hours)
+            series.fetched_at = fetched_at
+            if queried_until is not None:
+                series.queried_until = queried_until
+
+    async def _async_fetch(self, statistic_ids, start_time, period):
+        # (start timestamp, value) rows per statistic ID: the mean of measurements, or the
+        # state of totals and meters, which have no mean
+        from homeassistant.components.recorder import get_instance
+        from homeassistant.components.recorder.statistics import statistics_during_period
+
+        stats = await get_instance(self.hass).async_add_executor_job(
+            statistics_during_period,
+            self.hass,
+            start_time,
+            None,
+            statistic_ids,
+            period,
+            None,
+            {"mean", "state"},
+        )
+        rows = {}
+        for statistic_id, statistic_rows in stats.items():
+            points = rows[statistic_id] = []
+            for row in statistic_rows:
+                value = row.get("mean")
+                if value is None:
+                    value = row.get("state")
+                if value is None:
+                    continue
+                start = row["start"]
+                if isinstance(start, datetime):
+                    start = start.timestamp()
+                points.append((start, float(value)))
+        return rows
+
+def async_get_history_cache(hass):
+    # One cache per Home Assistant instance, shared by the entries and the config flows
+    from . import DOMAIN
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if "history_cache" not in domain_data:
+        domain_data["history_cache"] = HistoryCache(hass)
+    return domain_data["history_cache"]
@@ -0,0 +1,119 @@
+import gzip
+import json
+import logging
+import os
+
+from .display import (
+    DEFAULT_WEATHER_ICON,
+    ICON_MAP,
+    WEATHER_DETAIL_ICONS,
+    WEATHER_ICON_MAP,
+    entity_icon,
+    format_icon,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Local copy of the Material Design Icons path data, generated by scripts/build_icons.py,
+# so full.liquid does not have to fetch icons from api.iconify.design on every render
+ICON_STORE_PATH = os.path.join(os.path.dirname(__file__), "icons", "mdi.json.gz")
+
+# Every icon full.liquid picks on its own (icon maps, weather card, help-circle fallback).
+# These are inlined in the template as a sprite, so payloads only carry the paths of
+# custom icons set through entity icon attributes.
+TEMPLATE_ICONS = frozenset(
+    list(ICON_MAP.values())
+    + list(WEATHER_ICON_MAP.values())
+    + list(WEATHER_DETAIL_ICONS.values())
+    + [DEFAULT_WEATHER_ICON, format_icon(None)]
+)
+
+PAYLOAD_ICON_CACHE_SIZE = 32  # Distinct icon sets whose payload tables are kept
+
+def load_icon_store(path=ICON_STORE_PATH):
+    with open(path, "rb") as file:
+        return json.loads(gzip.decompress(file.read()))["icons"]
+
+def record_icon(record):
+    # Icon full.liquid shows for an entity record (getEntityIcon, then formatIconForUrl)
+    if record.get("icon") is not None:
+        return format_icon(record["icon"])
+    if "display" in record:
+        return format_icon(record["display"].get("i"))
+    attributes = record.get("attributes")
+    if attributes is None:
+        return format_icon(None)
+    if not attributes.get("icon") and record.get("error"):
+        return ICON_MAP["error"]
+    return entity_icon((record.get("entity_id") or "").split(".", 1)[0], attributes)
+
+def dashboard_icons(webhook_data):
+    # The exact set of icons a snapshot renders with
+    configuration = webhook_data.get("configuration") or {}
+    icons = {record_icon(pill) for pill in webhook_data.get("pills", [])}
+    if configuration.get("show_entity_icon") != "false":
+        for group in webhook_data.get("groups", []):
+            icons.update(group_icons(group))
+    for viz in webhook_data.get("visualizations", []):
+        icons.update(visualization_icons(viz))
+    return icons
+
+def group_icons(group):
+    # Icons of a group's entities, or the one icon of an aggregate group's cards
+    if "summary" in group:
+        return {format_icon(group["summary"].get("icon"))}
+    return {record_icon(entity) for entity in group.get("entities", [])}
+
+def visualization_icons(viz):
+    # Icons of a weather card: condition, detail rows and forecast days
+    if not (viz.get("entity_id") or "").startswith("weather."):
+        return set()
+    attributes = viz.get("attributes") or {}
+    icons = {WEATHER_ICON_MAP.get(viz.get("state"), DEFAULT_WEATHER_ICON)}
+    icons.update(icon for key, icon in WEATHER_DETAIL_ICONS.items() if attributes.get(key) is not None)
+    icons.update(WEATHER_ICON_MAP.get(day.get("condition"), DEFAULT_WEATHER_ICON) for day in (viz.get("forecast") or [])[:5])
+    return icons
+
+class IconStore:
+    # Path data of every MDI icon, read from disk once per Home Assistant run and shared
+    # by all entries. Payload icon tables are cached per icon set, so pushes of an
+    # unchanged dashboard reuse the same table.
+
+    def __init__(self, paths):
+        self._paths = paths
+        self._payload_icons = {}  # frozenset of icons -> {icon: path}
+
+    def path(self, icon):
+        prefix, _, name = format_icon(icon).partition(":")
+        return self._paths.get(name) if prefix == "mdi" else None
+
+    def payload_icons(self, icons):
+        icons = frozenset(icon for icon in icons if icon not in TEMPLATE_ICONS)
+        table = self._payload_icons.get(icons)
+        if table is None:
+            if len(self._payload_icons) >= PAYLOAD_ICON_CACHE_SIZE:
+                self._payload_icons.clear()
+            table = self._payload_icons[icons] = {
+                icon: self.path(icon) for icon in sorted(icons) if self.path(icon)
+            }
+        return table
+
+def _load_icon_store():
+    try:
+        return IconStore(load_icon_store())
+    except (OSError, ValueError, KeyError) as e:
+        # Without the store custom icons fall back to api.iconify.design in the template
+        _LOGGER.warning(f"TRMNL Dashboard: could not read the icon store: {e}")
+        return IconStore({})
+
+async def async_get_icon_store(hass):
+    from . import DOMAIN
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    store = domain_data.get("icon_store")
+    if isinstance(store, IconStore):
+        return store
+    if store is None:
+        # Callers arriving while the file is read wait for the same load
+        store = domain_data["icon_store"] = hass.async_add_executor_job(_load_icon_store)
+    store = domain_data["icon_store"] = await store
+    return store
@@ -0,0 +1,137 @@
+// Sidebar panel of the TRMNL Dashboard integration: renders an entry's dashboard locally
+// from /api/trmnl_dashboard/preview, which builds and encodes the payload a push would
+// send and renders full.liquid with it. Nothing is sent to TRMNL, so no webhook quota is
+// spent. The page is polled while the panel is open; unchanged pages are not sent again.
+const REFRESH_INTERVAL = 10000;
+
+class TrmnlDashboardPanel extends HTMLElement {
+  set hass(hass) {
+    this._hass = hass;
+    if (!this._root) {
+      this._setup();
+      this._loadEntries();
+    }
+  }
+
+  connectedCallback() {
+    if (!this._timer) {
+      this._timer = setInterval(() => this._refresh(), REFRESH_INTERVAL);
+    }
+  }
+
+  disconnectedCallback() {
+    clearInterval(this._timer);
+    this._timer = null;
+  }
+
+  _setup() {
+    this._root = this.attachShadow({ mode: 'open' });
+    this._root.innerHTML = `
+      <style>
+        :host { display: block; padding: 16px; color: var(--primary-text-color); background: var(--primary-background-color); min-height: 100%; box-sizing: border-box; font-family: var(--paper-font-body1_-_font-family, sans-serif); }
+        .toolbar { display: flex; flex-wrap: wrap; gap: 8px; align-items: center; margin-bottom: 12px; }
+        select, button { font: inherit; padding: 4px 8px; }
+        .stats { display: flex; flex-wrap: wrap; gap: 16px; margin-bottom: 12px; }
+        .stat span { display: block; font-size: 0.8em; color: var(--secondary-text-color); }
+        .over { color: var(--error-color, #db4437); }
+        .error { color: var(--error-color, #db4437); margin-bottom: 12px; }
+        iframe { width: 800px; height: 480px; border: 1px solid var(--divider-color, #ccc); background: #fff; }
+      </style>
+      <h1>TRMNL Dashboard preview</h1>
+      <div class="toolbar">
+        <select id="entry"></select>
+        <select id="target"></select>
+        <button id="refresh">Refresh</button>
+      </div>
+      <div class="error" id="error" hidden></div>
+      <div class="stats" id="stats"></div>
+      <iframe id="frame" sandbox="allow-scripts" title="Dashboard preview"></iframe>
+    `;
+    this._entrySelect = this._root.getElementById('entry');
+    this._targetSelect = this._root.getElementById('target');
+    this._entrySelect.addEventListener('change', () => this._select(0));
+    this._targetSelect.addEventListener('change', () => this._select(Number(this._targetSelect.value)));
+    this._root.getElementById('refresh').addEventListener('click', () => this._refresh());
+  }
+
+  async _loadEntries() {
+    try {
+      this._entries = await this._hass.callApi('GET', 'trmnl_dashboard/preview');
+    } catch (err) {
+      this._showError(err);
+      return;
+    }
+    this._entrySelect.innerHTML = this._entries
+      .map(entry => `<option value="${entry.entry_id}">${this._escape(entry.title)}</option>`)
+      .join('');
+    if (!this._entries.length) {
+      this._showError('No TRMNL Dashboard entry is set up.');
+      return;
+    }
+    this._select(0);
+  }
+
+  _select(target) {
+    const entry = this._entries.find(item => item.entry_id === this._entrySelect.value);
+    this._targetSelect.innerHTML = entry.targets
+      .map((label, index) => `<option value="${index}">${this._escape(label)}</option>`)
+      .join('');
+    this._targetSelect.value = String(target);
+    this._targetSelect.hidden = entry.targets.length < 2;
+    this._fingerprint = null;
+    this._refresh();
+  }
+
+  async _refresh() {
+    const entryId = this._entrySelect && this._entrySelect.value;
+    if (!this._hass || !entryId || this._loading) {
+      return;
+    }
+    this._loading = true;
+    const params = new URLSearchParams({ target: this._targetSelect.value || '0' });
+    if (this._fingerprint) {
+      params.set('fingerprint', this._fingerprint);
+    }
+    try {
+      const preview = await this._hass.callApi('GET', `trmnl_dashboard/preview/${entryId}?${params}`);
+      if (preview.html !== null) {
+        this._root.getElementById('frame').srcdoc = preview.html;
+      }
+      this._fingerprint = preview.fingerprint;
+      this._showStats(preview);
+      this._root.getElementById('error').hidden = true;
+    } catch (err) {
+      this._showError(err);
+    } finally {
+      this._loading = false;
+    }
+  }
+
+  _showStats(preview) {
+    const over = preview.dropped > 0;
+    const stats = [
+      ['Payload', `<span class="${over ? 'over' : ''}">${preview.payload_bytes} / ${preview.max_payload_bytes} B</span>`, preview.payload_format],
+      ['Dropped to fit', preview.dropped, 'items'],
+      ['Entities', preview.entities, `${preview.groups} groups shown`],
+      ['Build', `${preview.build_ms} ms`, `+ ${preview.fetch_ms} ms forecasts and graphs`],
+      ['Render', `${preview.render_ms} ms`, preview.html === null ? 'unchanged' : 'updated'],
+    ];
+    this._root.getElementById('stats').innerHTML = stats
+      .map(([label, value, detail]) => `<div class="stat"><span>${label}</span>${value} <span>${detail}</span></div>`)
+      .join('');
+  }
+
+  _showError(err) {
+    const error = this._root.getElementById('error');
+    error.textContent = (err && (err.body && err.body.message || err.message)) || String(err);
+    error.hidden = false;
+  }
+
+  _escape(text) {
+    const span = document.createElement('span');
+    span.textContent = text;
+    return span.innerHTML;
+  }
+}
+
+customElements.define('trmnl-dashboard-panel', TrmnlDashboardPanel);
@@ -1,12 +1,66 @@
-from homeassistant.components.frontend import async_register_built_in_panel
+import hashlib
+import os
 
-async def async_setup_entry(hass, entry):
-    await async_register_built_in_panel(
+from aiohttp import web
+from homeassistant.components import frontend, panel_custom
+from homeassistant.components.http import HomeAssistantView
+
+from . import DOMAIN
+from .preview import async_register_views as async_register_preview_views
+
+# Sidebar panel previewing each entry's dashboard (see preview.py). The panel is one
+# web component served by the integration, so no static directory has to be registered.
+PANEL_URL_PATH = "trmnl-webhook"
+PANEL_COMPONENT = "trmnl-dashboard-panel"
+PANEL_SCRIPT_URL = "/api/trmnl_dashboard/panel.js"
+PANEL_SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "panel.js")
+
+def _read_script(path=PANEL_SCRIPT_PATH):
+    with open(path, "rb") as file:
+        return file.read()
+
+class TrmnlPanelScriptView(HomeAssistantView):
+    # Loaded by the frontend as a module, which sends no auth header; the script holds
+    # no data, everything it shows comes from the authenticated preview API
+    url = PANEL_SCRIPT_URL
+    name = "api:trmnl_dashboard:panel"
+    requires_auth = False
+
+    def __init__(self, script):
+        self._script = script
+        # Hash of the script in its URL, so an update that changes it busts the cache even
+        # when the integration version stays the same
+        self.version = hashlib.sha256(script).hexdigest()[:16]
+
+    async def get(self, request):
+        return web.Response(
+            body=self._script,
+            content_type="text/javascript",
+            headers={"Cache-Control": "public, max-age=31536000, immutable"},
+        )
+
+async def async_register_panel(hass):
+    # One panel for all entries; it lists them itself
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if domain_data.get("panel"):
+        return
+    domain_data["panel"] = True
+    view = domain_data.get("panel_view")
+    if view is None:
+        view = domain_data["panel_view"] = TrmnlPanelScriptView(await hass.async_add_executor_job(_read_script))
+        hass.http.register_view(view)
+        async_register_preview_views(hass)
+    await panel_custom.async_register_panel(
         hass,
-        component_name="trmnl_dashboard_panel",
+        frontend_url_path=PANEL_URL_PATH,
+        webcomponent_name=PANEL_COMPONENT,
         sidebar_title="TRMNL Dashboard",
-        sidebar_icon="mdi:webhook",
-        frontend_url_path="trmnl-webhook",
+        sidebar_icon="mdi:monitor-dashboard",
+        module_url=f"{PANEL_SCRIPT_URL}?v={view.version}",
         require_admin=True,
     )
-    return True
+
+def async_remove_panel(hass):
+    domain_data = hass.data.get(DOMAIN, {})
+    if domain_data.pop("panel", False):
+        frontend.async_remove_panel(hass, PANEL_URL_PATH)
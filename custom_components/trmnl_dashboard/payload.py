@@ -0,0 +1,262 @@
+import logging
+from collections import Counter
+
+import orjson
+
+from .display import ICON_MAP, NUMERIC_RE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Attributes read by HomeAssistantRenderer in trmnl-plugin/src/full.liquid
+RENDERED_ATTRIBUTES = ("friendly_name", "icon", "device_class", "unit_of_measurement")
+
+# Extra attributes read by domain specific cards
+DOMAIN_ATTRIBUTES = {
+    "weather": (
+        "temperature",
+        "temperature_unit",
+        "humidity",
+        "pressure",
+        "pressure_unit",
+        "wind_speed",
+        "wind_speed_unit",
+        "cloud_coverage",
+        "visibility",
+        "visibility_unit",
+        "precipitation_unit",
+    ),
+}
+
+# The weather card shows entity.forecast.slice(0, 5) and reads only these keys
+FORECAST_DAYS = 5
+FORECAST_FIELDS = ("datetime", "condition", "temperature", "templow", "precipitation")
+
+# TRMNL rejects webhook bodies above 2 KB on the standard plan (5 KB for TRMNL+). The
+# default matches the standard plan, like the default push rate; TRMNL+ users raise it.
+DEFAULT_MAX_PAYLOAD_BYTES = 2048
+
+# Entity fields the renderer never shows, dropped first when over budget
+UNRENDERED_FIELDS = ("last_changed", "last_updated")
+
+# A record with display fields (precompute_display) is sent without the raw state and the
+# timestamps: the display fields are all the template reads. The record keeps them for
+# the group summaries, change detection and the local renderer. Records that also carry
+# raw attributes (the weather card) are sent whole.
+DISPLAY_SKIPPED_FIELDS = ("state",) + UNRENDERED_FIELDS
+
+def wire_record(record):
+    if "display" not in record or "attributes" in record:
+        return record
+    return {key: value for key, value in record.items() if key not in DISPLAY_SKIPPED_FIELDS}
+
+def project_attributes(entity_id, attributes):
+    domain = entity_id.split(".", 1)[0]
+    keys = RENDERED_ATTRIBUTES + DOMAIN_ATTRIBUTES.get(domain, ())
+    return {key: attributes[key] for key in keys if key in attributes}
+
+def project_forecast(forecast):
+    return [
+        {key: day[key] for key in FORECAST_FIELDS if key in day}
+        for day in (forecast or [])[:FORECAST_DAYS]
+    ]
+
+# Compact wire format: one deduplicated entity table with short keys, sections holding
+# indexes into it, and repeated icons/device classes/units interned in a string table.
+# Rows of display records carry the display fields instead of a state and attributes,
+# with icons, classes and units interned, and names and titles interned when several
+# rows share them (an index plus a table entry is longer than a unique name inline). The
+# class is left out when it is the entity's domain, the icon when it is the one the
+# template maps the class or domain to, and the numeric flag when it follows from the
+# value. Decoded by
+# HomeAssistantRenderer.decodeCompactPayload in full.liquid.
+PAYLOAD_FORMATS = ("standard", "compact")
+COMPACT_PLAIN_ATTRIBUTES = (("friendly_name", "n"),)
+COMPACT_INTERNED_ATTRIBUTES = (("icon", "o"), ("device_class", "c"), ("unit_of_measurement", "u"))
+COMPACT_INTERNED_DISPLAY = (("u", "u"),)
+COMPACT_SHARED_DISPLAY = (("n", "n"), ("t", "t"))
+# Entity fields encoded elsewhere in the compact form (or not rendered at all)
+COMPACT_SKIPPED_FIELDS = ("entity_id", "state", "attributes", "forecast", "history") + UNRENDERED_FIELDS
+
+def compact_payload(data):
+    strings = []
+    string_index = {}
+    rows = []
+    row_index = {}
+    display_rows = []
+
+    def intern(value):
+        if value not in string_index:
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    def entity_slot(entity):
+        entity_id = entity.get("entity_id")
+        key = entity_id if entity_id is not None else id(entity)
+        if key in row_index:
+            return row_index[key]
+        entity = wire_record(entity)
+        row = {"i": entity_id}
+        if "display" in entity and "state" not in entity:
+            display = entity["display"]
+            domain = (entity_id or "").split(".", 1)[0]
+            icon_class = display.get("c", domain)
+            if icon_class != domain:
+                row["c"] = intern(icon_class)
+            for name, short in COMPACT_INTERNED_DISPLAY:
+                if name in display:
+                    row[short] = intern(display[name])
+            for name, short in COMPACT_SHARED_DISPLAY:
+                if name in display:
+                    row[short] = display[name]
+            if display.get("i") != (ICON_MAP.get(icon_class) or ICON_MAP.get(domain) or ICON_MAP["default"]):
+                row["o"] = intern(display.get("i"))
+            row["v"] = display.get("v")
+            numeric = display.get("f", 0)
+            if numeric != bool(NUMERIC_RE.match(str(row["v"]))):
+                row["f"] = numeric
+            display_rows.append(row)
+            entity = {key: value for key, value in entity.items() if key != "display"}
+        elif "state" in entity:
+            row["s"] = entity["state"]
+        attributes = dict(entity.get("attributes") or {})
+        for name, short in COMPACT_PLAIN_ATTRIBUTES:
+            if name in attributes:
+                row[short] = attributes.pop(name)
+        for name, short in COMPACT_INTERNED_ATTRIBUTES:
+            if name in attributes:
+                row[short] = intern(attributes.pop(name))
+        if attributes:
+            row["a"] = attributes
+        extra = {key: value for key, value in entity.items() if key not in COMPACT_SKIPPED_FIELDS}
+        if extra:
+            row["x"] = extra
+        row_index[key] = len(rows)
+        rows.append(row)
+        return row_index[key]
+
+    groups = []
+    for group in data.get("groups", []):
+        compact_group = {key: value for key, value in group.items() if key not in ("groupName", "entities")}
+        compact_group["n"] = group.get("groupName")
+        compact_group["e"] = [entity_slot(entity) for entity in group.get("entities", [])]
+        groups.append(compact_group)
+    pills = [entity_slot(pill) for pill in data.get("pills", [])]
+    visualizations = []
+    for viz in data.get("visualizations", []):
+        compact_viz = {"e": entity_slot(viz)}
+        if "forecast" in viz:
+            # Forecast days as rows in FORECAST_FIELDS order
+            compact_viz["f"] = [[day.get(field) for field in FORECAST_FIELDS] for day in viz["forecast"]]
+        if "history" in viz:
+            compact_viz["h"] = viz["history"]
+        visualizations.append(compact_viz)
+
+    shared = Counter(row[short] for row in display_rows for _name, short in COMPACT_SHARED_DISPLAY if short in row)
+    for row in display_rows:
+        for _name, short in COMPACT_SHARED_DISPLAY:
+            if short in row and shared[row[short]] > 1:
+                row[short] = intern(row[short])
+
+    compact = {
+        "format": "compact",
+        "strings": strings,
+        "entities": rows,
+        "groups": groups,
+        "pills": pills,
+        "visualizations": visualizations,
+        "configuration": data.get("configuration", {}),
+    }
+    if "icons" in data:
+        compact["icons"] = data["icons"]
+    return compact
+
+def dumps(value):
+    # Compact JSON bytes. orjson encodes datetimes natively (RFC 3339); anything else it
+    # does not know is sent as its string form.
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+def encode_payload(data, payload_format="standard", fragments=None):
+    # fragments, when given, maps entity records to their pre-encoded JSON (RecordCache),
+    # so only entities that changed since the last push are encoded again
+    if payload_format == "compact":
+        data = compact_payload(data)
+    else:
+        data = with_fragments(data, wire_record if fragments is None else fragments.encoded)
+    return dumps({"merge_variables": data})
+
+def with_fragments(data, encoded):
+    # Copy of the snapshot with every entity passed through encoded(record)
+    return {
+        **data,
+        "groups": [
+            {**group, "entities": [encoded(entity) for entity in group.get("entities", [])]}
+            for group in data.get("groups", [])
+        ],
+        "pills": [encoded(pill) for pill in data.get("pills", [])],
+        "visualizations": [encoded(viz) for viz in data.get("visualizations", [])],
+    }
+
+def _encoded_size(value):
+    return len(dumps(value))
+
+def enforce_payload_budget(data, max_bytes=DEFAULT_MAX_PAYLOAD_BYTES, payload_format="standard", fragments=None):
+    # Returns (body, dropped) where body is the encoded webhook body fitting in max_bytes.
+    # Truncation is deterministic: unrendered timestamps go first, then the custom icon
+    # paths (the template falls back to fetching those), then items are dropped from the
+    # tail of the dashboard (last group backwards, then pills, then visualizations) so
+    # the same snapshot always loses the same entities.
+    body = encode_payload(data, payload_format, fragments)
+    if not max_bytes or len(body) <= max_bytes:
+        return body, 0
+
+    original_size = len(body)
+    groups = [
+        {**group, "entities": [_without_unrendered(entity) for entity in group.get("entities", [])]}
+        for group in data.get("groups", [])
+    ]
+    pills = [_without_unrendered(pill) for pill in data.get("pills", [])]
+    visualizations = [_without_unrendered(viz) for viz in data.get("visualizations", [])]
+    truncated = {**data, "groups": groups, "pills": pills, "visualizations": visualizations}
+
+    dropped = 0
+    body = encode_payload(truncated, payload_format)
+    if len(body) > max_bytes and "icons" in truncated:
+        del truncated["icons"]
+        body = encode_payload(truncated, payload_format)
+    size = len(body)
+    while size > max_bytes:
+        # Estimate the saving from the item size and re-encode once the estimate fits;
+        # the estimate is never below the real saving, so nothing is dropped needlessly
+        while size > max_bytes:
+            removed = _drop_last_item(truncated)
+            if removed is None:
+                break
+            dropped += 1
+            size -= removed
+        body = encode_payload(truncated, payload_format)
+        size = len(body)
+        if removed is None:
+            break
+
+    _LOGGER.warning(
+        f"TRMNL Dashboard: payload of {original_size} bytes exceeds the {max_bytes} byte limit, "
+        f"dropped {dropped} items from the end of the dashboard (now {len(body)} bytes)"
+    )
+    return body, dropped
+
+def _without_unrendered(entity):
+    return {key: value for key, value in entity.items() if key not in UNRENDERED_FIELDS}
+
+def _drop_last_item(data):
+    # Remove one item from the tail of the dashboard and return its approximate encoded size
+    groups = data["groups"]
+    if groups:
+        entities = groups[-1]["entities"]
+        if entities:
+            return _encoded_size(entities.pop()) + 1
+        return _encoded_size(groups.pop()) + 1
+    for key in ("pills", "visualizations"):
+        if data[key]:
+            return _encoded_size(data[key].pop()) + 1
+    return None
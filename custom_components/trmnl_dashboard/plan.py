@@ -0,0 +1,432 @@
+import time
+from collections import Counter
+from zoneinfo import ZoneInfo
+
+import orjson
+
+from .aggregate import DEFAULT_TOP_N, aggregate_group
+from .display import display_fields
+from .forecast import DEFAULT_FORECAST_TTL
+from .history import DEFAULT_HISTORY_HOURS, async_get_history_cache
+from .icons import async_get_icon_store, group_icons, record_icon, visualization_icons
+from .payload import DEFAULT_MAX_PAYLOAD_BYTES, DOMAIN_ATTRIBUTES, dumps, project_attributes, project_forecast, wire_record
+from .scheduler import DEFAULT_RATE_LIMIT
+from .shard import ShardSet, parse_page_urls
+from .significance import ChangeFilter, round_state
+from .webhook import canonical_json
+
+# Group config keys that shape the plan rather than being sent with the group
+GROUP_CONFIG_KEYS = ("entities", "selectors", "mode", "top_n")
+
+# Renderer settings sent in merge_variables.configuration, with their defaults
+CONFIGURATION_DEFAULTS = {
+    "layout": "groups",
+    "pill_position": "top",
+    "show_title_bar": "true",
+    "show_entity_title": "true",
+    "show_entity_icon": "true",
+    "scale": "normal",
+}
+
+def parse_targets(text):
+    # One target per line: "<webhook url>" or "<webhook url> | Group A, Group B"
+    targets = []
+    for line in (text or "").splitlines():
+        url, _, groups = line.partition("|")
+        url = url.strip()
+        if not url:
+            continue
+        group_names = [name.strip() for name in groups.split(",") if name.strip()]
+        targets.append(WebhookTarget(url, group_names or None))
+    return targets
+
+class WebhookTarget:
+    __slots__ = ("webhook_url", "group_names")
+
+    def __init__(self, webhook_url, group_names=None):
+        self.webhook_url = webhook_url
+        self.group_names = frozenset(group_names) if group_names else None  # None shows every group
+
+    def filter(self, webhook_data):
+        if self.group_names is None:
+            return webhook_data
+        return {
+            **webhook_data,
+            "groups": [group for group in webhook_data["groups"] if group.get("groupName") in self.group_names],
+        }
+
+class CachedRecord:
+    __slots__ = ("state_obj", "record", "fragment", "canonical")
+
+    def __init__(self, state_obj, record):
+        self.state_obj = state_obj
+        self.record = record
+        self.fragment = None  # Encoded JSON, filled on first use
+        self.canonical = None  # Canonical JSON for fingerprints, filled on first use
+
+class RecordCache:
+    # Serialized entity records shared by every entry and target. A record is rebuilt only
+    # when Home Assistant replaces the entity's State object, which it does on every state
+    # or attribute change, so one tick serializes each changed entity once. The encoded
+    # JSON of a record (and its canonical form for fingerprints) is kept next to it, so
+    # pushes only encode the entities that changed.
+
+    def __init__(self, time_zone=None):
+        self.time_zone = time_zone
+        self._records = {}  # (entity_id, precompute_display, precision) -> CachedRecord
+        self._by_record = {}  # id(record) -> CachedRecord, while the record is cached
+
+    def get(self, entity_id, state_obj, precompute_display=False, precision=None):
+        key = (entity_id, precompute_display, precision)
+        cached = self._records.get(key)
+        if cached is not None:
+            if cached.state_obj is state_obj:
+                return cached.record
+            del self._by_record[id(cached.record)]
+        record = entity_record(entity_id, state_obj, precompute_display, self.time_zone, precision)
+        cached = self._records[key] = CachedRecord(state_obj, record)
+        self._by_record[id(record)] = cached
+        return record
+
+    def encoded(self, record):
+        # Pre-encoded JSON of a record built by this cache, in its wire form, encoded on
+        # first use. Anything else (fallback configs, visualizations with a forecast
+        # attached) is returned in its wire form, unencoded.
+        cached = self._by_record.get(id(record))
+        if cached is None or cached.record is not record:
+            return wire_record(record)
+        if cached.fragment is None:
+            cached.fragment = orjson.Fragment(dumps(wire_record(record)))
+        return cached.fragment
+
+    def canonical(self, record):
+        # Like encoded(), in the form payload_fingerprint hashes
+        cached = self._by_record.get(id(record))
+        if cached is None or cached.record is not record:
+            return wire_record(record)
+        if cached.canonical is None:
+            cached.canonical = orjson.Fragment(canonical_json(wire_record(record)))
+        return cached.canonical
+
+    def discard(self, entity_ids):
+        entity_ids = set(entity_ids)
+        for key in [key for key in self._records if key[0] in entity_ids]:
+            del self._by_record[id(self._records.pop(key).record)]
+
+def async_get_record_cache(hass):
+    from . import DOMAIN
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if "record_cache" not in domain_data:
+        domain_data["record_cache"] = RecordCache(ZoneInfo(hass.config.time_zone))
+    return domain_data["record_cache"]
+
+def entity_record(entity_id, state_obj, precompute_display=False, time_zone=None, precision=None):
+    # precision, when given, rounds a numeric state to that many decimals
+    state = state_obj.state if precision is None else round_state(state_obj.state, precision)
+    if not precompute_display:
+        return {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": project_attributes(entity_id, state_obj.attributes),
+            "last_changed": state_obj.last_changed,
+            "last_updated": state_obj.last_updated,
+        }
+    # Display fields replace the raw attributes, except for cards that read attributes
+    # directly (the weather card)
+    record = {
+        "entity_id": entity_id,
+        "state": state,
+        "display": display_fields(entity_id, state, state_obj.attributes, time_zone),
+        "last_changed": state_obj.last_changed,
+        "last_updated": state_obj.last_updated,
+    }
+    if entity_id.split(".", 1)[0] in DOMAIN_ATTRIBUTES:
+        record["attributes"] = project_attributes(entity_id, state_obj.attributes)
+    return record
+
+def merge_entry_config(entry):
+    # Options override data
+    merged = dict(entry.data)
+    if entry.options:
+        merged.update(entry.options)
+    return merged
+
+class DashboardPlan:
+    # Compiled form of an entry config. Entities are deduplicated into a flat index and
+    # groups, pills and visualizations hold slots into it, so a snapshot reads each
+    # entity state once no matter how many sections show it.
+
+    def __init__(self, config, entity_index=None):
+        self.webhook_url = config.get("webhook_url")
+        self.update_mode = config.get("update_mode", "interval")
+        self.interval = config.get("interval", 60)
+        self.debounce = config.get("debounce", 5)
+        self.max_payload_bytes = config.get("max_payload_bytes", DEFAULT_MAX_PAYLOAD_BYTES)
+        self.payload_format = config.get("payload_format", "standard")
+        self.precompute_display = bool(config.get("precompute_display", False))
+        self.compress_payload = bool(config.get("compress_payload", False))
+        self.forecast_ttl = config.get("forecast_ttl", DEFAULT_FORECAST_TTL)
+        self.history_hours = int(config.get("history_hours", DEFAULT_HISTORY_HOURS))
+        self.rate_limit = config.get("rate_limit", DEFAULT_RATE_LIMIT)
+        self.device_refresh = config.get("device_refresh", 0)
+        # Local BYOS endpoint, enabled by setting an access token
+        self.byos_access_token = config.get("byos_access_token") or ""
+        self.byos_device_id = config.get("byos_device_id") or ""
+        self.byos_bit_depth = int(config.get("byos_bit_depth", 1))
+        self.configuration = {key: config.get(key, default) for key, default in CONFIGURATION_DEFAULTS.items()}
+        # Keeps insignificant state changes from marking snapshots dirty; None without rules
+        self.change_filter = ChangeFilter.from_config(config)
+        # The main webhook shows the whole dashboard, or its first page when page webhooks
+        # split it; additional targets may filter groups
+        page_urls = ([self.webhook_url] if self.webhook_url else []) + parse_page_urls(config.get("page_webhooks"))
+        self.shards = None
+        if len(page_urls) > 1:
+            self.shards = ShardSet(page_urls, self.max_payload_bytes, self.payload_format, self.configuration)
+            main_targets = self.shards.targets
+        else:
+            main_targets = [WebhookTarget(url) for url in page_urls]
+        self.targets = main_targets + parse_targets(config.get("additional_targets"))
+        self.target_urls = {target.webhook_url for target in self.targets}
+
+        self.entity_ids = []
+        self.fallbacks = []  # Config dict sent when the entity has no state
+        index = {}
+
+        def slot(entity):
+            entity_id = entity.get("entity_id")
+            if entity_id not in index:
+                index[entity_id] = len(self.entity_ids)
+                self.entity_ids.append(entity_id)
+                self.fallbacks.append(entity)
+            return index[entity_id]
+
+        def group_entities(group):
+            # Listed entities first, then those matched by the group's selectors
+            entities = group.get("entities", [])
+            if not group.get("selectors") or entity_index is None:
+                return entities
+            listed = {entity.get("entity_id") for entity in entities}
+            return entities + [
+                {"entity_id": entity_id} for entity_id in entity_index.resolve(group["selectors"]) if entity_id not in listed
+            ]
+
+        # With selectors the plan depends on the registries and is recompiled when they change
+        self.uses_selectors = any(group.get("selectors") for group in config.get("groups", []))
+        self.groups = [
+            (
+                {key: value for key, value in group.items() if key not in GROUP_CONFIG_KEYS},
+                [slot(entity) for entity in group_entities(group)],
+            )
+            for group in config.get("groups", [])
+        ]
+        # (mode, top_n) per group; groups not in "entities" mode send an aggregate
+        self.group_modes = [
+            (group.get("mode") or "entities", int(group.get("top_n") or DEFAULT_TOP_N))
+            for group in config.get("groups", [])
+        ]
+        self.aggregate_groups = [number for number, (mode, _top_n) in enumerate(self.group_modes) if mode != "entities"]
+        self.pills = [slot(pill) for pill in config.get("pills", [])]
+        self.visualizations = [slot(viz) for viz in config.get("visualizations", [])]
+        self.slot_index = index  # entity_id -> slot
+        # Groups each slot appears in, and how many rendered icons it contributes
+        self.slot_groups = [set() for _ in self.entity_ids]
+        self.icon_weights = [0] * len(self.entity_ids)
+        show_icons = self.configuration.get("show_entity_icon") != "false"
+        for number, (_group, slots) in enumerate(self.groups):
+            # Icons of aggregate groups are collected per snapshot from what they show
+            counts_icons = show_icons and self.group_modes[number][0] == "entities"
+            for slot in slots:
+                self.slot_groups[slot].add(number)
+                if counts_icons:
+                    self.icon_weights[slot] += 1
+        for slot in self.pills:
+            self.icon_weights[slot] += 1
+        self.pill_slots = frozenset(self.pills)
+        self.tracked_entities = [entity_id for entity_id in self.entity_ids if entity_id]
+        self.weather_entities = [
+            self.entity_ids[i] for i in self.visualizations
+            if (self.entity_ids[i] or "").startswith("weather.")
+        ]
+        # Any other visualization is drawn as a sparkline of its recorder statistics
+        self.history_entities = [
+            self.entity_ids[i] for i in self.visualizations
+            if self.entity_ids[i] and not self.entity_ids[i].startswith("weather.")
+        ]
+
+    @property
+    def push_on_change(self):
+        return self.update_mode == "state_change"
+
+    @property
+    def byos_enabled(self):
+        return bool(self.byos_access_token)
+
+    async def async_build(self, hass, forecast_cache, record_cache=None, timings=None, snapshot=None):
+        # timings, when given, receives the seconds spent fetching forecasts, history and
+        # building. With a MaterializedSnapshot of this plan only its dirty entities are
+        # read again.
+        started = time.perf_counter()
+        forecasts = await forecast_cache.async_get(self.weather_entities) if self.weather_entities else {}
+        forecasts_fetched = time.perf_counter()
+        histories = {}
+        if self.history_entities:
+            histories = await async_get_history_cache(hass).async_get(self.history_entities, self.history_hours)
+        icon_store = await async_get_icon_store(hass)
+        fetched = time.perf_counter()
+        if snapshot is not None:
+            webhook_data = snapshot.build(hass.states, forecasts, icon_store, histories)
+        else:
+            webhook_data = self.build(hass.states, forecasts, record_cache, icon_store, histories)
+        if timings is not None:
+            timings["forecast"] = forecasts_fetched - started
+            timings["history"] = fetched - forecasts_fetched
+            timings["build"] = time.perf_counter() - fetched
+        return webhook_data
+
+    def build(self, states, forecasts=None, record_cache=None, icon_store=None, histories=None):
+        # One-off snapshot of every entity
+        return MaterializedSnapshot(self, record_cache).build(states, forecasts, icon_store, histories)
+
+class MaterializedSnapshot:
+    # Snapshot of one plan kept between ticks. State change events mark entities dirty and
+    # a build reads only those again: groups holding a changed entity get a new entity list
+    # and every other list is reused by reference, as is the icon set, so a tick costs in
+    # proportion to what changed rather than to the size of the dashboard. Lists handed
+    # out in earlier snapshots are never modified.
+
+    def __init__(self, plan, record_cache=None):
+        self.plan = plan
+        self.record_cache = record_cache
+        self._records = None  # Record per plan slot, None until the first build
+        self._sources = [None] * len(plan.entity_ids)  # State each record was built from
+        self._dirty = set()  # Slots to read again on the next build
+        self._groups = None
+        self._pills = None
+        self._icon_counts = None  # Icon -> group and pill items showing it, once updated
+        self._icons = None
+
+    def mark_dirty(self, entity_id, state_obj=None):
+        # Returns False when the plan's change filter finds state_obj, the entity's new
+        # state, would not change what the dashboard shows; the entity then keeps its
+        # current record until a significant change
+        slot = self.plan.slot_index.get(entity_id)
+        if slot is None or self._records is None:
+            return True
+        change_filter = self.plan.change_filter
+        if change_filter is not None and state_obj is not None:
+            time_zone = self.record_cache.time_zone if self.record_cache is not None else None
+            if not change_filter.changed(entity_id, self._sources[slot], state_obj, time_zone):
+                return False
+        self._dirty.add(slot)
+        return True
+
+    def _read(self, states, slot):
+        # Records the State each record is built from, which the change filter compares against
+        entity_id = self.plan.entity_ids[slot]
+        state_obj = states.get(entity_id) if entity_id else None
+        self._sources[slot] = state_obj
+        if state_obj is None:
+            return self.plan.fallbacks[slot]
+        return self._record(slot, state_obj)
+
+    def _record(self, slot, state_obj):
+        plan = self.plan
+        entity_id = plan.entity_ids[slot]
+        precision = None
+        if plan.change_filter is not None:
+            precision = plan.change_filter.precision(entity_id, state_obj.attributes)
+        if self.record_cache is not None:
+            return self.record_cache.get(entity_id, state_obj, plan.precompute_display, precision)
+        return entity_record(entity_id, state_obj, plan.precompute_display, precision=precision)
+
+    def build(self, states, forecasts=None, icon_store=None, histories=None):
+        plan = self.plan
+        records = self._records
+        if records is None:
+            records = self._records = [self._read(states, slot) for slot in range(len(plan.entity_ids))]
+            self._groups = [self._group(number) for number in range(len(plan.groups))]
+            self._pills = [records[i] for i in plan.pills]
+        elif self._dirty:
+            self._update(states)
+
+        visualizations = []
+        for i in plan.visualizations:
+            record = records[i]
+            entity_id = plan.entity_ids[i]
+            # Attach the cached forecast for weather entities and the sparkline of others
+            if forecasts and entity_id in forecasts and record is not plan.fallbacks[i]:
+                record = {**record, "forecast": project_forecast(forecasts[entity_id])}
+            elif histories and entity_id in histories and record is not plan.fallbacks[i]:
+                record = {**record, "history": histories[entity_id]}
+            visualizations.append(record)
+
+        webhook_data = {
+            "groups": self._groups,
+            "pills": self._pills,
+            "visualizations": visualizations,
+            "configuration": dict(plan.configuration),
+        }
+        # Paths of the custom icons the template sprite lacks
+        if icon_store is not None:
+            if self._icons is None:
+                if self._icon_counts is not None:
+                    self._icons = frozenset(self._icon_counts)
+                else:
+                    self._icons = frozenset(
+                        record_icon(records[slot]) for slot, weight in enumerate(plan.icon_weights) if weight
+                    )
+            icons = set(self._icons)
+            if plan.configuration.get("show_entity_icon") != "false":
+                for number in plan.aggregate_groups:
+                    icons.update(group_icons(self._groups[number]))
+            for viz in visualizations:
+                icons.update(visualization_icons(viz))
+            icons = icon_store.payload_icons(icons)
+            if icons:
+                webhook_data["icons"] = icons
+        return webhook_data
+
+    def _group(self, number):
+        group, slots = self.plan.groups[number]
+        members = [self._records[i] for i in slots]
+        mode, top_n = self.plan.group_modes[number]
+        if mode == "entities":
+            return {**group, "entities": members}
+        return aggregate_group(group, mode, members, top_n)
+
+    def _update(self, states):
+        plan = self.plan
+        records = self._records
+        if self._icon_counts is None:
+            # Counted on the first update, so one-off snapshots never pay for it
+            self._icon_counts = Counter()
+            for slot, weight in enumerate(plan.icon_weights):
+                if weight:
+                    self._icon_counts[record_icon(records[slot])] += weight
+        changed_groups = set()
+        pills_changed = False
+        for slot in self._dirty:
+            record = self._read(states, slot)
+            old = records[slot]
+            if record is old:
+                continue
+            records[slot] = record
+            changed_groups.update(plan.slot_groups[slot])
+            pills_changed = pills_changed or slot in plan.pill_slots
+            weight = plan.icon_weights[slot]
+            if weight:
+                old_icon, icon = record_icon(old), record_icon(record)
+                if icon != old_icon:
+                    self._icon_counts[old_icon] -= weight
+                    if not self._icon_counts[old_icon]:
+                        del self._icon_counts[old_icon]
+                    self._icon_counts[icon] += weight
+                    self._icons = None
+        self._dirty.clear()
+        if changed_groups:
+            groups = list(self._groups)
+            for number in changed_groups:
+                groups[number] = self._group(number)
+            self._groups = groups
+        if pills_changed:
+            self._pills = [records[i] for i in plan.pills]
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+import orjson
+from homeassistant.components.http import KEY_HASS, HomeAssistantView
+
+from . import DOMAIN
+from .payload import enforce_payload_budget
+from .shard import ShardTarget
+
+_LOGGER = logging.getLogger(__name__)
+
+# Local preview: full.liquid rendered with the merge_variables a push would send, so a
+# dashboard can be checked in the sidebar panel without a cloud render or a webhook
+# request. The template ships with the integration as a copy of
+# trmnl-plugin/src/full.liquid, kept in sync by scripts/build_icons.py.
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "full.liquid")
+PREVIEW_URL = "/api/trmnl_dashboard/preview"
+PREVIEW_CACHE_SIZE = 16  # Rendered pages kept, a few per entry and target
+
+TAG_RE = re.compile(r"{{\s*(.*?)\s*}}|{%\s*(.*?)\s*%}", re.S)
+CONDITION_RE = re.compile(r"^([\w.]+)(?:\s*(==|!=)\s*(?:'([^']*)'|\"([^\"]*)\"))?$")
+
+def _lookup(variables, path):
+    value = variables
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def _condition(expression):
+    match = CONDITION_RE.match(expression)
+    if match is None:
+        raise ValueError(f"unsupported Liquid condition: {expression}")
+    path, operator, single, double = match.groups()
+    literal = single if single is not None else double
+    if operator is None:
+        # Liquid treats only nil and false as false
+        return lambda variables: _lookup(variables, path) not in (None, False)
+    if operator == "==":
+        return lambda variables: _lookup(variables, path) == literal
+    return lambda variables: _lookup(variables, path) != literal
+
+def _output(expression):
+    path, _, filter_name = expression.partition("|")
+    path, filter_name = path.strip(), filter_name.strip()
+    if filter_name == "json":
+        # Inlined in a <script>: "</" must not close it
+        return lambda variables: orjson.dumps(_lookup(variables, path), default=str).decode().replace("</", "<\\/")
+    if filter_name:
+        raise ValueError(f"unsupported Liquid filter: {filter_name}")
+
+    def render(variables):
+        value = _lookup(variables, path)
+        return "" if value is None else str(value)
+
+    return render
+
+def compile_liquid(source):
+    # The subset of Liquid full.liquid uses: {{ path }}, {{ path | json }} and if/elsif/
+    # else blocks comparing a path with a string. Returns render(variables) -> str.
+    root = []
+    stack = [(None, root)]  # (if node, list being filled)
+    position = 0
+    for match in TAG_RE.finditer(source):
+        stack[-1][1].append(source[position:match.start()])
+        position = match.end()
+        output, tag = match.groups()
+        if output is not None:
+            stack[-1][1].append(_output(output))
+            continue
+        name, _, argument = tag.partition(" ")
+        if name == "if":
+            node = ([(_condition(argument.strip()), [])], [])
+            stack[-1][1].append(node)
+            stack.append((node, node[0][0][1]))
+        elif name in ("elsif", "else", "endif") and stack[-1][0] is not None:
+            node = stack.pop()[0]
+            if name == "elsif":
+                node[0].append((_condition(argument.strip()), []))
+                stack.append((node, node[0][-1][1]))
+            elif name == "else":
+                stack.append((node, node[1]))
+        else:
+            raise ValueError(f"unsupported Liquid tag: {tag}")
+    if len(stack) > 1:
+        raise ValueError("unclosed Liquid if block")
+    root.append(source[position:])
+
+    def render_nodes(nodes, variables, parts):
+        for node in nodes:
+            if isinstance(node, str):
+                parts.append(node)
+            elif callable(node):
+                parts.append(node(variables))
+            else:
+                branches, otherwise = node
+                for condition, body in branches:
+                    if condition(variables):
+                        render_nodes(body, variables, parts)
+                        break
+                else:
+                    render_nodes(otherwise, variables, parts)
+
+    def render(variables):
+        parts = []
+        render_nodes(root, variables, parts)
+        return "".join(parts)
+
+    return render
+
+def _load_template(path=TEMPLATE_PATH):
+    with open(path, encoding="utf-8") as file:
+        return compile_liquid(file.read())
+
+class PreviewCache:
+    # Rendered HTML keyed by the fingerprint of the payload body it shows. The template is
+    # read and compiled once per Home Assistant run; a preview of an unchanged dashboard
+    # costs a snapshot build and a hash, and the panel is only sent HTML it lacks.
+
+    def __init__(self, template=None):
+        self.template = template
+        self.renders = 0
+        self._pages = OrderedDict()  # fingerprint -> html
+
+    def get(self, body):
+        fingerprint = hashlib.sha256(body).hexdigest()
+        html = self._pages.get(fingerprint)
+        if html is None:
+            html = self._pages[fingerprint] = self.template(orjson.loads(body)["merge_variables"])
+            self.renders += 1
+            if len(self._pages) > PREVIEW_CACHE_SIZE:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(fingerprint)
+        return fingerprint, html
+
+async def async_get_preview_cache(hass):
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    cache = domain_data.get("preview_cache")
+    if cache is None:
+        cache = domain_data["preview_cache"] = PreviewCache()
+    if cache.template is None:
+        cache.template = await hass.async_add_executor_job(_load_template)
+    return cache
+
+def preview_targets(plan):
+    # Labels of what can be previewed, named like the webhook devices; None stands for
+    # the whole dashboard of a plan without webhooks (local BYOS rendering only)
+    if not plan.targets:
+        return [("Dashboard", None)]
+    targets = []
+    for number, target in enumerate(plan.targets, start=1):
+        if isinstance(target, ShardTarget):
+            label = f"Webhook {number}: page {target.page + 1}/{len(target.shards.targets)}"
+        elif target.group_names:
+            label = f"Webhook {number}: {', '.join(sorted(target.group_names))}"
+        else:
+            label = f"Webhook {number}"
+        targets.append((label, target))
+    return targets
+
+async def async_preview_entry(hass, coordinator, target_number=0, known_fingerprint=None):
+    # Builds the entry's snapshot as a push would, encodes the chosen target's payload
+    # within the size limit and renders it; nothing is sent. The HTML is left out when
+    # the caller already holds the page with known_fingerprint.
+    plan = coordinator.plan
+    targets = preview_targets(plan)
+    target_number = min(max(target_number, 0), len(targets) - 1)
+    _label, target = targets[target_number]
+    timings = {}
+    webhook_data = await plan.async_build(
+        hass, coordinator.forecast_cache, coordinator.record_cache, timings, coordinator.snapshot
+    )
+    if target is not None:
+        webhook_data = target.filter(webhook_data)
+    body, dropped = enforce_payload_budget(webhook_data, plan.max_payload_bytes, plan.payload_format, coordinator.record_cache)
+    cache = await async_get_preview_cache(hass)
+    started = time.perf_counter()
+    fingerprint, html = cache.get(body)
+    return {
+        "entry_id": coordinator.entry.entry_id,
+        "title": coordinator.entry.title,
+        "targets": [target_label for target_label, _target in targets],
+        "target": target_number,
+        "fingerprint": fingerprint,
+        "html": None if fingerprint == known_fingerprint else html,
+        "payload_bytes": len(body),
+        "max_payload_bytes": plan.max_payload_bytes,
+        "payload_format": plan.payload_format,
+        "dropped": dropped,
+        "entities": len(plan.tracked_entities),
+        "groups": len(webhook_data["groups"]),
+        "build_ms": round(timings["build"] * 1000, 2),
+        "fetch_ms": round((timings["forecast"] + timings["history"]) * 1000, 2),
+        "render_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+def _coordinators(hass):
+    domain_data = hass.data.get(DOMAIN, {})
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        coordinator = domain_data.get(entry.entry_id)
+        if coordinator is not None:
+            yield coordinator
+
+class TrmnlPreviewListView(HomeAssistantView):
+    # Entries the panel can preview, with the targets of each
+    url = PREVIEW_URL
+    name = "api:trmnl_dashboard:preview"
+
+    async def get(self, request):
+        hass = request.app[KEY_HASS]
+        if not request["hass_user"].is_admin:
+            return self.json_message("Admin access required", status_code=403)
+        return self.json([
+            {
+                "entry_id": coordinator.entry.entry_id,
+                "title": coordinator.entry.title,
+                "targets": [label for label, _target in preview_targets(coordinator.plan)],
+            }
+            for coordinator in _coordinators(hass)
+        ])
+
+class TrmnlPreviewView(HomeAssistantView):
+    # ?target=<n> picks the webhook, ?fingerprint=<hex> skips HTML the panel already shows
+    url = PREVIEW_URL + "/{entry_id}"
+    name = "api:trmnl_dashboard:preview:entry"
+
+    async def get(self, request, entry_id):
+        hass = request.app[KEY_HASS]
+        if not request["hass_user"].is_admin:
+            return self.json_message("Admin access required", status_code=403)
+        coordinator = next((item for item in _coordinators(hass) if item.entry.entry_id == entry_id), None)
+        if coordinator is None:
+            return self.json_message("Entry not found", status_code=404)
+        try:
+            target_number = int(request.query.get("target", 0))
+        except ValueError:
+            target_number = 0
+        try:
+            preview = await async_preview_entry(hass, coordinator, target_number, request.query.get("fingerprint"))
+        except Exception as e:
+            _LOGGER.error(f"TRMNL Dashboard: preview of {coordinator.entry.title} failed: {e}")
+            return self.json_message(f"Preview failed: {e}", status_code=500)
+        return self.json(preview)
+
+def async_register_views(hass):
+    # Registered once; views cannot be removed again
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if domain_data.get("preview_views"):
+        return
+    domain_data["preview_views"] = True
+    for view in (TrmnlPreviewListView(), TrmnlPreviewView()):
+        hass.http.register_view(view)
@@ -0,0 +1,319 @@
+import io
+from datetime import datetime
+
+from .aggregate import summary_entities
+from .display import display_fields
+
+# Local renderer for the BYOS endpoint: draws the groups/pills/visualizations layout of
+# full.liquid straight onto an e-ink frame, so the device never needs the TRMNL cloud.
+# Pillow is imported on first render only.
+WIDTH = 800
+HEIGHT = 480
+BIT_DEPTHS = (1, 2)
+MARGIN = 10
+GAP = 8
+PADDING = 6
+TITLE_BAR_HEIGHT = 34
+SIDE_PILLS_WIDTH = 190
+LIGHT_GRAY = 225
+
+# (body, heading, hero) font sizes per scale setting
+FONT_SIZES = {
+    "small": (14, 16, 30),
+    "normal": (17, 20, 38),
+    "big": (22, 26, 46),
+}
+
+WEATHER_DETAILS = (
+    ("humidity", "Humidity", "%"),
+    ("pressure", "Pressure", "pressure_unit"),
+    ("wind_speed", "Wind", "wind_speed_unit"),
+)
+
+def _load_font(ImageFont, size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 or no FreeType: fixed size bitmap font
+        return ImageFont.load_default()
+
+def _entity_display(record, time_zone):
+    if "display" in record:
+        return record["display"]
+    entity_id = record.get("entity_id") or ""
+    return display_fields(entity_id, record.get("state"), record.get("attributes") or {}, time_zone)
+
+def _value_text(display):
+    return f"{display['v']} {display['u']}" if display.get("u") else str(display["v"])
+
+def _day_name(value, time_zone):
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        return str(value)[:3]
+    if time_zone is not None and moment.tzinfo is not None:
+        moment = moment.astimezone(time_zone)
+    return moment.strftime("%a")
+
+def _number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.1f}"
+    if isinstance(value, (int, float)):
+        return str(int(value))
+    return str(value)
+
+class _Canvas:
+    def __init__(self, Image, ImageDraw, ImageFont, width, height, scale, antialias):
+        self.image = Image.new("L", (width, height), 255)
+        self.draw = ImageDraw.Draw(self.image)
+        # 1-bit frames get unsmoothed glyphs: dithered antialiasing only blurs small text
+        self.draw.fontmode = "L" if antialias else "1"
+        body, heading, hero = FONT_SIZES.get(scale, FONT_SIZES["normal"])
+        self.body = _load_font(ImageFont, body)
+        self.heading = _load_font(ImageFont, heading)
+        self.hero = _load_font(ImageFont, hero)
+
+    def line_height(self, font):
+        left, top, right, bottom = self.draw.textbbox((0, 0), "Ag", font=font)
+        return bottom + 4
+
+    def text_width(self, text, font):
+        return self.draw.textlength(text, font=font)
+
+    def fit(self, text, font, width):
+        text = str(text)
+        if self.text_width(text, font) <= width:
+            return text
+        while text and self.text_width(text + "…", font) > width:
+            text = text[:-1]
+        return text + "…" if text else ""
+
+    def text(self, xy, text, font, width=None, anchor="la"):
+        if width is not None:
+            text = self.fit(text, font, width)
+        self.draw.text(xy, text, font=font, fill=0, anchor=anchor)
+
+class _FrameRenderer:
+    def __init__(self, canvas, data, time_zone):
+        self.canvas = canvas
+        self.time_zone = time_zone
+        configuration = data.get("configuration") or {}
+        self.layout = configuration.get("layout", "groups")
+        self.pill_position = configuration.get("pill_position", "top")
+        self.show_title_bar = configuration.get("show_title_bar") != "false"
+        self.show_entity_title = configuration.get("show_entity_title") != "false"
+        self.groups = data.get("groups") or []
+        self.pills = data.get("pills") or []
+        self.visualizations = [
+            viz for viz in data.get("visualizations") or []
+            if (viz.get("entity_id") or "").startswith("weather.") or viz.get("history")
+        ]
+
+    def render(self):
+        canvas = self.canvas
+        width, height = canvas.image.size
+        left, top, right, bottom = MARGIN, MARGIN, width - MARGIN, height - MARGIN
+        if self.show_title_bar:
+            bottom = self.draw_title_bar(left, right, bottom)
+        if not (self.groups or self.pills or self.visualizations):
+            canvas.text(((left + right) // 2, (top + bottom) // 2), "No entities configured", canvas.heading, anchor="mm")
+            return
+        if self.pills:
+            if self.pill_position == "bottom":
+                bottom = self.draw_pill_rows(left, right, bottom, from_bottom=True)
+            elif self.pill_position == "left":
+                self.draw_pill_column(left, top, left + SIDE_PILLS_WIDTH, bottom)
+                left += SIDE_PILLS_WIDTH + GAP
+            elif self.pill_position == "right":
+                self.draw_pill_column(right - SIDE_PILLS_WIDTH, top, right, bottom)
+                right -= SIDE_PILLS_WIDTH + GAP
+            else:
+                top = self.draw_pill_rows(left, right, top)
+        self.draw_sections(left, top, right, bottom)
+
+    def draw_title_bar(self, left, right, bottom):
+        canvas = self.canvas
+        bar_top = bottom - TITLE_BAR_HEIGHT
+        canvas.draw.rounded_rectangle((left, bar_top, right, bottom), radius=8, fill=LIGHT_GRAY)
+        canvas.text((left + 12, (bar_top + bottom) // 2), "Home Assistant Dashboard", canvas.heading, anchor="lm")
+        return bar_top - GAP
+
+    def pill_text(self, record):
+        display = _entity_display(record, self.time_zone)
+        if self.show_entity_title:
+            return f"{display['n']}: {_value_text(display)}"
+        return _value_text(display)
+
+    def draw_pill_rows(self, left, right, edge, from_bottom=False):
+        # Pills flow left to right and wrap; returns the edge left over for the sections
+        canvas = self.canvas
+        pill_height = canvas.line_height(canvas.body) + 2 * PADDING
+        rows = [[]]
+        used = 0
+        for record in self.pills:
+            text = canvas.fit(self.pill_text(record), canvas.body, right - left - 2 * PADDING)
+            pill_width = canvas.text_width(text, canvas.body) + 2 * PADDING
+            if rows[-1] and used + pill_width > right - left:
+                rows.append([])
+                used = 0
+            rows[-1].append((text, pill_width))
+            used += pill_width + GAP
+        if from_bottom:
+            rows.reverse()
+        for row in rows:
+            row_width = sum(pill_width for _, pill_width in row) + GAP * (len(row) - 1)
+            x = left + (right - left - row_width) / 2
+            y = edge - pill_height if from_bottom else edge
+            for text, pill_width in row:
+                canvas.draw.rounded_rectangle((x, y, x + pill_width, y + pill_height), radius=pill_height // 2, outline=0, width=2)
+                canvas.text((x + PADDING, y + pill_height / 2), text, canvas.body, anchor="lm")
+                x += pill_width + GAP
+            edge = edge - pill_height - GAP if from_bottom else edge + pill_height + GAP
+        return edge
+
+    def draw_pill_column(self, left, top, right, bottom):
+        canvas = self.canvas
+        pill_height = canvas.line_height(canvas.body) + 2 * PADDING
+        total = len(self.pills) * (pill_height + GAP) - GAP
+        y = top + max(0, (bottom - top - total) // 2)
+        for record in self.pills:
+            if y + pill_height > bottom:
+                break
+            canvas.draw.rounded_rectangle((left, y, right, y + pill_height), radius=pill_height // 2, outline=0, width=2)
+            canvas.text((left + PADDING, y + pill_height / 2), self.pill_text(record), canvas.body, width=right - left - 2 * PADDING, anchor="lm")
+            y += pill_height + GAP
+
+    def draw_sections(self, left, top, right, bottom):
+        # Weather and graph cards span the full width; groups fill columns, each card going
+        # to the shortest column (cards in the "groups" layout, plain lists in the "list" layout)
+        for viz in self.visualizations:
+            if top >= bottom:
+                return
+            draw = self.draw_sparkline if "history" in viz else self.draw_weather
+            top = draw(viz, left, top, right, bottom) + GAP
+        if not self.groups or top >= bottom:
+            return
+        columns = 2 if self.layout == "list" else max(1, min(3, len(self.groups)))
+        column_width = (right - left - GAP * (columns - 1)) / columns
+        column_tops = [top] * columns
+        for group in self.groups:
+            column = column_tops.index(min(column_tops))
+            x = left + column * (column_width + GAP)
+            column_tops[column] = self.draw_group(group, x, column_tops[column], x + column_width, bottom) + GAP
+
+    def draw_group(self, group, left, top, right, bottom):
+        canvas = self.canvas
+        boxed = self.layout != "list"
+        row_height = canvas.line_height(canvas.body)
+        header_height = canvas.line_height(canvas.heading) + PADDING
+        entities = group.get("entities") or (summary_entities(group["summary"]) if "summary" in group else [])
+        height = header_height + len(entities) * row_height + 2 * PADDING
+        box_bottom = min(bottom, top + height)
+        if box_bottom - top < header_height + PADDING:
+            return top
+        if boxed:
+            canvas.draw.rounded_rectangle((left, top, right, box_bottom), radius=8, outline=0, width=2)
+        inner_left, inner_right = left + PADDING + 2, right - PADDING - 2
+        y = top + PADDING
+        canvas.text((inner_left, y), group.get("groupName") or "", canvas.heading, width=inner_right - inner_left)
+        y += header_height
+        canvas.draw.line((inner_left, y - PADDING // 2, inner_right, y - PADDING // 2), fill=LIGHT_GRAY if boxed else 0, width=1)
+        for record in entities:
+            if y + row_height > box_bottom:
+                break
+            display = _entity_display(record, self.time_zone)
+            value = _value_text(display)
+            value_width = canvas.text_width(value, canvas.body)
+            if self.show_entity_title:
+                canvas.text((inner_left, y), display["n"], canvas.body, width=inner_right - inner_left - value_width - GAP)
+            canvas.text((inner_right, y), value, canvas.body, width=inner_right - inner_left, anchor="ra")
+            y += row_height
+        return box_bottom
+
+    def draw_weather(self, viz, left, top, right, bottom):
+        canvas = self.canvas
+        attributes = viz.get("attributes") or {}
+        body_height = canvas.line_height(canvas.body)
+        hero_height = canvas.line_height(canvas.hero)
+        forecast = (viz.get("forecast") or [])[:5]
+        height = 2 * PADDING + hero_height + 2 * body_height
+        box_bottom = min(bottom, top + height)
+        canvas.draw.rounded_rectangle((left, top, right, box_bottom), radius=8, outline=0, width=2)
+        x = left + PADDING + 4
+        y = top + PADDING
+        temperature = attributes.get("temperature")
+        hero = f"{_number(temperature)}{attributes.get('temperature_unit', '')}" if temperature is not None else "N/A"
+        canvas.text((x, y), hero, canvas.hero)
+        condition = str(viz.get("state") or "").replace("-", " ").replace("_", " ").capitalize()
+        name = attributes.get("friendly_name") or (viz.get("display") or {}).get("n") or viz.get("entity_id")
+        canvas.text((x, y + hero_height), condition, canvas.heading, width=(right - left) / 3)
+        canvas.text((x, y + hero_height + body_height), name, canvas.body, width=(right - left) / 3)
+
+        details = []
+        for key, label, unit_key in WEATHER_DETAILS:
+            if attributes.get(key) is not None:
+                unit = unit_key if unit_key == "%" else attributes.get(unit_key, "")
+                details.append(f"{label} {_number(attributes[key])}{'' if unit == '%' else ' '}{unit}".rstrip())
+        detail_left = left + (right - left) / 3
+        forecast_left = left + (right - left) * 0.58
+        for i, detail in enumerate(details):
+            canvas.text((detail_left, y + i * body_height), detail, canvas.body, width=forecast_left - detail_left - GAP)
+
+        if forecast:
+            day_width = (right - PADDING - forecast_left) / len(forecast)
+            for i, day in enumerate(forecast):
+                center = forecast_left + day_width * (i + 0.5)
+                canvas.text((center, y), _day_name(day.get("datetime", ""), self.time_zone), canvas.heading, anchor="ma")
+                high = _number(day["temperature"]) if day.get("temperature") is not None else "-"
+                low = f"/{_number(day['templow'])}" if day.get("templow") is not None else ""
+                canvas.text((center, y + body_height + 4), f"{high}{low}°", canvas.body, width=day_width - 2, anchor="ma")
+                if day.get("precipitation"):
+                    canvas.text((center, y + 2 * body_height + 4), f"{_number(day['precipitation'])}", canvas.body, width=day_width - 2, anchor="ma")
+        return box_bottom
+
+    def draw_sparkline(self, viz, left, top, right, bottom):
+        canvas = self.canvas
+        history = viz["history"]
+        body_height = canvas.line_height(canvas.body)
+        height = 2 * PADDING + body_height + history["h"]
+        box_bottom = min(bottom, top + height)
+        if box_bottom - top < 2 * PADDING + body_height:
+            return top
+        canvas.draw.rounded_rectangle((left, top, right, box_bottom), radius=8, outline=0, width=2)
+        inner_left, inner_right = left + PADDING + 4, right - PADDING - 4
+        y = top + PADDING
+        display = _entity_display(viz, self.time_zone)
+        value = _value_text(display)
+        range_text = f"{history['hours']}h  min {_number(history['min'])}  max {_number(history['max'])}"
+        value_width = canvas.text_width(value, canvas.body)
+        canvas.text((inner_right, y), value, canvas.body, anchor="ra")
+        canvas.text((inner_left, y), f"{display['n']}  ·  {range_text}", canvas.body, width=inner_right - inner_left - value_width - GAP)
+        # Points are pixel coordinates in a w x h box, scaled to the width of the card
+        graph_top = y + body_height
+        graph_height = box_bottom - PADDING - graph_top
+        if graph_height > 2 and len(history["points"]) > 1:
+            x_scale = (inner_right - inner_left) / max(history["w"] - 1, 1)
+            y_scale = graph_height / max(history["h"] - 1, 1)
+            canvas.draw.line(
+                [(inner_left + x * x_scale, graph_top + y * y_scale) for x, y in history["points"]],
+                fill=0, width=2, joint="curve",
+            )
+        return box_bottom
+
+def render_frame(data, bit_depth=1, time_zone=None, width=WIDTH, height=HEIGHT):
+    # Returns (body, content_type, extension). 1-bit frames are BMPs as read by every
+    # TRMNL firmware, 2-bit frames 4-gray PNGs. Grays are Floyd-Steinberg dithered.
+    from PIL import Image, ImageDraw, ImageFont
+
+    canvas = _Canvas(Image, ImageDraw, ImageFont, width, height, (data.get("configuration") or {}).get("scale", "normal"), bit_depth > 1)
+    _FrameRenderer(canvas, data, time_zone).render()
+
+    buffer = io.BytesIO()
+    if bit_depth > 1:
+        palette = Image.new("P", (1, 1))
+        palette.putpalette([0, 0, 0, 85, 85, 85, 170, 170, 170, 255, 255, 255] + [0] * 756)
+        frame = canvas.image.convert("RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+        frame.save(buffer, "PNG", bits=2, optimize=True)
+        return buffer.getvalue(), "image/png", "png"
+    canvas.image.convert("1", dither=Image.Dither.FLOYDSTEINBERG).save(buffer, "BMP")
+    return buffer.getvalue(), "image/bmp", "bmp"
@@ -0,0 +1,94 @@
+import time
+
+DEFAULT_RATE_LIMIT = 12  # Webhook updates per hour accepted by TRMNL (30 for TRMNL+)
+BUCKET_BURST = 2  # Pushes that may be sent back to back with a full budget
+REFRESH_LEAD = 30  # Seconds before a device refresh by which the payload should be in
+LOW_BUDGET = 0.5  # Bucket fill level below which change-driven pushes are stretched out
+
+class TokenBucket:
+    # Push budget for one webhook URL: refills at rate_per_hour, holds at most `burst` tokens
+
+    def __init__(self, rate_per_hour=DEFAULT_RATE_LIMIT, burst=BUCKET_BURST):
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self.rate_per_hour = rate_per_hour
+        self.refill_interval = 3600 / rate_per_hour if rate_per_hour else 0.0
+
+    def set_rate(self, rate_per_hour):
+        self._refill()
+        self.rate_per_hour = rate_per_hour
+        self.refill_interval = 3600 / rate_per_hour if rate_per_hour else 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_interval:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) / self.refill_interval)
+        self._updated = now
+
+    @property
+    def fill(self):
+        if not self.refill_interval:
+            return 1.0
+        self._refill()
+        return self.tokens / self.capacity
+
+    def time_until_available(self):
+        # Seconds until a whole token is available (0 when unlimited or already there)
+        if not self.refill_interval:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.refill_interval
+
+    def consume(self):
+        if not self.refill_interval:
+            return
+        self._refill()
+        self.tokens = max(0.0, self.tokens - 1)
+
+class PushScheduler:
+    # Picks when a change-driven push is built. Pushes are held until just before the next
+    # device refresh (content replaced before the device wakes up is never seen), wait for
+    # a budget token, and are stretched out as the budget drains so more change is batched
+    # into each push.
+
+    def __init__(self, bucket, debounce, device_refresh=0, lead=REFRESH_LEAD):
+        self.bucket = bucket
+        self.debounce = debounce
+        self.device_refresh = device_refresh
+        self.lead = lead
+
+    def next_push_delay(self):
+        delay = float(self.debounce)
+        if self.device_refresh:
+            # Refresh slots are taken to be multiples of device_refresh on the wall clock
+            now = time.time()
+            slot = ((now + self.lead) // self.device_refresh + 1) * self.device_refresh - self.lead
+            delay = max(delay, slot - now)
+        delay = max(delay, self.bucket.time_until_available())
+        fill = self.bucket.fill
+        if fill < LOW_BUDGET:
+            delay = max(delay, self.bucket.refill_interval * (1 - fill))
+        return delay
+
+def estimate_push_interval(update_mode, interval, debounce, rate_limit=DEFAULT_RATE_LIMIT, device_refresh=0):
+    # Shortest spacing in seconds between two pushes once the budget has drained: the
+    # interval, or for change-driven pushes the debounce window or device refresh, but
+    # never shorter than the budget refill. Unchanged payloads are not sent at all.
+    spacing = interval if update_mode != "state_change" else max(debounce, device_refresh or 0)
+    if rate_limit:
+        spacing = max(spacing, 3600 / rate_limit)
+    return spacing
+
+def get_rate_bucket(hass, webhook_url, rate_per_hour=DEFAULT_RATE_LIMIT):
+    # Buckets are kept per webhook URL in hass.data so reloads cannot refill the budget
+    from . import DOMAIN
+    buckets = hass.data.setdefault(DOMAIN, {}).setdefault("rate_buckets", {})
+    bucket = buckets.get(webhook_url)
+    if bucket is None:
+        bucket = buckets[webhook_url] = TokenBucket(rate_per_hour)
+    elif bucket.rate_per_hour != rate_per_hour:
+        bucket.set_rate(rate_per_hour)
+    return bucket
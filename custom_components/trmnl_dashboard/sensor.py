@@ -0,0 +1,188 @@
+import hashlib
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+
+from . import DOMAIN
+
+# Diagnostic telemetry: one device per entry with the snapshot timings, and one device
+# per webhook target with its delivery counters. Values are read from the coordinator
+# and the deliveries when the entities are written, so recording them costs nothing.
+
+@dataclass(frozen=True, kw_only=True)
+class TrmnlSensorEntityDescription(SensorEntityDescription):
+    value_fn: Callable
+
+def _milliseconds(seconds):
+    return None if seconds is None else seconds * 1000
+
+ENTRY_SENSORS = (
+    TrmnlSensorEntityDescription(
+        key="setup_time",
+        translation_key="setup_time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=2,
+        value_fn=lambda coordinator: _milliseconds(coordinator.timings.get("setup")),
+    ),
+    TrmnlSensorEntityDescription(
+        key="build_time",
+        translation_key="build_time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=2,
+        value_fn=lambda coordinator: _milliseconds(coordinator.timings.get("build")),
+    ),
+    TrmnlSensorEntityDescription(
+        key="forecast_time",
+        translation_key="forecast_time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        value_fn=lambda coordinator: _milliseconds(coordinator.timings.get("forecast")),
+    ),
+    TrmnlSensorEntityDescription(
+        key="history_time",
+        translation_key="history_time",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        value_fn=lambda coordinator: _milliseconds(coordinator.timings.get("history")),
+    ),
+)
+
+TARGET_SENSORS = (
+    TrmnlSensorEntityDescription(
+        key="payload_bytes",
+        translation_key="payload_bytes",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda delivery: delivery.payload_bytes,
+    ),
+    TrmnlSensorEntityDescription(
+        key="latency_p50",
+        translation_key="latency_p50",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=0,
+        value_fn=lambda delivery: _milliseconds(delivery.latency.percentile(50)),
+    ),
+    TrmnlSensorEntityDescription(
+        key="latency_p95",
+        translation_key="latency_p95",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=0,
+        value_fn=lambda delivery: _milliseconds(delivery.latency.percentile(95)),
+    ),
+    TrmnlSensorEntityDescription(
+        key="pushes_sent",
+        translation_key="pushes_sent",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda delivery: delivery.sent,
+    ),
+    TrmnlSensorEntityDescription(
+        key="pushes_skipped",
+        translation_key="pushes_skipped",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda delivery: delivery.skipped,
+    ),
+    TrmnlSensorEntityDescription(
+        key="pushes_failed",
+        translation_key="pushes_failed",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda delivery: delivery.failed,
+    ),
+    TrmnlSensorEntityDescription(
+        key="last_success",
+        translation_key="last_success",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        value_fn=lambda delivery: delivery.last_success,
+    ),
+)
+
+def target_urls(plan):
+    return tuple(target.webhook_url for target in plan.targets)
+
+def _target_id(webhook_url):
+    # Webhook URLs are secrets, so targets are identified by a hash of theirs
+    return hashlib.sha256(webhook_url.encode("utf-8")).hexdigest()[:12]
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    # Set up again by the update listener when the entry's webhooks change
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    coordinator.sensor_targets = target_urls(coordinator.plan)
+    entry_device = DeviceInfo(
+        identifiers={(DOMAIN, entry.entry_id)},
+        name=entry.title,
+        manufacturer="TRMNL",
+        entry_type=DeviceEntryType.SERVICE,
+    )
+    entities = [
+        TrmnlTelemetrySensor(coordinator, description, f"{entry.entry_id}_{description.key}", entry_device, lambda: coordinator)
+        for description in ENTRY_SENSORS
+    ]
+    for number, target in enumerate(coordinator.plan.targets, start=1):
+        target_id = _target_id(target.webhook_url)
+        target_device = DeviceInfo(
+            identifiers={(DOMAIN, f"{entry.entry_id}_{target_id}")},
+            name=f"{entry.title} webhook {number}",
+            manufacturer="TRMNL",
+            entry_type=DeviceEntryType.SERVICE,
+            via_device=(DOMAIN, entry.entry_id),
+        )
+        entities.extend(
+            TrmnlTelemetrySensor(
+                coordinator,
+                description,
+                f"{entry.entry_id}_{target_id}_{description.key}",
+                target_device,
+                lambda url=target.webhook_url: coordinator.deliveries.get(url),
+            )
+            for description in TARGET_SENSORS
+        )
+    async_add_entities(entities)
+    # Devices (and with them the sensors) of webhooks no longer configured
+    identifiers = {(DOMAIN, entry.entry_id)} | {
+        (DOMAIN, f"{entry.entry_id}_{_target_id(url)}") for url in coordinator.sensor_targets
+    }
+    device_registry = dr.async_get(hass)
+    for device in dr.async_entries_for_config_entry(device_registry, entry.entry_id):
+        if not device.identifiers & identifiers:
+            device_registry.async_update_device(device.id, remove_config_entry_id=entry.entry_id)
+
+class TrmnlTelemetrySensor(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, coordinator, description, unique_id, device_info, source):
+        self.coordinator = coordinator
+        self.entity_description = description
+        self._attr_unique_id = unique_id
+        self._attr_device_info = device_info
+        self._source = source  # Returns the object value_fn reads (None until it exists)
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self.coordinator.async_add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self):
+        source = self._source()
+        return None if source is None else self.entity_description.value_fn(source)
@@ -0,0 +1,276 @@
+import logging
+
+from .aggregate import summary_entities
+from .history import SPARKLINE_HEIGHT
+from .icons import group_icons, record_icon, visualization_icons
+from .payload import DEFAULT_MAX_PAYLOAD_BYTES, dumps, encode_payload
+from .render import FONT_SIZES, GAP, HEIGHT, MARGIN, PADDING, TITLE_BAR_HEIGHT
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pages are packed to this share of the payload limit, so values growing between pushes
+# (longer states, a group gaining members) do not push a page over it
+SHARD_FILL = 0.8
+PILLS_PER_ROW = 4  # Pills assumed to share a row of the top or bottom pill bar
+ICON_TABLE_BYTES = len(b',"icons":{}')  # Frame of a page's icon table
+
+def parse_page_urls(text):
+    # One webhook URL per line
+    return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+def _line_height(size):
+    # Approximates _Canvas.line_height of the local renderer for a font size
+    return round(size * 1.2) + 4
+
+class PageGeometry:
+    # Estimated space of one 800x480 page, in the local renderer's pixels: the height
+    # each column leaves for group cards and the height a card takes. Good enough to
+    # decide which groups share a page; the template lays them out by itself.
+
+    def __init__(self, configuration, pill_count):
+        body, heading, hero = FONT_SIZES.get(configuration.get("scale"), FONT_SIZES["normal"])
+        self.row_height = _line_height(body)
+        self.header_height = _line_height(heading) + PADDING
+        self.weather_height = 2 * PADDING + _line_height(hero) + 2 * self.row_height + GAP
+        self.sparkline_height = 2 * PADDING + self.row_height + SPARKLINE_HEIGHT + GAP
+        self.columns = 2 if configuration.get("layout") == "list" else 3
+        height = HEIGHT - 2 * MARGIN
+        if configuration.get("show_title_bar") != "false":
+            height -= TITLE_BAR_HEIGHT + GAP
+        if pill_count and configuration.get("pill_position", "top") in ("top", "bottom"):
+            rows = -(-pill_count // PILLS_PER_ROW)
+            height -= rows * (self.row_height + 2 * PADDING + GAP)
+        self.column_height = height
+
+    def group_height(self, group):
+        rows = len(group.get("entities") or ()) or len(summary_entities(group["summary"]) if "summary" in group else ())
+        return self.header_height + rows * self.row_height + 2 * PADDING + GAP
+
+    def visualizations_height(self, visualizations):
+        return sum(
+            self.sparkline_height if "history" in viz else self.weather_height
+            for viz in visualizations
+        )
+
+class ShardTarget:
+    __slots__ = ("shards", "page", "webhook_url")
+
+    def __init__(self, shards, page, webhook_url):
+        self.shards = shards
+        self.page = page
+        self.webhook_url = webhook_url
+
+    def filter(self, webhook_data):
+        return self.shards.page(webhook_data, self.page)
+
+class ShardSet:
+    # One logical dashboard split over several webhooks, each a plugin instance shown as
+    # a page of a TRMNL playlist. Groups keep their order and are packed page by page by
+    # estimated payload bytes and card height; pills are repeated on every page and the
+    # visualizations go on the first. A page's bytes include the icon table entries its
+    # groups add, each icon counted once per page. The packing is kept while the plan lives, so groups
+    # do not hop between pages, and only redone when a changed page outgrows the limit.
+    # A page's payload is rebuilt only when one of its groups, the pills or the icon table
+    # changed, and otherwise handed out again as the same object, so each page's delivery
+    # skips it without re-hashing: only pages whose entities changed are pushed.
+
+    def __init__(self, webhook_urls, max_payload_bytes=DEFAULT_MAX_PAYLOAD_BYTES, payload_format="standard", configuration=None):
+        self.webhook_urls = list(webhook_urls)
+        self.max_payload_bytes = max_payload_bytes
+        self.payload_format = payload_format
+        self.configuration = configuration or {}
+        self.show_icons = self.configuration.get("show_entity_icon") != "false"
+        count = len(self.webhook_urls)
+        self.targets = [ShardTarget(self, page, url) for page, url in enumerate(self.webhook_urls)]
+        # Shown by the template in the title bar, e.g. "2/3"
+        self._configurations = [{**self.configuration, "page": f"{page + 1}/{count}"} for page in range(count)]
+        self.assignment = None  # Group numbers per page, packed from the first snapshot
+        self._groups = None  # Snapshot group list the pages were last cut from
+        self._base_bytes = [0] * count  # Estimated bytes of a page without groups
+        self._fitted = [True] * count  # Whether each page was estimated within the limit when packed
+        self._base_icons = [frozenset()] * count  # Icons of a page without groups (pills, visualizations)
+        self._sizes = {}  # id(group) -> (group, estimated bytes, icon names)
+        self._icon_sizes = {}  # icon name -> bytes of its icon table entry
+        self._pages = [None] * count  # (groups, pills, icons, icon names, payload) per page
+
+    def page(self, webhook_data, number):
+        groups = webhook_data["groups"]
+        if self.assignment is None:
+            self._pack(webhook_data)
+        elif groups is not self._groups and self._overflows(groups, webhook_data.get("icons")):
+            _LOGGER.debug("TRMNL Dashboard: a dashboard page outgrew the payload limit, packing the pages again")
+            self._pack(webhook_data)
+        self._groups = groups
+
+        pills = webhook_data["pills"]
+        icons = webhook_data.get("icons")
+        page_groups = [groups[i] for i in self.assignment[number]]
+        cached = self._pages[number]
+        if (
+            cached is None
+            or cached[1] is not pills
+            or cached[2] is not icons
+            or len(cached[0]) != len(page_groups)
+            or any(old is not new for old, new in zip(cached[0], page_groups))
+        ):
+            names = set()
+            if icons:
+                if self.show_icons:
+                    for group in page_groups:
+                        names.update(group_icons(group))
+                names.update(record_icon(pill) for pill in pills)
+            payload = {
+                "groups": page_groups,
+                "pills": pills,
+                "visualizations": [],
+                "configuration": self._configurations[number],
+            }
+            page_icons = {icon: path for icon, path in icons.items() if icon in names} if icons else None
+            if page_icons:
+                payload["icons"] = page_icons
+            cached = self._pages[number] = (page_groups, pills, icons, names, payload)
+        payload = cached[4]
+
+        visualizations = webhook_data["visualizations"]
+        if number == 0 and visualizations:
+            payload = {**payload, "visualizations": visualizations}
+            if icons:
+                names = set(cached[3])
+                for viz in visualizations:
+                    names.update(visualization_icons(viz))
+                page_icons = {icon: path for icon, path in icons.items() if icon in names}
+                if page_icons:
+                    payload["icons"] = page_icons
+        return payload
+
+    def _measure(self, group):
+        cached = self._sizes.get(id(group))
+        if cached is None or cached[0] is not group:
+            # Encoded on its own in the payload format, less the frame every page has, plus
+            # the comma separating it from the group before
+            size = 1 + len(encode_payload(
+                {"groups": [group], "pills": [], "visualizations": [], "configuration": {}}, self.payload_format
+            )) - len(encode_payload(
+                {"groups": [], "pills": [], "visualizations": [], "configuration": {}}, self.payload_format
+            ))
+            names = frozenset(group_icons(group)) if self.show_icons else frozenset()
+            cached = self._sizes[id(group)] = (group, size, names)
+        return cached
+
+    def _size(self, group):
+        return self._measure(group)[1]
+
+    def _icons_size(self, names, icons):
+        # Bytes of the icon table holding names; icons missing from the store are not sent
+        size = 0
+        for name in names:
+            entry = self._icon_sizes.get(name)
+            if entry is None:
+                path = icons.get(name)
+                # '"name":"path",', the last entry's comma paying for the table's frame
+                entry = self._icon_sizes[name] = 0 if path is None else len(dumps({name: path}))
+            size += entry
+        return size + ICON_TABLE_BYTES if size else 0
+
+    def _estimate(self, page, numbers, groups, icons):
+        size = self._base_bytes[page] + sum(self._size(groups[i]) for i in numbers)
+        if not icons:
+            return size
+        names = set(self._base_icons[page])
+        for i in numbers:
+            names.update(self._measure(groups[i])[2])
+        return size + self._icons_size(names, icons)
+
+    def _overflows(self, groups, icons):
+        # True when a page holding a changed group has grown over the payload limit; pages
+        # already over it when packed (the last one, out of pages) cannot be helped
+        if not self.max_payload_bytes:
+            return False
+        self._sizes = {id(group): self._sizes[id(group)] for group in groups if id(group) in self._sizes}
+        previous = self._groups
+        for page, numbers in enumerate(self.assignment):
+            if len(numbers) < 2 or not self._fitted[page] or all(groups[i] is previous[i] for i in numbers):
+                continue
+            if self._estimate(page, numbers, groups, icons) > self.max_payload_bytes:
+                return True
+        return False
+
+    def _pack(self, webhook_data):
+        # Next-fit: a group starts a new page when it would take the page over either
+        # estimate; a group too large for any page gets one of its own, and the last page
+        # takes whatever is left (the payload limit then trims it)
+        groups = webhook_data["groups"]
+        pills = webhook_data["pills"]
+        icons = webhook_data.get("icons")
+        count = len(self.webhook_urls)
+        geometry = PageGeometry(self.configuration, len(pills))
+        budget = self.max_payload_bytes * SHARD_FILL if self.max_payload_bytes else None
+
+        # Each page with its own configuration, whose page number may be a digit longer
+        self._base_bytes = [
+            len(encode_payload({"groups": [], "pills": pills, "visualizations": [], "configuration": configuration}, self.payload_format))
+            for configuration in self._configurations
+        ]
+        self._base_bytes[0] = len(encode_payload({
+            "groups": [],
+            "pills": pills,
+            "visualizations": webhook_data["visualizations"],
+            "configuration": self._configurations[0],
+        }, self.payload_format))
+        first_height = geometry.column_height - geometry.visualizations_height(webhook_data["visualizations"])
+        if icons:
+            pill_icons = frozenset(record_icon(pill) for pill in pills)
+            self._base_icons = [pill_icons] * count
+            self._base_icons[0] = pill_icons.union(*(visualization_icons(viz) for viz in webhook_data["visualizations"]))
+        else:
+            self._base_icons = [frozenset()] * count
+
+        def open_page(page):
+            # Bytes and icon names of a page before its groups
+            names = set(self._base_icons[page])
+            return self._base_bytes[page] + (self._icons_size(names, icons) if icons else 0), names
+
+        pages = [[]]
+        used, page_icons = open_page(0)
+        column_tops = [0] * geometry.columns
+        column_height = first_height
+        overflowed = False
+        self._sizes = {}
+        for number, group in enumerate(groups):
+            _group, size, names = self._measure(group)
+            if icons and not names <= page_icons:
+                # New icon entries, plus the table's frame when this starts the table
+                size += self._icons_size(page_icons | names, icons) - self._icons_size(page_icons, icons)
+            height = geometry.group_height(group)
+            column = column_tops.index(min(column_tops))
+            fits = (budget is None or used + size <= budget) and column_tops[column] + height <= column_height
+            if pages[-1] and not fits:
+                if len(pages) < count:
+                    pages.append([])
+                    used, page_icons = open_page(len(pages) - 1)
+                    if icons:
+                        size = self._size(group) + self._icons_size(page_icons | names, icons) - self._icons_size(page_icons, icons)
+                    column_tops = [0] * geometry.columns
+                    column_height = geometry.column_height
+                    column = 0
+                else:
+                    overflowed = True
+            pages[-1].append(number)
+            page_icons |= names
+            used += size
+            column_tops[column] += height
+        pages.extend([] for _ in range(count - len(pages)))
+        self._fitted = [
+            not self.max_payload_bytes
+            or self._estimate(page, numbers, groups, icons) <= self.max_payload_bytes
+            for page, numbers in enumerate(pages)
+        ]
+        if overflowed:
+            _LOGGER.warning(
+                f"TRMNL Dashboard: the dashboard does not fit in {count} pages; "
+                f"add a page webhook or the last page will be trimmed"
+            )
+        if pages != self.assignment:
+            self.assignment = pages
+            self._pages = [None] * count
+        _LOGGER.debug(f"TRMNL Dashboard: packed {len(groups)} groups into pages of {[len(page) for page in pages]} groups")
@@ -0,0 +1,140 @@
+import fnmatch
+import math
+
+from .display import NUMERIC_RE, display_fields
+
+# Change thresholds, one per line: "<entity ID or pattern> | <terms>" or
+# "device_class: <class> | <terms>", where the comma separated terms are an absolute
+# deadband ("0.5"), a relative one ("5%") and/or a rounding ("precision 0"). Entity lines
+# win over device class lines, and earlier lines over later ones.
+PRECISION_TERM = "precision"
+
+class ChangeRule:
+    __slots__ = ("absolute", "percent", "precision")
+
+    def __init__(self, absolute=None, percent=None, precision=None):
+        self.absolute = absolute
+        self.percent = percent
+        self.precision = precision
+
+    def within_deadband(self, old, new):
+        delta = abs(new - old)
+        if self.absolute is not None and delta < self.absolute:
+            return True
+        return self.percent is not None and delta < abs(old) * self.percent / 100
+
+def parse_rule(text):
+    # "0.5, 5%, precision 0" -> ChangeRule; raises ValueError on an unknown term
+    rule = ChangeRule()
+    for term in (term.strip() for term in text.split(",")):
+        if not term:
+            continue
+        if term.startswith(PRECISION_TERM):
+            rule.precision = int(term[len(PRECISION_TERM):].strip())
+        elif term.endswith("%"):
+            rule.percent = abs(float(term[:-1]))
+        else:
+            rule.absolute = abs(float(term))
+    return rule
+
+def parse_change_rules(text):
+    # ([(entity pattern, rule)], {device_class: rule}); malformed lines are skipped
+    entity_rules = []
+    class_rules = {}
+    for line in (text or "").splitlines():
+        target, _, terms = line.partition("|")
+        target = target.strip()
+        if not target or not terms.strip():
+            continue
+        try:
+            rule = parse_rule(terms)
+        except ValueError:
+            continue
+        kind, _, value = target.partition(":")
+        if kind.strip() == "device_class" and value.strip():
+            class_rules.setdefault(value.strip(), rule)
+        else:
+            entity_rules.append((target, rule))
+    return entity_rules, class_rules
+
+def round_state(state, precision):
+    # Numeric states rounded to precision decimals (negative rounds to tens, hundreds...)
+    if not state or not NUMERIC_RE.match(state):
+        return state
+    value = round(float(state), precision)
+    if not math.isfinite(value):
+        return state
+    return str(int(value)) if precision <= 0 else f"{value:.{precision}f}"
+
+def _numeric(state):
+    return bool(state) and NUMERIC_RE.match(state) is not None
+
+class ChangeFilter:
+    # Decides whether a state change shows on the dashboard, before it marks the snapshot
+    # dirty. A change is kept out when a numeric value moved less than its deadband away
+    # from the value on the dashboard, or when the entity's display fields (formatted
+    # value, name, icon, unit) come out the same. Comparing against the value shown
+    # rather than the previous state keeps slow drifts from slipping through unseen.
+    # With visible_only off, only entities with a rule are filtered.
+    #
+    # This runs for every state change of every tracked entity, so the raw states are
+    # compared first and display fields are formatted only when attributes changed or
+    # visible_only needs them.
+
+    def __init__(self, entity_rules=(), class_rules=None, visible_only=False):
+        self.entity_rules = list(entity_rules)
+        self.class_rules = class_rules or {}
+        self.visible_only = visible_only
+        self._rules = {}  # entity_id -> ChangeRule or None, for the lifetime of the plan
+
+    @classmethod
+    def from_config(cls, config):
+        entity_rules, class_rules = parse_change_rules(config.get("change_thresholds"))
+        visible_only = bool(config.get("visible_changes_only", False))
+        if not (entity_rules or class_rules or visible_only):
+            return None
+        return cls(entity_rules, class_rules, visible_only)
+
+    def rule(self, entity_id, attributes):
+        # Resolved once per entity: the plan is recompiled when the config changes
+        if entity_id not in self._rules:
+            rule = next((rule for pattern, rule in self.entity_rules if fnmatch.fnmatchcase(entity_id, pattern)), None)
+            device_class = attributes.get("device_class")
+            if rule is None and device_class:
+                rule = self.class_rules.get(device_class)
+            self._rules[entity_id] = rule
+        return self._rules[entity_id]
+
+    def precision(self, entity_id, attributes):
+        rule = self.rule(entity_id, attributes)
+        return None if rule is None else rule.precision
+
+    def changed(self, entity_id, shown, new, time_zone=None):
+        # shown is the State the entity's record on the dashboard was built from (None for
+        # a config fallback), new its latest State
+        if shown is None or entity_id.startswith("weather."):
+            # Config fallbacks, and weather cards, which render more than the display fields
+            return True
+        rule = self.rule(entity_id, new.attributes)
+        if rule is None and not self.visible_only:
+            return True
+        old_state, new_state = shown.state, new.state
+        if rule is not None and rule.precision is not None:
+            old_state, new_state = round_state(old_state, rule.precision), round_state(new_state, rule.precision)
+        deadband = rule is not None and (rule.absolute is not None or rule.percent is not None)
+        numeric = deadband and _numeric(old_state) and _numeric(new_state)
+        # Home Assistant hands an unchanged attribute dict over to the new State
+        if new.attributes is shown.attributes or new.attributes == shown.attributes:
+            if old_state == new_state:
+                return False
+            if numeric:
+                return not rule.within_deadband(float(old_state), float(new_state))
+            if not self.visible_only:
+                return True
+        old_display = display_fields(entity_id, old_state, shown.attributes, time_zone)
+        new_display = display_fields(entity_id, new_state, new.attributes, time_zone)
+        if old_display == new_display:
+            return False
+        if not numeric or {**old_display, "v": None} != {**new_display, "v": None}:
+            return True
+        return not rule.within_deadband(float(old_state), float(new_state))
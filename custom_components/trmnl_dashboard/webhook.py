@@ -1,15 +1,261 @@
+import asyncio
+import gzip
+import hashlib
 import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import orjson
+
+from .payload import DEFAULT_MAX_PAYLOAD_BYTES, enforce_payload_budget, wire_record, with_fragments
 
 _LOGGER = logging.getLogger(__name__)
 
-async def send_to_trmnl_webhook(session, data, webhook_url):
-    payload = {"merge_variables": data}
+REQUEST_TIMEOUT = 20  # Seconds per webhook request
+ERROR_BODY_LIMIT = 512  # Bytes of an error response kept for the log
+BASE_BACKOFF = 5  # Seconds before the first retry, doubled per consecutive failure
+MAX_BACKOFF = 600
+CIRCUIT_THRESHOLD = 5  # Consecutive failures that open the circuit breaker
+CIRCUIT_COOLDOWN = 900  # Seconds delivery stays paused once the circuit is open
+LATENCY_WINDOW = 100  # Round trips kept for the latency percentiles
+GZIP_LEVEL = 6
+
+# Entity fields that change on every state write but are never rendered by full.liquid
+VOLATILE_FIELDS = ("last_changed", "last_updated")
+
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {key: _strip_volatile(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+def canonical_json(value):
+    # Canonical form: volatile fields dropped, keys sorted, compact separators
+    return orjson.dumps(_strip_volatile(value), default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+def payload_fingerprint(data, fragments=None):
+    # fragments, when given, supplies the cached canonical form of unchanged entity records.
+    # Records are hashed as sent, so a state change the display fields hide pushes nothing.
+    data = with_fragments(data, wire_record if fragments is None else fragments.canonical)
+    return hashlib.sha256(canonical_json(data)).hexdigest()
+
+class LatencyWindow:
+    # Rolling window of webhook round trips. Recording is a deque append; percentiles are
+    # only computed when a telemetry sensor reads them.
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, percent):
+        # Nearest-rank percentile in seconds, None before the first sample
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[max(0, -(-len(ordered) * percent // 100) - 1)]
+
+class WebhookError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        # Rate limiting, server errors and transport failures (no status) are worth retrying;
+        # other 4xx responses (bad URL, payload too large) will fail the same way again
+        return self.status is None or self.status == 429 or self.status >= 500
+
+def parse_retry_after(value):
+    if not value:
+        return None
     try:
-        async with session.post(webhook_url, json=payload) as response:
-            resp_text = await response.text()
-            if response.status != 200:
-                _LOGGER.error(f"TRMNL Dashboard: Error response: {resp_text}")
-                raise Exception(f"Webhook error: {response.status} {resp_text}")
-    except Exception as ex:
-        _LOGGER.error(f"TRMNL Dashboard: Exception during webhook update: {ex}")
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+async def send_to_trmnl_webhook(session, data, webhook_url, max_bytes=DEFAULT_MAX_PAYLOAD_BYTES, timeout=REQUEST_TIMEOUT, payload_format="standard", fragments=None, compress=False):
+    # The body is encoded once and truncated to the size TRMNL accepts, then optionally
+    # gzipped (the limit applies to the JSON itself); returns the size sent
+    body, _dropped = enforce_payload_budget(data, max_bytes, payload_format, fragments)
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        body = gzip.compress(body, GZIP_LEVEL, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    try:
+        async with session.post(
+            webhook_url, data=body, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if 200 <= response.status < 300:
+                return len(body)
+            # Only a short excerpt of an error body is useful in the log
+            resp_text = (await response.content.read(ERROR_BODY_LIMIT)).decode("utf-8", "replace")
+            raise WebhookError(
+                f"Webhook error: {response.status} {resp_text}",
+                status=response.status,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+    except WebhookError:
         raise
+    except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+        raise WebhookError(f"Webhook request failed: {ex!r}") from ex
+
+class WebhookDelivery:
+    # Delivers payloads to one webhook URL. At most one request is in flight and at most
+    # one payload waits behind it; a newer payload replaces the waiting one. Failures are
+    # retried with exponential backoff and jitter (or after Retry-After), and repeated
+    # failures open a circuit breaker that pauses delivery for CIRCUIT_COOLDOWN seconds.
+    # With a rate bucket, every request waits for a token so TRMNL's hourly cap is respected.
+
+    def __init__(self, hass, session, webhook_url, max_payload_bytes=DEFAULT_MAX_PAYLOAD_BYTES, timeout=REQUEST_TIMEOUT, bucket=None):
+        self.hass = hass
+        self.session = session
+        self.webhook_url = webhook_url
+        self.max_payload_bytes = max_payload_bytes
+        self.timeout = timeout
+        self.bucket = bucket  # Optional TokenBucket every request is charged to
+        self.payload_format = "standard"
+        self.fragments = None  # Optional RecordCache holding pre-encoded entity records
+        self.compress = False  # Send gzip bodies
+        self.compress_rejected = False  # Set once the target answers a gzip body with 415
+        self.delivered_fingerprint = None
+        self.failures = 0  # Consecutive failed attempts
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_success = None  # datetime of the last delivered payload
+        self.payload_bytes = None  # Encoded size of the last delivered payload
+        self.latency = LatencyWindow()  # Round trips of successful requests
+        self.listener = None  # Called whenever the counters above change
+        self._pending = None  # (data, fingerprint)
+        self._submitted = None  # (data, fingerprint) of the last submission
+        self._inflight = None  # Fingerprint of the payload being sent
+        self._next_attempt = 0.0  # Monotonic time before which nothing is sent
+        self._circuit_open = False
+        self._task = None
+
+    @property
+    def circuit_open(self):
+        return self._circuit_open
+
+    def async_submit(self, data):
+        # Queue data for delivery; returns False when it matches what was (or is being) delivered.
+        # Snapshots are never modified once handed out, so a payload submitted again as the
+        # same object (an unchanged dashboard page) is not hashed again.
+        if self._submitted is not None and self._submitted[0] is data:
+            fingerprint = self._submitted[1]
+        else:
+            fingerprint = payload_fingerprint(data, self.fragments)
+            self._submitted = (data, fingerprint)
+        if self._pending is not None:
+            latest = self._pending[1]
+        elif self._inflight is not None:
+            latest = self._inflight
+        else:
+            latest = self.delivered_fingerprint
+        if fingerprint == latest:
+            self.skipped += 1
+            _LOGGER.debug(f"TRMNL Dashboard: payload unchanged, skipping push ({self.skipped} skipped)")
+            self._notify()
+            return False
+        self._pending = (data, fingerprint)
+        if self._task is None or self._task.done():
+            self._task = self.hass.async_create_background_task(
+                self._async_run(), f"trmnl_dashboard delivery {self.webhook_url}"
+            )
+        return True
+
+    def async_shutdown(self):
+        self._pending = None
+        self._submitted = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _async_run(self):
+        while self._pending is not None:
+            delay = self._next_attempt - time.monotonic()
+            if self.bucket is not None:
+                delay = max(delay, self.bucket.time_until_available())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            data, fingerprint = self._pending
+            self._pending = None
+            self._inflight = fingerprint
+            if self.bucket is not None:
+                self.bucket.consume()
+            started = time.perf_counter()
+            try:
+                size = await send_to_trmnl_webhook(
+                    self.session, data, self.webhook_url, self.max_payload_bytes, self.timeout,
+                    self.payload_format, self.fragments, self.compress and not self.compress_rejected,
+                )
+            except WebhookError as err:
+                self._handle_failure(err, data, fingerprint)
+            else:
+                self.latency.add(time.perf_counter() - started)
+                self.payload_bytes = size
+                self._handle_success(fingerprint)
+            finally:
+                self._inflight = None
+                self._notify()
+
+    def _notify(self):
+        if self.listener is not None:
+            self.listener()
+
+    def _handle_success(self, fingerprint):
+        if self._circuit_open:
+            _LOGGER.info("TRMNL Dashboard: webhook delivery recovered, closing circuit")
+        self.delivered_fingerprint = fingerprint
+        self.failures = 0
+        self.sent += 1
+        self.last_success = datetime.now(timezone.utc)
+        self._circuit_open = False
+        self._next_attempt = 0.0
+
+    def _handle_failure(self, err, data, fingerprint):
+        if err.status == 415 and self.compress and not self.compress_rejected:
+            # The target does not take gzip bodies: resend the payload uncompressed
+            _LOGGER.warning("TRMNL Dashboard: webhook does not accept compressed payloads, sending them uncompressed")
+            self.compress_rejected = True
+            if self._pending is None:
+                self._pending = (data, fingerprint)
+            return
+        self.failures += 1
+        self.failed += 1
+        if err.retryable and self._pending is None:
+            # Retry this payload unless a newer one arrived meanwhile
+            self._pending = (data, fingerprint)
+        delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1))
+        delay = random.uniform(delay / 2, delay)
+        if err.retry_after is not None:
+            delay = max(delay, err.retry_after)
+        if self.failures >= CIRCUIT_THRESHOLD:
+            delay = max(delay, CIRCUIT_COOLDOWN)
+            if not self._circuit_open:
+                _LOGGER.error(
+                    f"TRMNL Dashboard: {self.failures} consecutive webhook failures, "
+                    f"pausing delivery for {delay:.0f}s: {err}"
+                )
+            self._circuit_open = True
+        elif err.retryable:
+            _LOGGER.warning(f"TRMNL Dashboard: webhook update failed, retrying in {delay:.1f}s: {err}")
+        else:
+            _LOGGER.error(f"TRMNL Dashboard: webhook update rejected: {err}")
+        self._next_attempt = time.monotonic() + delay
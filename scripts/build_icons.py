@@ -0,0 +1,139 @@
+"""Rebuild the local MDI icon store and the icon sprite inlined in full.liquid.
+
+Run from the repository root:
+
+    python scripts/build_icons.py [--font materialdesignicons-webfont.ttf --scss _variables.scss]
+
+With --font and --scss (both from the @mdi/font package) the icon store in
+custom_components/trmnl_dashboard/icons/mdi.json.gz is regenerated from the MDI webfont,
+which needs fontTools. The sprite between the icon-sprite markers in
+trmnl-plugin/src/full.liquid is always regenerated from the store, for the icons listed
+in icons.TEMPLATE_ICONS, so run this after changing the icon maps. The template is then
+copied to custom_components/trmnl_dashboard/full.liquid, the copy the local preview
+renders, so run it after editing full.liquid as well.
+
+With --check nothing is written; it exits with an error when the sprite or the copy is
+out of date. CI runs it on every push.
+"""
+import argparse
+import gzip
+import importlib
+import json
+import re
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE_DIR = ROOT / "custom_components" / "trmnl_dashboard"
+TEMPLATE = ROOT / "trmnl-plugin" / "src" / "full.liquid"
+TEMPLATE_COPY = PACKAGE_DIR / "full.liquid"
+SPRITE_RE = re.compile(r"(<!-- icon-sprite:start -->).*?(<!-- icon-sprite:end -->)", re.S)
+
+
+def load_integration_module(name):
+    if "trmnl_dashboard" not in sys.modules:
+        package = types.ModuleType("trmnl_dashboard")
+        package.__path__ = [str(PACKAGE_DIR)]
+        package.DOMAIN = "trmnl_dashboard"
+        sys.modules["trmnl_dashboard"] = package
+    return importlib.import_module(f"trmnl_dashboard.{name}")
+
+
+def number(value):
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def build_store(font_path, scss_path, store_path):
+    from fontTools.pens.svgPathPen import SVGPathPen
+    from fontTools.pens.transformPen import TransformPen
+    from fontTools.ttLib import TTFont
+
+    scss = Path(scss_path).read_text()
+    version = re.search(r'\$mdi-version:\s*"([^"]+)"', scss).group(1)
+    codepoints = dict(re.findall(r'^\s*"([a-z0-9-]+)":\s*([0-9A-F]+),?$', scss, re.M))
+
+    font = TTFont(font_path)
+    glyph_set = font.getGlyphSet()
+    cmap = font.getBestCmap()
+    # Glyphs sit on a 512 unit em with the baseline 64 units up; MDI paths use a 24x24 box
+    scale = 24 / font["head"].unitsPerEm
+    ascent = font["hhea"].ascent
+
+    icons = {}
+    for name, codepoint in sorted(codepoints.items()):
+        glyph_name = cmap.get(int(codepoint, 16))
+        if glyph_name is None:
+            continue
+        pen = SVGPathPen(glyph_set, ntos=number)
+        glyph_set[glyph_name].draw(TransformPen(pen, (scale, 0, 0, -scale, 0, ascent * scale)))
+        path = pen.getCommands()
+        if path:
+            icons[name] = path
+
+    store = json.dumps({"version": version, "icons": icons}, separators=(",", ":"), sort_keys=True)
+    Path(store_path).write_bytes(gzip.compress(store.encode("utf-8"), 9, mtime=0))
+    print(f"Wrote {len(icons)} MDI {version} icons to {store_path}")
+
+
+def render_sprite(icons_module, template):
+    paths = icons_module.load_icon_store()
+    symbols = []
+    for icon in sorted(icons_module.TEMPLATE_ICONS):
+        name = icon.split(":", 1)[1]
+        if name not in paths:
+            print(f"Warning: {icon} is not in the icon store")
+            continue
+        symbols.append(f'        <symbol id="mdi-{name}" viewBox="0 0 24 24"><path d="{paths[name]}"/></symbol>')
+    sprite = '      <svg xmlns="http://www.w3.org/2000/svg" style="display: none" aria-hidden="true">\n' + "\n".join(symbols) + "\n      </svg>"
+
+    if not SPRITE_RE.search(template):
+        raise SystemExit("icon-sprite markers not found in full.liquid")
+    return SPRITE_RE.sub(lambda match: match.group(1) + "\n" + sprite + "\n      " + match.group(2), template, count=1), len(symbols)
+
+
+def build_sprite(icons_module):
+    template, count = render_sprite(icons_module, TEMPLATE.read_text())
+    TEMPLATE.write_text(template)
+    print(f"Inlined {count} icons into {TEMPLATE.relative_to(ROOT)}")
+
+
+def copy_template():
+    TEMPLATE_COPY.write_text(TEMPLATE.read_text())
+    print(f"Copied the template to {TEMPLATE_COPY.relative_to(ROOT)}")
+
+
+def check(icons_module):
+    template = TEMPLATE.read_text()
+    stale = []
+    if render_sprite(icons_module, template)[0] != template:
+        stale.append(f"the icon sprite in {TEMPLATE.relative_to(ROOT)}")
+    if not TEMPLATE_COPY.exists() or TEMPLATE_COPY.read_text() != template:
+        stale.append(f"{TEMPLATE_COPY.relative_to(ROOT)}")
+    if stale:
+        raise SystemExit(f"Out of date: {', '.join(stale)}; run python scripts/build_icons.py")
+    print("Icon sprite and template copy are up to date")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--font", help="materialdesignicons-webfont.ttf from @mdi/font")
+    parser.add_argument("--scss", help="scss/_variables.scss from @mdi/font")
+    parser.add_argument("--check", action="store_true", help="fail when the sprite or the template copy is out of date")
+    args = parser.parse_args()
+
+    icons_module = load_integration_module("icons")
+    if args.check:
+        check(icons_module)
+        return
+    if args.font or args.scss:
+        if not (args.font and args.scss):
+            parser.error("--font and --scss are needed together")
+        build_store(args.font, args.scss, icons_module.ICON_STORE_PATH)
+    build_sprite(icons_module)
+    copy_template()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Shared test setup.
+
+Tests of modules that do not need Home Assistant load them the way the benchmarks do,
+through benchmarks/fakes.py, and run with plain pytest. Tests that need a running Home
+Assistant use pytest-homeassistant-custom-component and are skipped without it.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+
+@pytest.fixture
+async def integration_dependencies(hass):
+    # Sets up what the integration depends on, for Home Assistant tests. The frontend needs
+    # hass_frontend, the built frontend of some 80 MB, which is not a test requirement; the
+    # integration only registers a panel with it, which works without it set up.
+    from homeassistant.setup import async_setup_component
+
+    assert await async_setup_component(hass, "http", {})
+    hass.config.components.update({"frontend", "panel_custom"})
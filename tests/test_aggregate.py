@@ -0,0 +1,31 @@
+"""Aggregate group summaries."""
+from fakes import load_integration_module
+
+aggregate = load_integration_module("aggregate")
+
+
+def record(entity_id, state, unit="W"):
+    return {"entity_id": entity_id, "state": state, "attributes": {"friendly_name": entity_id, "unit_of_measurement": unit}}
+
+
+def test_stats_summary():
+    summary = aggregate.stats_summary([record("a", "3"), record("b", "5.5"), record("c", "off"), record("d", None)])
+    assert summary["count"] == 2
+    assert summary["total"] == 4
+    assert (summary["min"], summary["min_name"]) == (3.0, "a")
+    assert (summary["max"], summary["max_name"]) == (5.5, "b")
+    assert summary["mean"] == 4.25
+    assert summary["unit"] == "W"
+
+
+def test_stats_summary_skips_non_finite_states():
+    summary = aggregate.stats_summary([record("a", "nan"), record("b", "3"), record("c", "inf"), record("d", "-inf"), record("e", "7")])
+    assert summary["count"] == 2
+    assert (summary["min"], summary["mean"], summary["max"]) == (3.0, 5.0, 7.0)
+
+
+def test_stats_summary_without_finite_states():
+    summary = aggregate.stats_summary([record("a", "nan"), record("b", "unavailable")])
+    assert summary["count"] == 0
+    assert "mean" not in summary
+    assert aggregate.summary_entities(summary)[0]["display"]["v"] == "N/A"
@@ -0,0 +1,173 @@
+"""BYOS endpoints driven by a fake TRMNL device, without network access."""
+import io
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from PIL import Image  # noqa: E402
+from pytest_homeassistant_custom_component.common import MockConfigEntry  # noqa: E402
+from yarl import URL  # noqa: E402
+
+from homeassistant.setup import async_setup_component  # noqa: E402
+
+from custom_components.trmnl_dashboard import DOMAIN  # noqa: E402
+from custom_components.trmnl_dashboard import byos  # noqa: E402
+from custom_components.trmnl_dashboard.coordinator import TrmnlDashboardCoordinator  # noqa: E402
+
+ACCESS_TOKEN = "local-device-token"
+DEVICE_MAC = "AA:BB:CC:DD:EE:FF"
+
+
+class FakeTrmnlDevice:
+    # Speaks the device side of the BYOS API the way the firmware does: setup on first
+    # boot with its MAC address in the ID header, then display polls with the token
+
+    def __init__(self, client, mac):
+        self.client = client
+        self.mac = mac
+        self.access_token = None
+
+    async def setup(self):
+        response = await self.client.get("/api/setup", headers={"ID": self.mac})
+        body = await response.json()
+        if response.status == 200:
+            self.access_token = body["api_key"]
+        return response.status, body
+
+    async def display(self, access_token=None):
+        response = await self.client.get("/api/display", headers={"Access-Token": access_token or self.access_token})
+        return response.status, await response.json()
+
+    async def fetch_image(self, image_url):
+        # The image URL is absolute; the test client only takes the path
+        response = await self.client.get(URL(image_url).path)
+        return response.status, await response.read()
+
+
+async def setup_byos(hass, hass_client_no_auth, device_id=None):
+    assert await async_setup_component(hass, "http", {})
+    hass.states.async_set("sensor.temperature", "21.5", {"friendly_name": "Temperature", "unit_of_measurement": "°C"})
+    data = {
+        "webhook_url": "",
+        "byos_access_token": ACCESS_TOKEN,
+        "groups": [{"groupName": "Home", "entities": [{"entity_id": "sensor.temperature"}]}],
+        "pills": [],
+        "visualizations": [],
+    }
+    if device_id is not None:
+        data["byos_device_id"] = device_id
+    entry = MockConfigEntry(domain=DOMAIN, data=data)
+    entry.add_to_hass(hass)
+    # Only the views are under test, so the coordinator is never started
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = TrmnlDashboardCoordinator(hass, entry)
+    byos.async_register_views(hass)
+    return await hass_client_no_auth()
+
+
+async def open_pairing(hass, entry_id=None):
+    data = {} if entry_id is None else {"entry_id": entry_id}
+    await hass.services.async_call(DOMAIN, "pair_device", data, blocking=True)
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    # Pairing requests shown to the user, by notification id
+    shown = {}
+    monkeypatch.setattr(
+        byos.persistent_notification, "async_create",
+        lambda hass, message, title=None, notification_id=None: shown.__setitem__(notification_id, message),
+    )
+    monkeypatch.setattr(byos.persistent_notification, "async_dismiss", lambda hass, notification_id: shown.pop(notification_id, None))
+    return shown
+
+
+def test_normalize_mac():
+    assert byos.normalize_mac("aa-bb-cc-dd-ee-ff") == byos.normalize_mac(DEVICE_MAC) == "AABBCCDDEEFF"
+    assert byos.normalize_mac(None) == ""
+
+
+async def test_setup_refused_without_configured_mac(hass, hass_client_no_auth):
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth), DEVICE_MAC)
+    status, body = await device.setup()
+    assert status == 404
+    assert "api_key" not in body
+
+
+async def test_setup_refused_for_other_device(hass, hass_client_no_auth):
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth, DEVICE_MAC), "11:22:33:44:55:66")
+    status, body = await device.setup()
+    assert status == 404
+    assert "api_key" not in body
+
+
+async def test_configured_device_is_provisioned_and_served_frames(hass, hass_client_no_auth):
+    client = await setup_byos(hass, hass_client_no_auth, DEVICE_MAC)
+    # Case and separators of the MAC address do not matter
+    device = FakeTrmnlDevice(client, "aa-bb-cc-dd-ee-ff")
+    await open_pairing(hass)
+    status, body = await device.setup()
+    assert status == 200
+    assert device.access_token == ACCESS_TOKEN
+
+    status, display = await device.display()
+    assert status == 200
+    assert display["filename"] == body["filename"]
+    status, image = await device.fetch_image(display["image_url"])
+    assert status == 200
+    assert Image.open(io.BytesIO(image)).size == (800, 480)
+
+    # An unchanged snapshot keeps its filename, so the device keeps the image it has
+    status, again = await device.display()
+    assert again["filename"] == display["filename"]
+    entry = hass.config_entries.async_entries(DOMAIN)[0]
+    assert hass.data[DOMAIN][entry.entry_id].frames.renders == 1
+
+    hass.states.async_set("sensor.temperature", "23.0", {"friendly_name": "Temperature", "unit_of_measurement": "°C"})
+    await hass.async_block_till_done()
+    status, changed = await device.display()
+    assert changed["filename"] != display["filename"]
+    status, _image = await device.fetch_image(display["image_url"])
+    assert status == 404
+
+
+async def test_display_refuses_wrong_token(hass, hass_client_no_auth):
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth, DEVICE_MAC), DEVICE_MAC)
+    status, _body = await device.display("not-the-token")
+    assert status == 401
+
+
+async def test_setup_waits_for_pairing(hass, hass_client_no_auth, notifications):
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth, DEVICE_MAC), DEVICE_MAC)
+    # A configured MAC address alone is not enough: the user is asked to open pairing
+    status, body = await device.setup()
+    assert status == 404
+    assert "api_key" not in body
+    assert [DEVICE_MAC in message for message in notifications.values()] == [True]
+
+    await open_pairing(hass)
+    assert not notifications
+    status, _body = await device.setup()
+    assert status == 200
+    # Pairing closes with the first device that pairs
+    status, body = await FakeTrmnlDevice(device.client, DEVICE_MAC).setup()
+    assert status == 404
+    assert "api_key" not in body
+
+
+async def test_pairing_window_expires(hass, hass_client_no_auth, notifications, monkeypatch):
+    monkeypatch.setattr(byos, "PAIRING_WINDOW", 0)
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth, DEVICE_MAC), DEVICE_MAC)
+    await open_pairing(hass)
+    status, _body = await device.setup()
+    assert status == 404
+
+
+async def test_pairing_is_opened_per_entry(hass, hass_client_no_auth, notifications):
+    device = FakeTrmnlDevice(await setup_byos(hass, hass_client_no_auth, DEVICE_MAC), DEVICE_MAC)
+    await open_pairing(hass, "another-entry")
+    status, _body = await device.setup()
+    assert status == 404
+    await open_pairing(hass, hass.config_entries.async_entries(DOMAIN)[0].entry_id)
+    status, _body = await device.setup()
+    assert status == 200
@@ -0,0 +1,125 @@
+"""Config and options flows: the dashboard form, the advanced step and the preview."""
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry  # noqa: E402
+
+from custom_components.trmnl_dashboard import DOMAIN  # noqa: E402
+from custom_components.trmnl_dashboard.config_flow import ADVANCED_OPTIONS  # noqa: E402
+
+WEBHOOK_URL = "https://usetrmnl.com/api/custom_plugins/test"
+
+
+@pytest.fixture(autouse=True)
+def integration(enable_custom_integrations, integration_dependencies, hass):
+    hass.states.async_set("sensor.temperature", "21.5", {"friendly_name": "Temperature"})
+    hass.states.async_set("sensor.humidity", "40", {"friendly_name": "Humidity"})
+    # Only the flows are under test; saving does not set the entry up
+    with patch("custom_components.trmnl_dashboard.async_setup_entry", return_value=True):
+        yield
+
+
+def defaults(result):
+    return {str(key): key.default() for key in result["data_schema"].schema}
+
+
+async def test_config_flow_keeps_advanced_options_on_their_own_step(hass):
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": "user"})
+    assert result["step_id"] == "user"
+    assert not set(defaults(result)) & set(ADVANCED_OPTIONS)
+
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {
+        "webhook_url": WEBHOOK_URL,
+        "show_title_bar": False,
+        "group_0_name": "Climate",
+        "group_0_entities": ["sensor.temperature", "sensor.humidity"],
+        "advanced_options": True,
+    })
+    assert result["step_id"] == "advanced"
+    assert set(defaults(result)) == set(ADVANCED_OPTIONS)
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {
+        "payload_format": "compact",
+        "max_payload_bytes": 5120,
+        "byos_bit_depth": "2",
+        "byos_access_token": " token ",
+    })
+    assert result["step_id"] == "preview"
+    assert result["description_placeholders"]["entities"] == "2"
+    assert result["description_placeholders"]["payload_format"] == "compact"
+
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {})
+    data = result["data"]
+    assert data["webhook_url"] == WEBHOOK_URL
+    assert data["show_title_bar"] == "false"
+    assert data["groups"] == [{"groupName": "Climate", "entities": [{"entity_id": "sensor.temperature"}, {"entity_id": "sensor.humidity"}]}]
+    assert (data["payload_format"], data["max_payload_bytes"], data["byos_bit_depth"]) == ("compact", 5120, 2)
+    assert data["byos_access_token"] == "token"
+    assert data["debounce"] == 5
+
+
+async def test_config_flow_without_advanced_step_uses_defaults(hass):
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={"source": "user"})
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {
+        "webhook_url": WEBHOOK_URL,
+        "group_0_entities": ["sensor.temperature"],
+    })
+    assert result["step_id"] == "preview"
+    result = await hass.config_entries.flow.async_configure(result["flow_id"], {})
+    data = result["data"]
+    for key, (default, _field, convert) in ADVANCED_OPTIONS.items():
+        assert data[key] == convert(default)
+
+
+async def test_options_flow_edits_groups_and_keeps_advanced_options(hass):
+    entry = MockConfigEntry(domain=DOMAIN, data={
+        "webhook_url": WEBHOOK_URL,
+        "show_entity_icon": "false",
+        "groups": [
+            {"groupName": "Temperature", "entities": [{"entity_id": "sensor.temperature"}]},
+            {"groupName": "Humidity", "entities": [{"entity_id": "sensor.humidity"}], "mode": "stats", "top_n": 3},
+        ],
+        "pills": [{"entity_id": "sensor.humidity"}],
+        "visualizations": [],
+        "max_payload_bytes": 4096,
+        "byos_bit_depth": 2,
+    })
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["step_id"] == "init"
+    form = defaults(result)
+    assert form["show_entity_icon"] is False
+    assert form["pill_entities"] == ["sensor.humidity"]
+    assert (form["group_1_name"], form["group_1_mode"], form["group_1_top_n"]) == ("Humidity", "stats", 3)
+    assert "remove_group_1" in form
+
+    # Removing the first group and adding one shows the form again with the rest moved up
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {
+        **form, "remove_group_0": True, "add_another_group": True,
+    })
+    assert result["step_id"] == "init"
+    form = defaults(result)
+    assert form["group_0_name"] == "Humidity"
+    assert form["group_1_name"] == "Group 2"
+    assert "group_2_name" not in form
+
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {
+        **form, "group_1_entities": ["sensor.temperature"], "advanced_options": True,
+    })
+    assert result["step_id"] == "advanced"
+    assert defaults(result)["max_payload_bytes"] == 4096
+    assert defaults(result)["byos_bit_depth"] == "2"
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {"debounce": 10})
+    assert result["step_id"] == "preview"
+
+    # Going back to the form keeps the draft
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {"edit": True})
+    assert result["step_id"] == "init"
+    result = await hass.config_entries.options.async_configure(result["flow_id"], defaults(result))
+    result = await hass.config_entries.options.async_configure(result["flow_id"], {})
+    assert [group["groupName"] for group in entry.options["groups"]] == ["Humidity", "Group 2"]
+    assert entry.options["show_entity_icon"] == "false"
+    assert (entry.options["max_payload_bytes"], entry.options["byos_bit_depth"], entry.options["debounce"]) == (4096, 2, 10)
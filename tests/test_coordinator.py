@@ -0,0 +1,235 @@
+"""Entries set up in Home Assistant: the deferred first push and options applied in place."""
+from datetime import timedelta
+
+import orjson
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_fire_time_changed  # noqa: E402
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STARTED  # noqa: E402
+from homeassistant.core import CoreState  # noqa: E402
+from homeassistant.helpers import device_registry as dr  # noqa: E402
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from custom_components.trmnl_dashboard import DOMAIN  # noqa: E402
+from custom_components.trmnl_dashboard.coordinator import STARTUP_PUSH_TIMEOUT  # noqa: E402
+
+WEBHOOK_URL = "https://usetrmnl.com/api/custom_plugins/test"
+SECOND_URL = "https://usetrmnl.com/api/custom_plugins/second"
+ENTITIES = ("sensor.temperature", "sensor.humidity")
+
+
+@pytest.fixture(autouse=True)
+def integration(enable_custom_integrations, integration_dependencies, aioclient_mock):
+    aioclient_mock.post(WEBHOOK_URL, json={"message": "ok"})
+    aioclient_mock.post(SECOND_URL, json={"message": "ok"})
+
+
+def pushes(aioclient_mock):
+    return [orjson.loads(data)["merge_variables"] for _method, _url, data, _headers in aioclient_mock.mock_calls]
+
+
+def group(*entity_ids):
+    return {"groupName": "Climate", "entities": [{"entity_id": entity_id} for entity_id in entity_ids]}
+
+
+async def setup_entry(hass, **options):
+    entry = MockConfigEntry(domain=DOMAIN, data={
+        "webhook_url": WEBHOOK_URL,
+        "interval": 60,
+        "groups": [group(*ENTITIES)],
+        "pills": [],
+        "visualizations": [],
+        **options,
+    })
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done(wait_background_tasks=True)
+    return entry
+
+
+async def advance(hass, seconds):
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=seconds))
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+
+async def test_push_right_away_when_every_entity_has_a_state(hass, aioclient_mock):
+    hass.set_state(CoreState.starting)
+    for entity_id in ENTITIES:
+        hass.states.async_set(entity_id, "1")
+    entry = await setup_entry(hass)
+    assert len(pushes(aioclient_mock)) == 1
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_push_waits_for_every_entity(hass, aioclient_mock):
+    hass.set_state(CoreState.starting)
+    hass.states.async_set("sensor.temperature", "unavailable")
+    entry = await setup_entry(hass)
+    assert pushes(aioclient_mock) == []
+    hass.states.async_set("sensor.temperature", "21.5")
+    await hass.async_block_till_done(wait_background_tasks=True)
+    # sensor.humidity has no state yet
+    assert pushes(aioclient_mock) == []
+    hass.states.async_set("sensor.humidity", "unknown")
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert pushes(aioclient_mock) == []
+    hass.states.async_set("sensor.humidity", "40")
+    await hass.async_block_till_done(wait_background_tasks=True)
+    [push] = pushes(aioclient_mock)
+    assert [entity["state"] for entity in push["groups"][0]["entities"]] == ["21.5", "40"]
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_push_once_home_assistant_has_started(hass, aioclient_mock, caplog):
+    hass.set_state(CoreState.starting)
+    hass.states.async_set("sensor.temperature", "unavailable")
+    entry = await setup_entry(hass)
+    assert pushes(aioclient_mock) == []
+    hass.set_state(CoreState.running)
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_STARTED)
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert len(pushes(aioclient_mock)) == 1
+    # The started listener is not removed again after it fired
+    assert "Unable to remove unknown job listener" not in caplog.text
+    # The entities loading later are pushed by the heartbeat, not as a second first push
+    hass.states.async_set("sensor.temperature", "21.5")
+    hass.states.async_set("sensor.humidity", "40")
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert len(pushes(aioclient_mock)) == 1
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_push_after_the_startup_timeout(hass, aioclient_mock):
+    hass.set_state(CoreState.starting)
+    hass.states.async_set("sensor.temperature", "unavailable")
+    entry = await setup_entry(hass)
+    # The heartbeat does not push before the first push either
+    await advance(hass, STARTUP_PUSH_TIMEOUT - 1)
+    assert pushes(aioclient_mock) == []
+    await advance(hass, STARTUP_PUSH_TIMEOUT + 1)
+    [push] = pushes(aioclient_mock)
+    assert push["groups"][0]["entities"][0]["state"] == "unavailable"
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_reload_while_running_pushes_right_away(hass, aioclient_mock):
+    hass.states.async_set("sensor.temperature", "unavailable")
+    entry = await setup_entry(hass)
+    assert len(pushes(aioclient_mock)) == 1
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def update_options(hass, entry, **options):
+    hass.config_entries.async_update_entry(entry, options={**entry.options, **options})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+
+def set_states(hass):
+    hass.states.async_set("sensor.temperature", "21.5")
+    hass.states.async_set("sensor.humidity", "40")
+
+
+def webhook_devices(hass, entry):
+    return sorted(device.name for device in dr.async_entries_for_config_entry(dr.async_get(hass), entry.entry_id))
+
+
+@pytest.fixture
+def platform_reloads(hass, monkeypatch):
+    # Platforms unloaded by the update listener, which sets them up again right after
+    reloads = []
+    unload = hass.config_entries.async_unload_platforms
+
+    async def async_unload_platforms(entry, platforms):
+        reloads.append(list(platforms))
+        return await unload(entry, platforms)
+
+    monkeypatch.setattr(hass.config_entries, "async_unload_platforms", async_unload_platforms)
+    return reloads
+
+
+async def test_adding_or_removing_a_webhook_reloads_the_sensor_platform(hass, aioclient_mock, platform_reloads):
+    set_states(hass)
+    entry = await setup_entry(hass)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    assert webhook_devices(hass, entry) == ["Mock Title", "Mock Title webhook 1"]
+
+    # Other options are applied without touching the platform
+    await update_options(hass, entry, layout="list")
+    assert platform_reloads == []
+
+    await update_options(hass, entry, additional_targets=SECOND_URL)
+    assert platform_reloads == [["sensor"]]
+    assert webhook_devices(hass, entry) == ["Mock Title", "Mock Title webhook 1", "Mock Title webhook 2"]
+    assert coordinator.sensor_targets == (WEBHOOK_URL, SECOND_URL)
+    assert hass.states.get("sensor.mock_title_webhook_2_pushes_sent") is not None
+
+    await update_options(hass, entry, additional_targets="")
+    assert len(platform_reloads) == 2
+    assert webhook_devices(hass, entry) == ["Mock Title", "Mock Title webhook 1"]
+    assert SECOND_URL not in coordinator.deliveries
+    # The entry itself was never reloaded
+    assert hass.data[DOMAIN][entry.entry_id] is coordinator
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_interval_change_rearms_the_heartbeat(hass, aioclient_mock, monkeypatch):
+    set_states(hass)
+    entry = await setup_entry(hass)
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    reasons = []
+    push = coordinator.async_push
+
+    async def async_push(reason="periodic"):
+        reasons.append(reason)
+        await push(reason)
+
+    monkeypatch.setattr(coordinator, "async_push", async_push)
+    heartbeat = coordinator._cancel_heartbeat
+    await update_options(hass, entry, layout="list")
+    assert coordinator._cancel_heartbeat is heartbeat
+    assert reasons == ["options"]
+
+    await update_options(hass, entry, interval=300)
+    assert coordinator._cancel_heartbeat is not heartbeat
+    reasons.clear()
+    await advance(hass, 61)
+    assert reasons == []
+    await advance(hass, 301)
+    assert reasons == ["periodic"]
+    await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_removed_entities_are_dropped_from_the_caches(hass, aioclient_mock, monkeypatch):
+    set_states(hass)
+    # Budget for a push a second, as every options change below is pushed
+    entry = await setup_entry(hass, update_mode="state_change", debounce=0, rate_limit=3600)
+    # Its own webhook: entries sharing one also share its push budget
+    other = await setup_entry(hass, webhook_url=SECOND_URL, groups=[group("sensor.temperature")])
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    invalidated = []
+    monkeypatch.setattr(coordinator.forecast_cache, "async_invalidate", invalidated.append)
+
+    def cached():
+        return {key[0] for key in coordinator.record_cache._records}
+
+    assert cached() == set(ENTITIES)
+    await update_options(hass, entry, groups=[group("sensor.humidity")])
+    # sensor.temperature is still shown by the other entry
+    assert cached() == set(ENTITIES)
+    assert invalidated == []
+
+    await update_options(hass, entry, groups=[group("sensor.pressure")])
+    assert cached() == {"sensor.temperature"}
+    assert invalidated == [{"sensor.humidity"}]
+    # Nor does it arm a push any more
+    hass.states.async_set("sensor.humidity", "45")
+    await hass.async_block_till_done()
+    assert coordinator._cancel_debounce is None
+    hass.states.async_set("sensor.pressure", "1013")
+    await hass.async_block_till_done()
+    assert coordinator._cancel_debounce is not None
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.config_entries.async_unload(other.entry_id)
@@ -0,0 +1,71 @@
+"""Display fields against formatEntityState in the template."""
+import json
+import os
+import shutil
+import subprocess
+from datetime import timezone
+from pathlib import Path
+
+import pytest
+
+from fakes import load_integration_module
+
+display = load_integration_module("display")
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "trmnl-plugin" / "src" / "full.liquid"
+ATTRIBUTES = {"unit_of_measurement": "W"}
+# state -> (value, unit, numeric) as formatEntityState returns them in an en-US, UTC browser
+EXPECTED = {
+    "on": ("ON", "", False),
+    "off": ("OFF", "", False),
+    "21": ("21", "W", True),
+    "21.0": ("21", "W", True),
+    "21.46": ("21.5", "W", True),
+    "0.25": ("0.3", "W", True),
+    "-0.25": ("-0.3", "W", True),
+    "1.45": ("1.4", "W", True),
+    "-0.04": ("-0.0", "W", True),
+    "1e3": ("1000", "W", True),
+    " 7 ": ("7", "W", True),
+    "2026-01-02T15:04:05+00:00": ("1/2/2026, 3:04:05 PM", "", False),
+    "2026-01-02T00:30:00Z": ("1/2/2026, 12:30:00 AM", "", False),
+    "2026-11-20T12:00:00+00:00": ("11/20/2026, 12:00:00 PM", "", False),
+    "2026-01-02T15:04:05.250+01:00": ("1/2/2026, 2:04:05 PM", "", False),
+    "unavailable": ("unavailable", "W", False),
+    "": ("N/A", "W", False),
+}
+
+
+@pytest.mark.parametrize("state", list(EXPECTED))
+def test_format_state_matches_the_template(state):
+    assert display.format_state(state, ATTRIBUTES, timezone.utc) == EXPECTED[state]
+
+
+def test_datetimes_use_home_assistant_time_zone():
+    from zoneinfo import ZoneInfo
+
+    value, _unit, _numeric = display.format_state("2026-07-01T18:00:00+00:00", {}, ZoneInfo("America/New_York"))
+    assert value == "7/1/2026, 2:00:00 PM"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs Node.js")
+def test_expected_values_come_from_the_template():
+    # Runs formatEntityState from full.liquid itself, on a renderer without a DOM
+    template = TEMPLATE.read_text(encoding="utf-8")
+    start = template.index("class HomeAssistantRenderer {")
+    renderer = template[start:template.index("\n}\n", start) + 2]
+    script = renderer + """
+globalThis.document = { getElementById: () => null };
+const renderer = new HomeAssistantRenderer('root', {});
+const states = JSON.parse(process.argv[1]);
+const attributes = JSON.parse(process.argv[2]);
+process.stdout.write(JSON.stringify(states.map(state => {
+  const { value, unit, isNumeric } = renderer.formatEntityState({ state, attributes });
+  return [value, unit, isNumeric];
+})));
+"""
+    result = subprocess.run(
+        ["node", "-e", script, json.dumps(list(EXPECTED)), json.dumps(ATTRIBUTES)],
+        capture_output=True, check=True, timeout=60, env={**os.environ, "TZ": "UTC", "LANG": "en_US.UTF-8", "LC_ALL": "en_US.UTF-8"},
+    )
+    assert [tuple(values) for values in json.loads(result.stdout)] == list(EXPECTED.values())
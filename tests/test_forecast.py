@@ -0,0 +1,178 @@
+"""ForecastCache against a fake weather.get_forecasts."""
+import asyncio
+import types
+
+import pytest
+
+from fakes import FakeHass, FakeStates, load_integration_module, make_forecast
+
+forecast_module = load_integration_module("forecast")
+
+TTL = forecast_module.DEFAULT_FORECAST_TTL
+RETRY = forecast_module.FORECAST_RETRY_TTL
+
+
+class FakeWeather:
+    # weather.get_forecasts: each entity's forecast starts at its temperature in
+    # `temperatures`. Entities in `failing` fail the call, and calls wait for `release`
+    # while it is set.
+
+    def __init__(self):
+        self.temperatures = {}
+        self.failing = set()
+        self.release = None
+        self.calls = []
+
+    async def async_call(self, domain, service, data, blocking=False, return_response=False):
+        assert (domain, service) == ("weather", "get_forecasts")
+        self.calls.append(list(data["entity_id"]))
+        if self.release is not None:
+            await self.release.wait()
+        if self.failing & set(data["entity_id"]):
+            raise RuntimeError("forecast type not supported")
+        return {entity_id: {"forecast": self.forecast(entity_id)} for entity_id in data["entity_id"]}
+
+    def forecast(self, entity_id):
+        forecast = make_forecast()
+        forecast[0]["temperature"] = self.temperatures.get(entity_id, 20)
+        return forecast
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The cache's monotonic clock, moved by hand; asyncio keeps the real one
+    now = [1000.0]
+    monkeypatch.setattr(forecast_module, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def make_cache():
+    hass = FakeHass(FakeStates())
+    hass.services = FakeWeather()
+    return forecast_module.ForecastCache(hass), hass.services
+
+
+def temperature(forecasts, entity_id):
+    return forecasts[entity_id][0]["temperature"]
+
+
+async def settle(cache):
+    tasks = set(cache._pending.values())
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+def test_first_fetch_is_waited_for_and_cached_for_the_ttl(clock):
+    async def main():
+        cache, weather = make_cache()
+        forecasts = await cache.async_get(["weather.home", "weather.cabin"])
+        assert temperature(forecasts, "weather.home") == 20
+        # One batched call for both entities
+        assert weather.calls == [["weather.home", "weather.cabin"]]
+        clock[0] += TTL - 1
+        await cache.async_get(["weather.home", "weather.cabin"])
+        assert len(weather.calls) == 1
+
+    asyncio.run(main())
+
+
+def test_expired_forecast_is_served_stale_while_refreshing(clock):
+    async def main():
+        cache, weather = make_cache()
+        await cache.async_get(["weather.home"])
+        weather.temperatures["weather.home"] = 25
+        weather.release = asyncio.Event()
+        clock[0] += TTL
+        # The refresh is started but not waited for
+        forecasts = await cache.async_get(["weather.home"])
+        assert temperature(forecasts, "weather.home") == 20
+        await asyncio.sleep(0)
+        assert len(weather.calls) == 2
+        # Gets in the meantime share the refresh in flight
+        await cache.async_get(["weather.home"])
+        assert len(weather.calls) == 2
+        weather.release.set()
+        await settle(cache)
+        assert temperature(await cache.async_get(["weather.home"]), "weather.home") == 25
+
+    asyncio.run(main())
+
+
+def test_failed_fetch_keeps_the_previous_forecast_and_retries_sooner(clock):
+    async def main():
+        cache, weather = make_cache()
+        await cache.async_get(["weather.home"])
+        weather.failing.add("weather.home")
+        clock[0] += TTL
+        await cache.async_get(["weather.home"])
+        await settle(cache)
+        assert len(weather.calls) == 2
+        assert temperature(await cache.async_get(["weather.home"]), "weather.home") == 20
+        # Retried after FORECAST_RETRY_TTL rather than the full ttl
+        clock[0] += RETRY - 1
+        await cache.async_get(["weather.home"])
+        assert len(weather.calls) == 2
+        clock[0] += 1
+        weather.failing.clear()
+        weather.temperatures["weather.home"] = 25
+        await cache.async_get(["weather.home"])
+        await settle(cache)
+        assert temperature(await cache.async_get(["weather.home"]), "weather.home") == 25
+
+    asyncio.run(main())
+
+
+def test_entity_failing_the_batch_is_fetched_alone(clock):
+    async def main():
+        cache, weather = make_cache()
+        weather.failing.add("weather.cabin")
+        forecasts = await cache.async_get(["weather.home", "weather.cabin"])
+        assert weather.calls == [["weather.home", "weather.cabin"], ["weather.home"], ["weather.cabin"]]
+        assert list(forecasts) == ["weather.home"]
+        # Not waited for again by the pushes before the retry
+        clock[0] += RETRY - 1
+        await cache.async_get(["weather.home", "weather.cabin"])
+        assert len(weather.calls) == 3
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("invalidated", [["weather.home"], None])
+def test_invalidated_entity_is_not_repopulated_by_a_refresh_in_flight(clock, invalidated):
+    async def main():
+        cache, weather = make_cache()
+        await cache.async_get(["weather.home"])
+        weather.temperatures["weather.home"] = 25
+        weather.release = asyncio.Event()
+        clock[0] += TTL
+        await cache.async_get(["weather.home"])
+        in_flight = set(cache._pending.values())
+        cache.async_invalidate(invalidated)
+        weather.release.set()
+        await asyncio.wait(in_flight)
+        assert cache._entries == {}
+        # The next get fetches again instead of joining the dropped refresh
+        weather.temperatures["weather.home"] = 30
+        assert temperature(await cache.async_get(["weather.home"]), "weather.home") == 30
+        assert len(weather.calls) == 3
+
+    asyncio.run(main())
+
+
+def test_refresh_started_after_an_invalidation_is_kept(clock):
+    async def main():
+        cache, weather = make_cache()
+        weather.release = asyncio.Event()
+        get = asyncio.ensure_future(cache.async_get(["weather.home"]))
+        await asyncio.sleep(0)
+        old = set(cache._pending.values())
+        cache.async_invalidate(["weather.home"])
+        new = asyncio.ensure_future(cache.async_get(["weather.home"]))
+        await asyncio.sleep(0)
+        assert set(cache._pending.values()) != old
+        weather.release.set()
+        await asyncio.gather(get, new)
+        assert temperature(new.result(), "weather.home") == 20
+        assert not cache._pending
+
+    asyncio.run(main())
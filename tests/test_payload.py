@@ -0,0 +1,275 @@
+"""Payload encoding: the compact wire format and the payload size budget."""
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import orjson
+import pytest
+
+from fakes import EPOCH, FakeState, load_integration_module, make_dashboard_config, make_forecast, make_states
+
+plan_module = load_integration_module("plan")
+payload_module = load_integration_module("payload")
+icons_module = load_integration_module("icons")
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "trmnl-plugin" / "src" / "full.liquid"
+ICON_STORE = icons_module.IconStore(icons_module.load_icon_store())
+# formatState's NUMERIC_RE in full.liquid
+JS_NUMERIC_RE = re.compile(r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$")
+FORECAST_FIELDS = ("datetime", "condition", "temperature", "templow", "precipitation")
+
+
+def make_snapshot(precompute_display):
+    states = make_states(300)
+    config = make_dashboard_config(states, 60, group_size=12, pill_count=6, precompute_display=precompute_display)
+    # A member without a state is sent as its config; a shared name is interned
+    config["groups"][0]["entities"].append({"entity_id": "sensor.missing", "name": "Missing"})
+    config["groups"][1]["entities"].append({"entity_id": "sensor.bench_1"})
+    config["visualizations"].append({"entity_id": "sensor.history"})
+    states["sensor.twin"] = FakeState("sensor.twin", "1", {"friendly_name": "Sensor 1", "icon": "mdi:flash"})
+    config["groups"][2]["entities"].append({"entity_id": "sensor.twin"})
+    states["sensor.history"] = FakeState("sensor.history", "4", {"friendly_name": "History"})
+    plan = plan_module.DashboardPlan(config)
+    forecast = make_forecast()
+    del forecast[1]["precipitation"]
+    forecast[2]["templow"] = None
+    return plan.build(
+        states, {"weather.home": forecast}, plan_module.RecordCache(), ICON_STORE, {"sensor.history": [1.0, 2.5, 4.0]},
+    )
+
+
+def standard_view(data):
+    # What the template reads from a standard payload: no unrendered fields, no forecast
+    # values left empty, and the numeric flag display rows omit when false (the decoder
+    # spells it out; records sent whole, like the weather card, pass through as they are)
+    def entity(record):
+        record = {key: value for key, value in record.items() if key not in payload_module.UNRENDERED_FIELDS}
+        if "display" in record and "state" not in record:
+            record["display"] = {"f": 0, **record["display"]}
+        if "forecast" in record:
+            record["forecast"] = [{key: value for key, value in day.items() if value is not None} for day in record["forecast"]]
+        return record
+
+    data = orjson.loads(payload_module.encode_payload(data, "standard"))["merge_variables"]
+    return {
+        **data,
+        "groups": [{**group, "entities": [entity(record) for record in group["entities"]]} for group in data["groups"]],
+        "pills": [entity(pill) for pill in data["pills"]],
+        "visualizations": [entity(viz) for viz in data["visualizations"]],
+    }
+
+
+def decode_compact(data):
+    # HomeAssistantRenderer.decodeCompactPayload, line for line
+    strings = data.get("strings") or []
+
+    def text(value):
+        return strings[value] if isinstance(value, int) else value
+
+    entities = []
+    for row in data["entities"]:
+        entity = {**(row.get("x") or {}), "entity_id": row.get("i")}
+        if "v" in row:
+            domain = (row.get("i") or "").split(".")[0]
+            device_class = strings[row["c"]] if "c" in row else domain
+            icon_map = payload_module.ICON_MAP
+            display = {
+                "n": text(row.get("n")),
+                "i": strings[row["o"]] if "o" in row else icon_map.get(device_class) or icon_map.get(domain) or icon_map["default"],
+                "c": device_class,
+                "v": row["v"],
+                "f": row["f"] if "f" in row else (1 if JS_NUMERIC_RE.match(str(row["v"])) else 0),
+            }
+            if "t" in row:
+                display["t"] = text(row["t"])
+            if "u" in row:
+                display["u"] = strings[row["u"]]
+            # JSON.stringify leaves undefined members out
+            entity["display"] = {key: value for key, value in display.items() if value is not None}
+        elif "s" in row:
+            attributes = dict(row.get("a") or {})
+            for short, name in (("n", "friendly_name"),):
+                if short in row:
+                    attributes[name] = row[short]
+            for short, name in (("o", "icon"), ("c", "device_class"), ("u", "unit_of_measurement")):
+                if short in row:
+                    attributes[name] = strings[row[short]]
+            entity["state"] = row["s"]
+            entity["attributes"] = attributes
+        entities.append(entity)
+
+    def visualization(viz):
+        if "h" in viz:
+            return {**entities[viz["e"]], "history": viz["h"]}
+        if not viz.get("f"):
+            return entities[viz["e"]]
+        forecast = [
+            {field: value for field, value in zip(FORECAST_FIELDS, values) if value is not None}
+            for values in viz["f"]
+        ]
+        return {**entities[viz["e"]], "forecast": forecast}
+
+    return {
+        **data,
+        "groups": [
+            {**{key: value for key, value in group.items() if key not in ("n", "e")}, "groupName": group.get("n"), "entities": [entities[i] for i in group.get("e") or []]}
+            for group in data.get("groups") or []
+        ],
+        "pills": [entities[i] for i in data.get("pills") or []],
+        "visualizations": [visualization(viz) for viz in data.get("visualizations") or []],
+    }
+
+
+def sections(data):
+    return {key: data.get(key) for key in ("groups", "pills", "visualizations", "configuration", "icons")}
+
+
+@pytest.mark.parametrize("precompute_display", [False, True])
+def test_compact_decodes_to_the_standard_payload(precompute_display):
+    data = make_snapshot(precompute_display)
+    compact = orjson.loads(payload_module.encode_payload(data, "compact"))["merge_variables"]
+    assert compact["format"] == "compact"
+    assert sections(decode_compact(compact)) == sections(standard_view(data))
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs Node.js")
+@pytest.mark.parametrize("precompute_display", [False, True])
+def test_template_decoder_matches(precompute_display):
+    # Runs the decoder shipped in full.liquid itself, on a renderer without a DOM
+    template = TEMPLATE.read_text(encoding="utf-8")
+    start = template.index("class HomeAssistantRenderer {")
+    renderer = template[start:template.index("\n}\n", start) + 2]
+    script = renderer + """
+globalThis.document = { getElementById: () => null };
+let input = '';
+process.stdin.on('data', chunk => { input += chunk; });
+process.stdin.on('end', () => {
+  const renderer = new HomeAssistantRenderer('root', {});
+  process.stdout.write(JSON.stringify(renderer.decodeCompactPayload(JSON.parse(input))));
+});
+"""
+    data = make_snapshot(precompute_display)
+    compact = orjson.loads(payload_module.encode_payload(data, "compact"))["merge_variables"]
+    result = subprocess.run(
+        ["node", "-e", script], input=orjson.dumps(compact), capture_output=True, check=True, timeout=60,
+    )
+    decoded = json.loads(result.stdout)
+    assert sections(decoded) == sections(standard_view(data))
+    assert sections(decoded) == sections(orjson.loads(orjson.dumps(decode_compact(compact))))
+
+
+def budget_payload(group_count=4, per_group=6, icon_bytes=600):
+    # Records of about 170 bytes, 40 of them timestamps, and one custom icon path
+    def record(group, number):
+        return {
+            "entity_id": f"sensor.group_{group}_{number}",
+            "state": f"{group * 10 + number}.5",
+            "attributes": {"friendly_name": f"Group {group} sensor {number}", "unit_of_measurement": "W"},
+            "last_changed": EPOCH,
+            "last_updated": EPOCH,
+        }
+
+    return {
+        "groups": [
+            {"groupName": f"Group {group}", "entities": [record(group, number) for number in range(per_group)]}
+            for group in range(group_count)
+        ],
+        "pills": [record(9, 0)],
+        "visualizations": [],
+        "configuration": {"layout": "groups"},
+        "icons": {"mdi:rocket-launch": "M" + "1" * icon_bytes},
+    }
+
+
+def decoded(body):
+    return orjson.loads(body)["merge_variables"]
+
+
+def without_timestamps(data):
+    return len(payload_module.encode_payload({
+        **data,
+        "groups": [
+            {**group, "entities": [payload_module._without_unrendered(entity) for entity in group["entities"]]}
+            for group in data["groups"]
+        ],
+        "pills": [payload_module._without_unrendered(pill) for pill in data["pills"]],
+    }))
+
+
+def test_default_budget_is_the_standard_plan_limit():
+    assert payload_module.DEFAULT_MAX_PAYLOAD_BYTES == 2048
+    assert plan_module.DashboardPlan({}).max_payload_bytes == 2048
+    data = budget_payload()
+    assert payload_module.enforce_payload_budget(data) == payload_module.enforce_payload_budget(data, 2048)
+
+
+def test_payload_within_budget_is_sent_whole():
+    data = budget_payload(group_count=1)
+    body = payload_module.encode_payload(data)
+    assert payload_module.enforce_payload_budget(data, len(body)) == (body, 0)
+    assert payload_module.enforce_payload_budget(budget_payload(group_count=20), 0)[1] == 0
+
+
+def test_timestamps_are_dropped_first():
+    data = budget_payload()
+    full = len(payload_module.encode_payload(data))
+    body, dropped = payload_module.enforce_payload_budget(data, without_timestamps(data))
+    assert dropped == 0
+    assert len(body) < full
+    sent = decoded(body)
+    assert "icons" in sent
+    assert all(set(entity) == {"entity_id", "state", "attributes"} for group in sent["groups"] for entity in group["entities"])
+    # The snapshot itself is left alone
+    assert "last_changed" in data["groups"][0]["entities"][0]
+
+
+def test_icons_are_dropped_before_entities():
+    data = budget_payload()
+    limit = without_timestamps(data) - 1
+    body, dropped = payload_module.enforce_payload_budget(data, limit)
+    assert dropped == 0
+    assert len(body) <= limit
+    sent = decoded(body)
+    assert "icons" not in sent
+    assert sum(len(group["entities"]) for group in sent["groups"]) == 24
+
+
+@pytest.mark.parametrize("payload_format", ["standard", "compact"])
+def test_entities_are_dropped_from_the_tail(payload_format):
+    data = budget_payload(group_count=6)
+    body, dropped = payload_module.enforce_payload_budget(data, 2048, payload_format)
+    assert len(body) <= 2048
+    assert dropped > 0
+    # Deterministic: the same snapshot always loses the same items
+    assert payload_module.enforce_payload_budget(data, 2048, payload_format) == (body, dropped)
+    sent = decoded(body)
+    if payload_format == "compact":
+        sent = decode_compact(sent)
+    assert "icons" not in sent
+    kept = [entity["entity_id"] for group in sent["groups"] for entity in group["entities"]]
+    listed = [entity["entity_id"] for group in data["groups"] for entity in group["entities"]]
+    # The groups keep their order and lose members from the end of the dashboard
+    assert kept == listed[:len(kept)]
+    assert len(listed) - len(kept) == dropped - (len(data["groups"]) - len(sent["groups"]))
+    assert [pill["entity_id"] for pill in sent["pills"]] == ["sensor.group_9_0"]
+
+
+def test_pills_and_visualizations_go_after_every_group():
+    data = budget_payload(group_count=1, per_group=1)
+    data["visualizations"] = [{"entity_id": "weather.home", "state": "sunny", "attributes": {}, "forecast": make_forecast()}]
+    body, dropped = payload_module.enforce_payload_budget(data, 120)
+    sent = decoded(body)
+    assert sent["groups"] == [] and sent["pills"] == [] and sent["visualizations"] == []
+    assert dropped == 4
+
+
+def test_project_forecast():
+    forecast = make_forecast(7)
+    forecast[0]["extra"] = "dropped"
+    projected = payload_module.project_forecast(forecast)
+    assert len(projected) == payload_module.FORECAST_DAYS
+    assert all(set(day) <= set(payload_module.FORECAST_FIELDS) for day in projected)
+    assert projected[0]["temperature"] == forecast[0]["temperature"]
+    assert payload_module.project_forecast(None) == []
@@ -0,0 +1,134 @@
+"""Dashboards split over page webhooks."""
+import pytest
+
+from fakes import FakeState, load_integration_module, make_forecast, make_states
+
+plan_module = load_integration_module("plan")
+payload_module = load_integration_module("payload")
+icons_module = load_integration_module("icons")
+
+ICON_STORE = icons_module.IconStore(icons_module.load_icon_store())
+FORECASTS = {"weather.home": make_forecast()}
+PAGES = 12
+LIMIT = 5120  # TRMNL+
+
+
+def make_plan(states, visualizations=True, **options):
+    # 30 groups of 4 sensors, binary sensors and switches, whose records stay small
+    # enough for several groups to share a page
+    entity_ids = sorted(entity_id for entity_id in states if entity_id.split(".")[0] in ("sensor", "binary_sensor", "switch"))
+    config = {
+        "webhook_url": "http://localhost/page0",
+        "page_webhooks": "\n".join(f"http://localhost/page{page}" for page in range(1, PAGES)),
+        "max_payload_bytes": LIMIT,
+        "groups": [
+            {"groupName": f"Group {number}", "entities": [{"entity_id": e} for e in entity_ids[number * 4:number * 4 + 4]]}
+            for number in range(30)
+        ],
+        "pills": [{"entity_id": e} for e in entity_ids[200:203]],
+        "visualizations": [{"entity_id": "weather.home"}] if visualizations else [],
+        **options,
+    }
+    return plan_module.DashboardPlan(config)
+
+
+def build_pages(plan, snapshot, states):
+    webhook_data = snapshot.build(states, FORECASTS, ICON_STORE)
+    return webhook_data, [target.filter(webhook_data) for target in plan.targets]
+
+
+FORMATS = [
+    {"payload_format": "standard"},
+    {"payload_format": "compact"},
+    {"payload_format": "standard", "precompute_display": True},
+    {"payload_format": "compact", "precompute_display": True},
+]
+
+
+@pytest.mark.parametrize("options", FORMATS)
+def test_every_group_lands_on_one_page_in_order(options):
+    states = make_states(400)
+    plan = make_plan(states, **options)
+    webhook_data, pages = build_pages(plan, plan_module.MaterializedSnapshot(plan), states)
+    assert [group["groupName"] for page in pages for group in page["groups"]] == [
+        group["groupName"] for group in webhook_data["groups"]
+    ]
+    assert sum(1 for page in pages if page["groups"]) > 1
+    for number, page in enumerate(pages):
+        assert page["pills"] is webhook_data["pills"]
+        assert page["configuration"]["page"] == f"{number + 1}/{PAGES}"
+        assert page["visualizations"] == (webhook_data["visualizations"] if number == 0 else [])
+
+
+@pytest.mark.parametrize("options", FORMATS)
+def test_pages_stay_within_the_payload_limit(options):
+    states = make_states(400)
+    plan = make_plan(states, **options)
+    webhook_data, pages = build_pages(plan, plan_module.MaterializedSnapshot(plan), states)
+    shards = plan.shards
+    for number, page in enumerate(pages):
+        size = len(payload_module.encode_payload(page, plan.payload_format))
+        assert size <= LIMIT
+        # Packing estimates a page as the sum of its groups encoded alone: an upper bound
+        # of the standard encoding within a byte per group and icon. The compact format
+        # interns strings across the page, so it is left to the SHARD_FILL margin.
+        if plan.payload_format == "standard":
+            estimate = shards._estimate(number, shards.assignment[number], webhook_data["groups"], webhook_data.get("icons"))
+            assert size <= estimate <= size + len(page["groups"]) + len(page.get("icons") or ()) + 1
+
+
+def test_unchanged_pages_are_handed_out_again():
+    states = make_states(400)
+    plan = make_plan(states, visualizations=False)
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    _webhook_data, first = build_pages(plan, snapshot, states)
+    # A member of a group on the third page changes
+    number = plan.shards.assignment[2][0]
+    slot = next(slot for slot in plan.groups[number][1] if slot not in plan.pill_slots)
+    entity_id = plan.entity_ids[slot]
+    states[entity_id] = FakeState(entity_id, "unavailable", states[entity_id].attributes)
+    snapshot.mark_dirty(entity_id)
+    _webhook_data, second = build_pages(plan, snapshot, states)
+    for page, (new, old) in enumerate(zip(second, first)):
+        assert (new is old) == (page != 2)
+
+
+def test_first_page_reuses_its_groups_next_to_the_visualizations():
+    states = make_states(400)
+    plan = make_plan(states)
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    _webhook_data, first = build_pages(plan, snapshot, states)
+    _webhook_data, second = build_pages(plan, snapshot, states)
+    assert second[0]["groups"] is first[0]["groups"]
+    assert all(new is old for new, old in zip(second[1:], first[1:]))
+
+
+def test_pages_are_packed_again_when_one_outgrows_the_limit():
+    states = make_states(400)
+    plan = make_plan(states, visualizations=False)
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    webhook_data, _pages = build_pages(plan, snapshot, states)
+    shards = plan.shards
+    assignment = shards.assignment
+    # Small changes keep every group on its page
+    number = assignment[0][0]
+    slot = plan.groups[number][1][0]
+    entity_id = plan.entity_ids[slot]
+    states[entity_id] = FakeState(entity_id, "1", states[entity_id].attributes)
+    snapshot.mark_dirty(entity_id)
+    build_pages(plan, snapshot, states)
+    assert shards.assignment is assignment
+
+    # A group on a shared page grows past what the page has left
+    page = next(page for page, numbers in enumerate(assignment) if len(numbers) > 1)
+    number = assignment[page][0]
+    grown = dict(webhook_data["groups"][number])
+    grown["entities"] = grown["entities"] * 4
+    groups = list(webhook_data["groups"])
+    groups[number] = grown
+    webhook_data = {**webhook_data, "groups": groups}
+    pages = [target.filter(webhook_data) for target in plan.targets]
+    assert shards.assignment != assignment
+    assert [group["groupName"] for page in pages for group in page["groups"]] == [group["groupName"] for group in groups]
+    for page in pages:
+        assert len(payload_module.encode_payload(page, plan.payload_format)) <= LIMIT
@@ -0,0 +1,150 @@
+"""Change thresholds and the snapshot's change filter."""
+from fakes import FakeState, FakeStates, load_integration_module
+
+significance = load_integration_module("significance")
+plan_module = load_integration_module("plan")
+
+POWER = {"friendly_name": "Power", "unit_of_measurement": "W", "device_class": "power"}
+
+
+def test_parse_change_rules():
+    entity_rules, class_rules = significance.parse_change_rules(
+        "sensor.power_* | 5, 10%\n"
+        "device_class: temperature | precision 1\n"
+        "device_class: temperature | 2\n"
+        "sensor.broken | fast\n"
+        "sensor.no_terms |\n"
+        "\n"
+        "sensor.rounded | precision -1, 0.5"
+    )
+    assert [pattern for pattern, _rule in entity_rules] == ["sensor.power_*", "sensor.rounded"]
+    power = entity_rules[0][1]
+    assert (power.absolute, power.percent, power.precision) == (5.0, 10.0, None)
+    rounded = entity_rules[1][1]
+    assert (rounded.absolute, rounded.percent, rounded.precision) == (0.5, None, -1)
+    # The first line for a device class wins
+    assert list(class_rules) == ["temperature"]
+    assert class_rules["temperature"].precision == 1
+    assert class_rules["temperature"].absolute is None
+
+
+def test_round_state():
+    assert significance.round_state("21.46", 1) == "21.5"
+    assert significance.round_state("21.46", 0) == "21"
+    assert significance.round_state("1234", -2) == "1200"
+    assert significance.round_state("on", 1) == "on"
+    assert significance.round_state("", 1) == ""
+    assert significance.round_state(None, 1) is None
+
+
+def test_deadband():
+    rule = significance.parse_rule("0.5, 10%")
+    assert rule.within_deadband(10, 10.4)
+    # 10% of 20 is wider than the absolute deadband
+    assert rule.within_deadband(20, 21.9)
+    assert not rule.within_deadband(20, 22)
+    assert not significance.parse_rule("precision 0").within_deadband(1, 1.1)
+
+
+def test_rules_resolved_by_entity_then_device_class():
+    change_filter = significance.ChangeFilter.from_config({
+        "change_thresholds": "sensor.power_main | 50\ndevice_class: power | 5",
+    })
+    assert change_filter.rule("sensor.power_main", POWER).absolute == 50
+    assert change_filter.rule("sensor.power_other", POWER).absolute == 5
+    assert change_filter.rule("sensor.temperature", {"device_class": "temperature"}) is None
+    assert significance.ChangeFilter.from_config({}) is None
+
+
+def make_snapshot(config, states):
+    plan = plan_module.DashboardPlan({"groups": [{"groupName": "Power", "entities": [{"entity_id": "sensor.power"}]}], **config})
+    snapshot = plan_module.MaterializedSnapshot(plan, plan_module.RecordCache())
+    snapshot.build(states)
+    return snapshot
+
+
+def shown_state(snapshot, states):
+    return snapshot.build(states)["groups"][0]["entities"][0]["state"]
+
+
+def set_state(states, state, attributes=POWER):
+    states["sensor.power"] = FakeState("sensor.power", state, attributes)
+    return states["sensor.power"]
+
+
+def test_absolute_deadband_compares_against_the_value_shown():
+    states = FakeStates()
+    set_state(states, "100")
+    snapshot = make_snapshot({"change_thresholds": "sensor.power | 5"}, states)
+    # Each step stays inside the deadband of the previous state, but the drift adds up
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "103"))
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "104.9"))
+    assert shown_state(snapshot, states) == "100"
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "105.5"))
+    assert shown_state(snapshot, states) == "105.5"
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "101"))
+
+
+def test_percent_deadband():
+    states = FakeStates()
+    set_state(states, "1000")
+    snapshot = make_snapshot({"change_thresholds": "device_class: power | 2%"}, states)
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "1019"))
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "979"))
+    assert shown_state(snapshot, states) == "979"
+
+
+def test_deadband_lets_non_numeric_and_attribute_changes_through():
+    states = FakeStates()
+    set_state(states, "100")
+    snapshot = make_snapshot({"change_thresholds": "sensor.power | 5"}, states)
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "unavailable"))
+    snapshot.build(states)
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "100"))
+    snapshot.build(states)
+    # A new name shows even though the value stayed inside the deadband
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "101", {**POWER, "friendly_name": "Grid power"}))
+    snapshot.build(states)
+    # An attribute the dashboard does not show does not
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "102", {**POWER, "friendly_name": "Grid power", "last_reset": "x"}))
+
+
+def test_precision_rounds_records_and_filters_hidden_digits():
+    states = FakeStates()
+    set_state(states, "21.46")
+    snapshot = make_snapshot({"change_thresholds": "sensor.power | precision 1"}, states)
+    assert shown_state(snapshot, states) == "21.5"
+    assert not snapshot.mark_dirty("sensor.power", set_state(states, "21.54"))
+    assert snapshot.mark_dirty("sensor.power", set_state(states, "21.56"))
+    assert shown_state(snapshot, states) == "21.6"
+
+
+def test_visible_changes_only():
+    states = FakeStates()
+    attributes = {"friendly_name": "Door", "device_class": "door"}
+    states["binary_sensor.door"] = FakeState("binary_sensor.door", "off", attributes)
+    plan = plan_module.DashboardPlan({
+        "groups": [{"groupName": "Doors", "entities": [{"entity_id": "binary_sensor.door"}]}],
+        "visible_changes_only": True,
+    })
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    snapshot.build(states)
+    # Same state and shown attributes: nothing the dashboard draws changed
+    states["binary_sensor.door"] = FakeState("binary_sensor.door", "off", {**attributes, "restored": False})
+    assert not snapshot.mark_dirty("binary_sensor.door", states["binary_sensor.door"])
+    states["binary_sensor.door"] = FakeState("binary_sensor.door", "on", attributes)
+    assert snapshot.mark_dirty("binary_sensor.door", states["binary_sensor.door"])
+
+
+def test_unfiltered_entities_always_mark_dirty():
+    states = FakeStates()
+    set_state(states, "100")
+    states["sensor.other"] = FakeState("sensor.other", "1", {})
+    plan = plan_module.DashboardPlan({
+        "groups": [{"groupName": "Power", "entities": [{"entity_id": "sensor.power"}, {"entity_id": "sensor.other"}]}],
+        "change_thresholds": "sensor.power | 5",
+    })
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    snapshot.build(states)
+    states["sensor.other"] = FakeState("sensor.other", "1", {})
+    assert snapshot.mark_dirty("sensor.other", states["sensor.other"])
@@ -0,0 +1,87 @@
+"""MaterializedSnapshot updates against cold rebuilds."""
+import random
+
+import pytest
+
+from fakes import FakeState, churn, load_integration_module, make_dashboard_config, make_forecast, make_states
+
+plan_module = load_integration_module("plan")
+icons_module = load_integration_module("icons")
+
+ICON_STORE = icons_module.IconStore(icons_module.load_icon_store())
+FORECASTS = {"weather.home": make_forecast()}
+
+
+def make_plan(states, **options):
+    config = make_dashboard_config(states, 120, group_size=15, pill_count=8, **options)
+    # One group per aggregate mode next to the plain ones, sharing members with them
+    config["groups"][1]["mode"] = "count"
+    config["groups"][2]["mode"] = "stats"
+    config["groups"][3].update(mode="recent", top_n=3)
+    config["groups"].append({"groupName": "Shared", "entities": config["groups"][0]["entities"][:5]})
+    return plan_module.DashboardPlan(config)
+
+
+def change_icons(states, entity_ids, rng):
+    # Attribute changes that move entities to another icon, or back to their default
+    changed = rng.sample(entity_ids, 3)
+    for entity_id in changed:
+        old = states[entity_id]
+        attributes = dict(old.attributes)
+        if "icon" in attributes:
+            del attributes["icon"]
+        else:
+            attributes["icon"] = rng.choice(("mdi:rocket-launch", "mdi:flash", "mdi:sofa"))
+        states[entity_id] = FakeState(entity_id, old.state, attributes)
+    return changed
+
+
+@pytest.mark.parametrize("options", [{}, {"precompute_display": True}, {"show_entity_icon": "false"}])
+@pytest.mark.parametrize("with_cache", [False, True])
+def test_incremental_build_matches_cold_build(options, with_cache):
+    states = make_states(400)
+    plan = make_plan(states, **options)
+    record_cache = plan_module.RecordCache() if with_cache else None
+    snapshot = plan_module.MaterializedSnapshot(plan, record_cache)
+    snapshot.build(states, FORECASTS, ICON_STORE)
+    rng = random.Random(16)
+    removed = {}
+    for tick in range(40):
+        # An entity removed from the state machine falls back to its config until it is back
+        changed = list(removed)
+        states.update(removed)
+        removed.clear()
+        changed += churn(states, plan.tracked_entities, 0.05, rng)
+        if tick % 3 == 0:
+            changed += change_icons(states, plan.tracked_entities, rng)
+        if tick % 7 == 0:
+            entity_id = rng.choice(plan.tracked_entities)
+            removed[entity_id] = states.pop(entity_id)
+            changed.append(entity_id)
+        for entity_id in changed:
+            snapshot.mark_dirty(entity_id, states.get(entity_id))
+        before = snapshot.build(states, FORECASTS, ICON_STORE) if tick % 5 == 0 else None
+        incremental = snapshot.build(states, FORECASTS, ICON_STORE)
+        assert incremental == plan.build(states, FORECASTS, None, ICON_STORE)
+        if before is not None:
+            # Nothing changed between the two builds, so nothing was rebuilt
+            assert all(new is old for new, old in zip(incremental["groups"], before["groups"]))
+            assert incremental["pills"] is before["pills"]
+
+
+def test_unchanged_groups_and_pills_are_reused():
+    states = make_states(400)
+    plan = make_plan(states)
+    snapshot = plan_module.MaterializedSnapshot(plan)
+    first = snapshot.build(states, FORECASTS, ICON_STORE)
+    # A member of the sixth group only: its groups get new lists, every other one is reused
+    slot = next(slot for slot in plan.groups[5][1] if slot not in plan.pill_slots and plan.slot_groups[slot] == {5})
+    entity_id = plan.entity_ids[slot]
+    old = states[entity_id]
+    states[entity_id] = FakeState(entity_id, "unavailable", old.attributes)
+    assert snapshot.mark_dirty(entity_id, states[entity_id])
+    second = snapshot.build(states, FORECASTS, ICON_STORE)
+    for number, (new, previous) in enumerate(zip(second["groups"], first["groups"])):
+        assert (new is previous) == (number != 5)
+    assert second["pills"] is first["pills"]
+    assert second == plan.build(states, FORECASTS, None, ICON_STORE)
@@ -0,0 +1,189 @@
+"""WebhookDelivery against a local aiohttp stub of the TRMNL webhook."""
+import asyncio
+import time
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from fakes import FakeHass, FakeStates, load_integration_module
+
+webhook = load_integration_module("webhook")
+
+
+class StubWebhook:
+    # Answers each request with the next (status, headers) of responses, then with 200.
+    # Requests wait for `release` while it is set, to hold one in flight.
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.requests = []  # (monotonic time, decoded body)
+        self.received = asyncio.Event()
+        self.release = None
+
+    async def handle(self, request):
+        self.requests.append((time.monotonic(), await request.json()))
+        self.received.set()
+        if self.release is not None:
+            await self.release.wait()
+        status, headers = self.responses.pop(0) if self.responses else (200, {})
+        return web.json_response({"message": "stub"}, status=status, headers=headers)
+
+    async def wait_for(self, count, timeout=5):
+        async with asyncio.timeout(timeout):
+            while len(self.requests) < count:
+                self.received.clear()
+                await self.received.wait()
+
+    def gaps(self):
+        times = [at for at, _body in self.requests]
+        return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+def payload(number):
+    return {"groups": [], "pills": [], "visualizations": [], "configuration": {"number": number}}
+
+
+def run(stub, scenario):
+    # Runs scenario(delivery, stub) with a delivery pointed at the stub
+    async def main():
+        app = web.Application()
+        app.router.add_post("/webhook", stub.handle)
+        async with TestServer(app) as server, ClientSession() as session:
+            delivery = webhook.WebhookDelivery(FakeHass(FakeStates()), session, str(server.make_url("/webhook")), max_payload_bytes=0)
+            try:
+                await scenario(delivery, stub)
+            finally:
+                delivery.async_shutdown()
+
+    asyncio.run(main())
+
+
+async def settle(delivery):
+    # Waits until nothing is queued or in flight
+    while delivery._pending is not None or delivery._inflight is not None:
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def allow_localhost():
+    # pytest-homeassistant-custom-component blocks sockets through pytest-socket; the stub
+    # server only listens on localhost
+    try:
+        import pytest_socket
+    except ImportError:
+        return
+    pytest_socket.enable_socket()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # Millisecond backoff, and the longest delay of the jitter range so delays are exact
+    monkeypatch.setattr(webhook, "BASE_BACKOFF", 0.05)
+    monkeypatch.setattr(webhook, "MAX_BACKOFF", 10)
+    monkeypatch.setattr(webhook.random, "uniform", lambda low, high: high)
+
+
+def test_retries_with_exponential_backoff():
+    async def scenario(delivery, stub):
+        assert delivery.async_submit(payload(1))
+        await stub.wait_for(4)
+        await settle(delivery)
+        assert delivery.sent == 1
+        assert delivery.failed == 3
+        assert delivery.failures == 0
+
+    stub = StubWebhook([(500, {}), (503, {}), (502, {})])
+    run(stub, scenario)
+    gaps = stub.gaps()
+    # 0.05 s, then doubled per consecutive failure
+    for gap, expected in zip(gaps, (0.05, 0.1, 0.2)):
+        assert gap >= expected * 0.9
+    assert gaps[0] < gaps[1] < gaps[2]
+
+
+def test_honors_retry_after_on_429():
+    async def scenario(delivery, stub):
+        delivery.async_submit(payload(1))
+        await stub.wait_for(2)
+        await settle(delivery)
+        assert delivery.sent == 1
+
+    stub = StubWebhook([(429, {"Retry-After": "0.5"})])
+    run(stub, scenario)
+    # Retry-After outweighs the 0.05 s backoff
+    assert stub.gaps()[0] >= 0.45
+
+
+def test_coalesces_payloads_behind_the_request_in_flight():
+    async def scenario(delivery, stub):
+        stub.release = asyncio.Event()
+        delivery.async_submit(payload(1))
+        await stub.wait_for(1)
+        # Only the latest of the payloads queued meanwhile is sent
+        for number in (2, 3, 4):
+            assert delivery.async_submit(payload(number))
+        stub.release.set()
+        await stub.wait_for(2)
+        await settle(delivery)
+        await asyncio.sleep(0.05)
+        assert delivery.sent == 2
+
+    stub = StubWebhook()
+    run(stub, scenario)
+    assert [body["merge_variables"]["configuration"]["number"] for _at, body in stub.requests] == [1, 4]
+
+
+def test_skips_a_payload_already_delivered():
+    async def scenario(delivery, stub):
+        delivery.async_submit(payload(1))
+        await stub.wait_for(1)
+        await settle(delivery)
+        assert not delivery.async_submit(payload(1))
+        assert delivery.skipped == 1
+
+    stub = StubWebhook()
+    run(stub, scenario)
+    assert len(stub.requests) == 1
+
+
+@pytest.mark.parametrize("status", [400, 404, 413])
+def test_does_not_retry_client_errors(status):
+    async def scenario(delivery, stub):
+        delivery.async_submit(payload(1))
+        await stub.wait_for(1)
+        await settle(delivery)
+        await asyncio.sleep(0.3)
+        assert delivery.failed == 1
+        assert delivery.sent == 0
+        assert not delivery.circuit_open
+
+    stub = StubWebhook([(status, {})])
+    run(stub, scenario)
+    assert len(stub.requests) == 1
+
+
+def test_circuit_breaker_opens_and_closes(monkeypatch):
+    monkeypatch.setattr(webhook, "CIRCUIT_THRESHOLD", 3)
+    monkeypatch.setattr(webhook, "CIRCUIT_COOLDOWN", 0.5)
+
+    async def scenario(delivery, stub):
+        delivery.async_submit(payload(1))
+        await stub.wait_for(3)
+        await asyncio.sleep(0.05)
+        assert delivery.circuit_open
+        assert delivery.failures == 3
+        # Nothing is sent while the circuit is open, even for a newer payload
+        delivery.async_submit(payload(2))
+        await asyncio.sleep(0.2)
+        assert len(stub.requests) == 3
+        await stub.wait_for(4)
+        await settle(delivery)
+        assert not delivery.circuit_open
+        assert delivery.failures == 0
+        assert delivery.sent == 1
+
+    stub = StubWebhook([(500, {}), (500, {}), (500, {})])
+    run(stub, scenario)
+    assert stub.gaps()[2] >= 0.45
+    assert stub.requests[3][1]["merge_variables"]["configuration"]["number"] == 2